@@ -0,0 +1,216 @@
+"""Benchmark de detección extremo a extremo sobre una carrera sintética.
+
+Genera coches con tags tag16h5 dando vueltas (con motion blur, rotación,
+escala y ruido configurables), los pasa por el pipeline de `RaceSystem` y
+compara las vueltas detectadas con la verdad de la escena. Ejemplos:
+
+    python benchmark.py
+    python benchmark.py --cars 6 --lap-time 1.5 --exposure 0.004 --rotate --noise 6
+    python benchmark.py --quad-decimate 2 --clahe 0 --json resultado.json
+
+Informa de FPS procesados, latencia por frame (p50/p95/p99), cruces
+perdidos, cruces falsos y error del tiempo de vuelta frente a la verdad.
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+import config
+from src.detector import RaceSystem
+from src.frame_source import SyntheticSource
+from src.synthetic import SyntheticScene
+
+
+def _parse_pair(value):
+    lo, _, hi = value.partition(',')
+    return (float(lo), float(hi or lo))
+
+
+def _percentiles(values, qs=(50, 95, 99)):
+    if not values:
+        return {f'p{q}': None for q in qs}
+    arr = np.asarray(values, dtype=np.float64)
+    out = {f'p{q}': float(np.percentile(arr, q)) for q in qs}
+    out['max'] = float(arr.max())
+    out['mean'] = float(arr.mean())
+    return out
+
+
+def _match(truth, detected, tolerance):
+    """Emparejar cruces detectados con los reales (el más cercano dentro de `tolerance`).
+
+    Devuelve (pares, reales_sin_pareja, detectados_sin_pareja).
+    """
+    pairs = []
+    free = sorted(detected)
+    missed = []
+    for t in truth:
+        best = None
+        for i, d in enumerate(free):
+            if abs(d - t) <= tolerance and (best is None or abs(d - t) < abs(free[best] - t)):
+                best = i
+        if best is None:
+            missed.append(t)
+        else:
+            pairs.append((t, free.pop(best)))
+    return pairs, missed, free
+
+
+def run_benchmark(args):
+    finish_line = args.finish_line or config.FINISH_LINE
+    scene = SyntheticScene(
+        shape=(args.height, args.width), finish_line=finish_line, cars=args.cars,
+        tag_size=args.tag_size, lap_time=args.lap_time, lap_spread=args.lap_spread,
+        seed=args.seed, rotate=args.rotate, tag_scale=args.scale,
+        exposure=args.exposure, noise=args.noise,
+    )
+    source = SyntheticSource(scene, fps=args.fps, duration=args.duration, speed=args.speed)
+
+    if args.workers is not None:
+        config.DETECTOR_WORKERS = args.workers
+    rs = RaceSystem(finish_line=finish_line, resolution=(args.width, args.height))
+    cfg = {'tracker_enabled': args.tracker, 'roi_mode': args.roi}
+    if args.quad_decimate is not None:
+        cfg['quad_decimate'] = args.quad_decimate
+    if args.quad_sigma is not None:
+        cfg['quad_sigma'] = args.quad_sigma
+    if args.clahe is not None:
+        cfg['clahe_clip_limit'] = args.clahe
+    rs.update_detector_config(cfg)
+    # Debounce por debajo de la vuelta más rápida de la escena
+    rs.min_lap_time = 0.5 * min(car['lap_time'] for car in scene.cars)
+
+    laps = []          # (tag_id, instante de fin, duración)
+    latencies = []
+
+    def on_lap(tag_id, lap_duration):
+        laps.append((tag_id, float(rs.tag_state.lap_timers[tag_id]), lap_duration))
+
+    def on_frame(capture_time, tags, latency):
+        if latency is not None:
+            latencies.append(latency)
+
+    rs.on_lap_callback = on_lap
+    rs.on_frame_callback = on_frame
+    rs.enabled = True
+    rs.set_frame_source(source)
+
+    t0 = time.perf_counter()
+    if not rs.start():
+        sys.exit("No se pudo arrancar el detector")
+    rs.wait_finished()
+    elapsed = time.perf_counter() - t0
+    # Último cruce de cada tag (incluye salidas sin vueltas completas)
+    last_crossings = {tag_id: float(ts) for tag_id, ts in enumerate(rs.tag_state.lap_timers)}
+    rs.stop()
+
+    # Cruces detectados en tiempo de escena: fin de cada vuelta y su inicio
+    detected = {}
+    for tag_id, end, duration in laps:
+        detected.setdefault(tag_id, set()).update((round(end, 9), round(end - duration, 9)))
+    for tag_id, ts in last_crossings.items():
+        if ts:
+            detected.setdefault(tag_id, set()).add(round(ts, 9))
+
+    # Los cruces pegados al principio o al final de la grabación no son medibles
+    margin = 2.0 / args.fps
+    t_end = (source.count - 1) / args.fps
+    missed = false = total = 0
+    crossing_err = []
+    lap_err = []
+    for car in scene.cars:
+        tag_id = car['tag_id']
+        truth = [t for t in scene.crossing_times(car, t_end) if margin <= t <= t_end - margin]
+        det = [source.source_time(ts) for ts in detected.get(tag_id, ())]
+        det = [t for t in det if margin <= t <= t_end - margin]
+        pairs, car_missed, car_false = _match(truth, det, args.match_tolerance)
+        total += len(truth)
+        missed += len(car_missed)
+        false += len(car_false)
+        crossing_err.extend(abs(d - t) for t, d in pairs)
+        for tid, end, duration in laps:
+            if tid != tag_id:
+                continue
+            end_s = source.source_time(end)
+            start_s = end_s - duration
+            gt_end = next((t for t, d in pairs if abs(d - end_s) < 1e-6), None)
+            gt_start = next((t for t, d in pairs if abs(d - start_s) < 1e-6), None)
+            if gt_end is not None and gt_start is not None:
+                lap_err.append(abs(duration - (gt_end - gt_start)))
+    # Detecciones de tags que no existen en la escena
+    scene_tags = {car['tag_id'] for car in scene.cars}
+    for tag_id, ts in detected.items():
+        if tag_id not in scene_tags:
+            false += sum(1 for t in ts if margin <= source.source_time(t) <= t_end - margin)
+
+    frames = rs.frames_processed
+    ms = lambda d: {k: (v * 1000.0 if v is not None else None) for k, v in d.items()}
+    return {
+        'frames': frames,
+        'elapsed_s': elapsed,
+        'fps': frames / max(elapsed, 1e-9),
+        'latency_ms': ms(_percentiles(latencies)),
+        'crossings': total,
+        'missed_crossings': missed,
+        'false_crossings': false,
+        'crossing_error_ms': ms(_percentiles(crossing_err, qs=(50, 95))),
+        'lap_error_ms': ms(_percentiles(lap_err, qs=(50, 95))),
+        'laps_compared': len(lap_err),
+        'detector': rs.get_detector_config(),
+    }
+
+
+def _fmt(d, keys):
+    return ' '.join(f"{k}={d[k]:.2f}" if d.get(k) is not None else f"{k}=-" for k in keys)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    scene = parser.add_argument_group('escena')
+    scene.add_argument('--duration', type=float, default=10.0, help='segundos de carrera')
+    scene.add_argument('--fps', type=float, default=120.0, help='FPS de la cámara simulada')
+    scene.add_argument('--width', type=int, default=640)
+    scene.add_argument('--height', type=int, default=480)
+    scene.add_argument('--cars', type=int, default=3)
+    scene.add_argument('--lap-time', type=float, default=3.0, help='segundos por vuelta (velocidad)')
+    scene.add_argument('--lap-spread', type=float, default=0.5, help='dispersión relativa del tiempo de vuelta')
+    scene.add_argument('--tag-size', type=int, default=48, help='lado del tag en píxeles')
+    scene.add_argument('--scale', type=_parse_pair, default=(1.0, 1.0), help='escala por coche MIN,MAX')
+    scene.add_argument('--rotate', action='store_true', help='girar los tags con el rumbo')
+    scene.add_argument('--exposure', type=float, default=0.0, help='exposición en segundos (motion blur)')
+    scene.add_argument('--noise', type=float, default=0.0, help='sigma del ruido gaussiano')
+    scene.add_argument('--seed', type=int, default=0)
+    scene.add_argument('--finish-line', type=lambda v: tuple(zip(*[iter(int(x) for x in v.split(','))] * 2)),
+                       default=None, help='x1,y1,x2,y2 (por defecto FINISH_LINE de config)')
+    det = parser.add_argument_group('detector')
+    det.add_argument('--quad-decimate', type=float, default=None)
+    det.add_argument('--quad-sigma', type=float, default=None)
+    det.add_argument('--clahe', type=float, default=None, help='clipLimit de CLAHE (0 = desactivado)')
+    det.add_argument('--roi', default=getattr(config, 'DETECTION_ROI_MODE', 'full'), choices=('full', 'band'))
+    det.add_argument('--tracker', action='store_true', help='detección por ventanas (TagTracker)')
+    det.add_argument('--workers', type=int, default=None, help='procesos detectores (DETECTOR_WORKERS)')
+    parser.add_argument('--speed', type=float, default=0.0, help='0 = lo más rápido posible, 1 = tiempo real')
+    parser.add_argument('--match-tolerance', type=float, default=0.1, help='segundos para emparejar cruces')
+    parser.add_argument('--json', default=None, help='guardar el resultado en este fichero JSON')
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(args)
+
+    print(f"Frames: {result['frames']} en {result['elapsed_s']:.2f}s ({result['fps']:.1f} FPS)")
+    print(f"Latencia (ms): {_fmt(result['latency_ms'], ('p50', 'p95', 'p99', 'max'))}")
+    print(f"Cruces: {result['crossings']} reales, {result['missed_crossings']} perdidos, "
+          f"{result['false_crossings']} falsos")
+    print(f"Error de cruce (ms): {_fmt(result['crossing_error_ms'], ('p50', 'p95', 'max'))}")
+    print(f"Error de vuelta (ms): {_fmt(result['lap_error_ms'], ('p50', 'p95', 'max'))} "
+          f"({result['laps_compared']} vueltas)")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump(result, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
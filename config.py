@@ -6,6 +6,19 @@ BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///visionlap.db')
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Perfil de almacenamiento: 'default' o 'sqlite-performance'. Con SQLite en
+# fichero, 'sqlite-performance' activa WAL y synchronous=NORMAL en cada
+# conexión, de modo que las lecturas de la API no esperan a las escrituras de
+# vueltas, y comparte un pool de conexiones persistentes entre hilos.
+DB_PROFILE = os.environ.get('DB_PROFILE', 'sqlite-performance')
+# Milisegundos que una conexión espera un bloqueo antes de fallar
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+# Caché de páginas por conexión (KiB) y tamaño máximo mapeado en memoria (bytes)
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 65536))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 268435456))
+# Conexiones persistentes del pool (y otras tantas de desborde)
+SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 8))
+
 # Clave secreta para sesiones/CSRF
 SECRET_KEY = os.environ.get('SECRET_KEY', 'change-me-to-a-secure-value')
 
@@ -37,6 +50,38 @@ CAMERA_BRIGHTNESS = int(os.environ.get('CAMERA_BRIGHTNESS', -1))
 # Contraste de la imagen
 CAMERA_CONTRAST = int(os.environ.get('CAMERA_CONTRAST', -1))
 
+# Tamaño del ring buffer de frames entre el hilo de captura y el de detección.
+# Si la detección se retrasa más de este número de frames se descartan los más antiguos.
+FRAME_RING_SIZE = int(os.environ.get('FRAME_RING_SIZE', 8))
+
+# Procesos detectores en paralelo (0 = detectar en el hilo del detector).
+# Con >0 los frames en gris se pasan por memoria compartida a un pool de
+# procesos, cada uno con su propio Detector, y los resultados se reordenan
+# por número de secuencia antes de la lógica de cruces.
+DETECTOR_WORKERS = int(os.environ.get('DETECTOR_WORKERS', 0))
+# Hilos internos de pupil_apriltags por proceso detector
+DETECTOR_WORKER_THREADS = int(os.environ.get('DETECTOR_WORKER_THREADS', 1))
+
+# Detección por ventanas guiada por un modelo de velocidad constante por tag.
+# Solo se analizan ventanas alrededor de la posición predicha de cada coche y
+# la región completa cada TRACKER_FULL_SCAN_INTERVAL frames o al perder un tag.
+TRACKER_ENABLED = int(os.environ.get('TRACKER_ENABLED', 0))
+TRACKER_FULL_SCAN_INTERVAL = int(os.environ.get('TRACKER_FULL_SCAN_INTERVAL', 10))
+
+# Preview MJPEG (/video_feed). Solo se dibuja y codifica mientras haya visores,
+# como mucho PREVIEW_FPS veces por segundo y con la calidad JPEG indicada (1-100).
+PREVIEW_FPS = float(os.environ.get('PREVIEW_FPS', 30))
+PREVIEW_JPEG_QUALITY = int(os.environ.get('PREVIEW_JPEG_QUALITY', 80))
+# Perfiles del preview (`/video_feed?profile=nombre`): nombre:ancho:calidad:fps
+# separados por comas; ancho 0 = resolución completa (ese perfil toma
+# PREVIEW_FPS y PREVIEW_JPEG_QUALITY). Cada perfil solo se codifica con visores.
+PREVIEW_PROFILES = os.environ.get('PREVIEW_PROFILES', 'full:0:80:30,medium:320:70:15,thumb:160:60:5')
+# Overlay del preview (línea de meta, tags, IDs, FPS, cruces): 'server' lo
+# dibuja sobre el frame antes de codificarlo; 'client' envía el frame limpio y
+# los metadatos de detección por Socket.IO (evento `overlay`) para que el
+# navegador los dibuje en un canvas encima del vídeo.
+PREVIEW_OVERLAY = os.environ.get('PREVIEW_OVERLAY', 'server')
+
 # Línea de meta (x1,y1),(x2,y2)
 # Se define como una línea horizontal o vertical en la imagen de la cámara.
 # Los valores por defecto definen una línea horizontal en el centro de una imagen de 640x480.
@@ -46,6 +91,62 @@ FINISH_LINE_X2 = int(os.environ.get('FINISH_LINE_X2', 540))
 FINISH_LINE_Y2 = int(os.environ.get('FINISH_LINE_Y2', 240))
 FINISH_LINE = ((FINISH_LINE_X1, FINISH_LINE_Y1), (FINISH_LINE_X2, FINISH_LINE_Y2))
 
+# Región de detección de tags: 'full' (frame completo), 'band' (banda alrededor
+# de la línea de meta) o 'polygon' (polígono definido desde la API del detector).
+# Restringir la región permite bajar quad_decimate sin perder FPS.
+DETECTION_ROI_MODE = os.environ.get('DETECTION_ROI_MODE', 'full')
+# Ancho en píxeles de la banda a cada lado de la línea de meta (modo 'band')
+DETECTION_ROI_BAND = int(os.environ.get('DETECTION_ROI_BAND', 100))
+
+# Escritura diferida de vueltas: el detector solo encola y un hilo las guarda
+# en lotes de hasta LAP_WRITER_BATCH, como mucho LAP_WRITER_FLUSH_MS después
+# de la primera vuelta del lote.
+LAP_WRITER_BATCH = int(os.environ.get('LAP_WRITER_BATCH', 64))
+LAP_WRITER_FLUSH_MS = float(os.environ.get('LAP_WRITER_FLUSH_MS', 50))
+# Si guardar un lote falla (p. ej. BD bloqueada) se reintenta hasta
+# LAP_WRITER_RETRIES veces, esperando LAP_WRITER_RETRY_MS, luego el doble...
+LAP_WRITER_RETRIES = int(os.environ.get('LAP_WRITER_RETRIES', 3))
+LAP_WRITER_RETRY_MS = float(os.environ.get('LAP_WRITER_RETRY_MS', 100))
+
+# Diario de vueltas (binario, solo-añadir): cada vuelta se anota antes de
+# encolarse y, si el proceso cae antes de guardarla, se recupera al arrancar.
+# LAP_JOURNAL_FSYNC: 'always' (fsync por vuelta), 'batch' (un fsync por lote
+# antes de guardarlo y notificarlo) o 'none'. Ruta vacía = sin diario.
+LAP_JOURNAL_PATH = os.environ.get('LAP_JOURNAL_PATH', os.path.join(BASE_DIR, 'instance', 'laps.journal'))
+LAP_JOURNAL_FSYNC = os.environ.get('LAP_JOURNAL_FSYNC', 'batch')
+# Tamaño (KiB) a partir del cual se compacta quitando lo ya guardado
+LAP_JOURNAL_COMPACT_KB = int(os.environ.get('LAP_JOURNAL_COMPACT_KB', 64))
+
+# Photo-finish: buffer con los últimos frames en gris (memoria reservada una
+# vez, hasta PHOTO_FINISH_MB; 0 = desactivado). Por cada vuelta guardada se
+# compone en segundo plano una tira JPEG con hasta PHOTO_FINISH_MAX_FRAMES
+# frames entre PHOTO_FINISH_BEFORE_MS antes y PHOTO_FINISH_AFTER_MS después
+# del cruce, recortada a PHOTO_FINISH_MARGIN px alrededor de la meta (0 = frame completo).
+PHOTO_FINISH_MB = float(os.environ.get('PHOTO_FINISH_MB', 64))
+PHOTO_FINISH_BEFORE_MS = float(os.environ.get('PHOTO_FINISH_BEFORE_MS', 300))
+PHOTO_FINISH_AFTER_MS = float(os.environ.get('PHOTO_FINISH_AFTER_MS', 300))
+PHOTO_FINISH_MAX_FRAMES = int(os.environ.get('PHOTO_FINISH_MAX_FRAMES', 12))
+PHOTO_FINISH_MARGIN = int(os.environ.get('PHOTO_FINISH_MARGIN', 120))
+PHOTO_FINISH_DIR = os.environ.get('PHOTO_FINISH_DIR', os.path.join(BASE_DIR, 'instance', 'photo_finish'))
+
+# Grabación del stream crudo de la cámara (POST /api/recording/start) en
+# RECORD_DIR, con el timestamp de captura de cada frame en un sidecar
+# `frame,timestamp`. RECORD_FORMAT: 'bmp' (sin compresión, un fichero por
+# frame) o 'mjpg' (AVI Motion-JPEG). Los frames pendientes de escribir
+# ocupan como mucho RECORD_QUEUE_MB (memoria reservada una vez); si el disco
+# se queda atrás más que eso, los nuevos se descartan (y se cuentan).
+# RECORD_SESSIONS=1 graba automáticamente cada sesión desde que empieza.
+RECORD_DIR = os.environ.get('RECORD_DIR', os.path.join(BASE_DIR, 'instance', 'recordings'))
+RECORD_FORMAT = os.environ.get('RECORD_FORMAT', 'bmp')
+RECORD_QUEUE_MB = float(os.environ.get('RECORD_QUEUE_MB', 256))
+RECORD_SESSIONS = int(os.environ.get('RECORD_SESSIONS', 0))
+
+# Eventos en tiempo real (Socket.IO): se agrupan y envían una vez cada
+# BROADCAST_INTERVAL_MS por sala de sesión. SOCKETIO_SERIALIZER='msgpack'
+# usa serialización binaria (requiere el paquete msgpack en el servidor).
+BROADCAST_INTERVAL_MS = float(os.environ.get('BROADCAST_INTERVAL_MS', 50))
+SOCKETIO_SERIALIZER = os.environ.get('SOCKETIO_SERIALIZER', 'default')
+
 # Puerto local usado como candado para evitar que múltiples procesos
 # inicien la cámara simultáneamente. Si el bind falla, otro proceso
 # ya tiene la cámara abierta.
@@ -0,0 +1,181 @@
+"""Benchmark de almacenamiento: inserción sostenida de vueltas y lecturas concurrentes.
+
+Crea una base de datos SQLite temporal con el perfil indicado, mete vueltas
+por el mismo camino que el detector (`lap_writer.submit()` -> `persist_laps`)
+durante `--duration` segundos y, a la vez, uno o varios lectores piden
+`GET /api/drivers`. Ejemplos:
+
+    python db_benchmark.py
+    python db_benchmark.py --profile default
+    python db_benchmark.py --batch 1 --readers 4 --json resultado.json
+
+Informa de vueltas guardadas por segundo y de la latencia de lectura
+(p50/p95/p99) mientras entran vueltas.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from threading import Event, Thread
+
+import numpy as np
+
+
+def _percentiles(values, qs=(50, 95, 99)):
+    if not values:
+        return {f'p{q}': None for q in qs}
+    arr = np.asarray(values, dtype=np.float64)
+    out = {f'p{q}': float(np.percentile(arr, q)) for q in qs}
+    out['max'] = float(arr.max())
+    out['mean'] = float(arr.mean())
+    return out
+
+
+def run_benchmark(args):
+    workdir = tempfile.mkdtemp(prefix='visionlap-dbbench-')
+    # La app lee la configuración al importarse: fijar BD y perfil antes
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    os.environ['DB_PROFILE'] = args.profile
+    os.environ['LAP_WRITER_BATCH'] = str(args.batch)
+    os.environ['LAP_WRITER_FLUSH_MS'] = str(args.flush_ms)
+    os.environ['LAP_JOURNAL_PATH'] = os.path.join(workdir, 'laps.journal') if args.journal_fsync != 'off' else ''
+    os.environ['LAP_JOURNAL_FSYNC'] = args.journal_fsync if args.journal_fsync != 'off' else 'none'
+    from src import app as webapp
+
+    app, db = webapp.app, webapp.db
+    try:
+        with app.app_context():
+            db.create_all()
+            for i in range(args.drivers):
+                db.session.add(webapp.Driver(name=f'Piloto {i}', nickname=f'p{i}', tag_id=i))
+            db.session.commit()
+            journal = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+        webapp.startup()
+        client = app.test_client()
+        client.post('/api/session/start')
+
+        writer = webapp.lap_writer
+        metrics = webapp.vision_system.metrics
+        stop = Event()
+        latencies = []
+        read_errors = [0]
+
+        def reader():
+            c = app.test_client()
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                r = c.get(f'/api/drivers?per_page={args.per_page}')
+                latencies.append(time.perf_counter() - t0)
+                if r.status_code != 200:
+                    read_errors[0] += 1
+                if args.read_interval > 0:
+                    time.sleep(args.read_interval)
+
+        def persisted():
+            return metrics.to_dict()['counters'].get('laps_persisted', 0)
+
+        readers = [Thread(target=reader, daemon=True) for _ in range(args.readers)]
+        start_count = persisted()
+        t_start = time.perf_counter()
+        for t in readers:
+            t.start()
+
+        submitted = 0
+        deadline = t_start + args.duration
+        interval = 1.0 / args.rate if args.rate > 0 else 0.0
+        next_at = t_start
+        while time.perf_counter() < deadline:
+            if interval:
+                now = time.perf_counter()
+                if now < next_at:
+                    time.sleep(min(next_at - now, 0.001))
+                    continue
+                next_at += interval
+            elif writer.pending >= writer.max_batch * 4:
+                # Sin límite de ritmo: mantener la cola llena sin desbordarla
+                time.sleep(0.0005)
+                continue
+            writer.submit(submitted % args.drivers, 1.0 + (submitted % 7) * 0.01)
+            submitted += 1
+
+        # Esperar a que el escritor vacíe la cola
+        while writer.pending and time.perf_counter() < deadline + 10:
+            time.sleep(0.01)
+        time.sleep(args.flush_ms / 1000.0 + 0.05)
+        elapsed = time.perf_counter() - t_start
+        stop.set()
+        for t in readers:
+            t.join(timeout=2.0)
+
+        saved = persisted() - start_count
+        persist = metrics.stages['lap_persist']
+        with app.app_context():
+            rows = db.session.query(webapp.Lap).count()
+        return {
+            'profile': args.profile,
+            'journal_mode': journal,
+            'batch': args.batch,
+            'journal_fsync': args.journal_fsync,
+            'duration_s': elapsed,
+            'laps_submitted': submitted,
+            'laps_saved': saved,
+            'laps_in_db': rows,
+            'inserts_per_s': saved / elapsed if elapsed > 0 else None,
+            'persist_batches': persist.snapshot()[2],
+            'persist_batch_s': {'p50': persist.quantile(0.5), 'p95': persist.quantile(0.95),
+                                'p99': persist.quantile(0.99)},
+            'reads': len(latencies),
+            'read_errors': read_errors[0],
+            'read_latency_s': _percentiles(latencies),
+        }
+    finally:
+        try:
+            webapp.lap_writer.stop()
+            with app.app_context():
+                db.engine.dispose()
+        except Exception:
+            pass
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _print_report(r):
+    def ms(v):
+        return '-' if v is None else f"{v * 1000:.2f} ms"
+    print(f"Perfil: {r['profile']} (journal_mode={r['journal_mode']}, lote={r['batch']}, "
+          f"diario={r['journal_fsync']})")
+    print(f"Vueltas: {r['laps_saved']} guardadas / {r['laps_submitted']} enviadas en {r['duration_s']:.1f}s "
+          f"-> {r['inserts_per_s']:.0f} vueltas/s ({r['persist_batches']} lotes, "
+          f"p50 {ms(r['persist_batch_s']['p50'])}, p95 {ms(r['persist_batch_s']['p95'])})")
+    lat = r['read_latency_s']
+    print(f"GET /api/drivers: {r['reads']} lecturas, {r['read_errors']} errores, "
+          f"p50 {ms(lat['p50'])}, p95 {ms(lat['p95'])}, p99 {ms(lat['p99'])}, max {ms(lat.get('max'))}")
+
+
+def main():
+    p = argparse.ArgumentParser(description='Benchmark de inserción de vueltas y lectura de pilotos')
+    p.add_argument('--profile', default='sqlite-performance', choices=['default', 'sqlite-performance'])
+    p.add_argument('--duration', type=float, default=10.0, help='segundos insertando vueltas')
+    p.add_argument('--rate', type=float, default=0.0, help='vueltas/s a enviar (0 = sin límite)')
+    p.add_argument('--drivers', type=int, default=20, help='pilotos (tags 0..N-1, máx. 30)')
+    p.add_argument('--batch', type=int, default=64, help='LAP_WRITER_BATCH (1 = un commit por vuelta)')
+    p.add_argument('--flush-ms', type=float, default=50.0, help='LAP_WRITER_FLUSH_MS')
+    p.add_argument('--journal-fsync', default='batch', choices=['always', 'batch', 'none', 'off'],
+                   help='LAP_JOURNAL_FSYNC (off = sin diario de vueltas)')
+    p.add_argument('--readers', type=int, default=2, help='hilos pidiendo /api/drivers')
+    p.add_argument('--read-interval', type=float, default=0.0, help='pausa entre lecturas de cada hilo (s)')
+    p.add_argument('--per-page', type=int, default=10)
+    p.add_argument('--json', help='guardar el resultado en este fichero')
+    args = p.parse_args()
+    args.drivers = max(1, min(30, args.drivers))
+
+    result = run_benchmark(args)
+    _print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
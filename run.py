@@ -1,16 +1,24 @@
-from src.app import app, socketio, vision_system
-from src.models import db
 import os
 
 if __name__ == '__main__':
+    # Importar la app solo aquí: los procesos detectores (`spawn`) vuelven a
+    # ejecutar este script como `__mp_main__` y no deben arrancar la app
+    from src.app import app, socketio, startup
+    from src.models import db
+
     # Crear base de datos si no existe
     if not os.path.exists('visionlap.db'):
         with app.app_context():
             db.create_all()
             print('Base de datos creada.')
+    debug = True
+    # Registro, diario de vueltas e hilos de fondo: solo en el proceso que
+    # sirve (con el reloader de debug, el padre solo vigila los ficheros)
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        startup()
 
     # No iniciar el detector automáticamente aquí. Mantener debug=True
     # es útil durante el desarrollo, pero iniciar la cámara debe ocurrir
     # explícitamente (p. ej. pulsando el botón en la UI) para evitar que
     # procesos del reloader o del entorno lancen la cámara accidentalmente.
-    socketio.run(app, host='0.0.0.0', port=5000, debug=True)
+    socketio.run(app, host='0.0.0.0', port=5000, debug=debug)
@@ -1,10 +1,25 @@
-from flask import Flask, render_template, Response, request, jsonify
-from flask_socketio import SocketIO
-from src.models import db, Driver, Session, Lap
+from flask import Flask, render_template, Response, request, jsonify, stream_with_context, send_file
+from flask_socketio import SocketIO, join_room, leave_room, rooms, emit
+from src.models import db, Driver, Session, Lap, Track, DriverBest, SessionBest, TrackRecord, LapClip
 from src.detector import RaceSystem
 from src import camera_config_store as camcfg
+from src.lap_writer import LapWriter
+from src.lap_journal import LapJournal
+from src.race_registry import RaceRegistry
+from src.leaderboard import Leaderboard
+from src.best_laps import BestLaps, BEST_KINDS
+from src.broadcaster import Broadcaster, BATCH_EVENT
+from src.photo_finish import PhotoFinishWorker
+from src.recorder import SessionRecorder
+from src import lap_export
+from src.storage import init_db
 from flask_migrate import Migrate
+from sqlalchemy import func, update
+from datetime import datetime, timedelta
 import eventlet
+import importlib.util
+import atexit
+import time
 import os
 
 # Inicializar Flask y SocketIO
@@ -12,13 +27,19 @@ app = Flask(__name__)
 # Cargar configuración desde `config.py` o variables de entorno
 app.config.from_object('config')
 
-db.init_app(app)
+# Inicializar la BD con el perfil de almacenamiento configurado (DB_PROFILE)
+init_db(app, db)
 
 # Inicializar migraciones (Flask-Migrate)
-migrate = Migrate(app, db)
+migrate = Migrate(app, db, directory=os.path.join(app.config.get('BASE_DIR', os.getcwd()), 'migrations'))
 
 # Usar eventlet para concurrencia asíncrona compatible con WebSockets
-socketio = SocketIO(app, async_mode='eventlet', cors_allowed_origins='*')
+# Serialización de Socket.IO: 'default' (JSON) o 'msgpack' (binaria, requiere el paquete msgpack)
+socketio_serializer = app.config.get('SOCKETIO_SERIALIZER', 'default')
+if socketio_serializer == 'msgpack' and importlib.util.find_spec('msgpack') is None:
+    print("SOCKETIO_SERIALIZER=msgpack pero el paquete msgpack no está instalado; se usa JSON")
+    socketio_serializer = 'default'
+socketio = SocketIO(app, async_mode='eventlet', cors_allowed_origins='*', serializer=socketio_serializer)
 
 # Cargar o crear configuración persistente de cámara (desde .env -> config.py la primera vez)
 camcfg.load_or_create_from_module_config(app.config)
@@ -34,8 +55,208 @@ else:
 
 finish_line = camera_cfg.get('FINISH_LINE', app.config.get('FINISH_LINE', ((100, 240), (540, 240))))
 vision_system = RaceSystem(camera_idx=camera_idx, resolution=camera_resolution, finish_line=finish_line)
+# Cada cambio de configuración de cámara llega al detector solo con las llaves modificadas
+camcfg.subscribe(lambda changed, version: camcfg.apply_to_vision_system(vision_system, changed))
+
+# Pilotos por tag y sesión activa en memoria; el filtro de tags del detector se deriva de aquí
+registry = RaceRegistry(on_drivers_changed=vision_system.set_allowed_tags)
+# Clasificación de la sesión activa, actualizada en el servidor vuelta a vuelta
+leaderboard = Leaderboard()
+# Mejores vueltas (piloto, piloto en sesión, circuito) para no escanear `Lap`
+best_laps = BestLaps()
+
+# Eventos en tiempo real agrupados por tick y por sala de sesión
+broadcaster = Broadcaster(
+    socketio.emit,
+    interval=app.config.get('BROADCAST_INTERVAL_MS', 50) / 1000.0,
+    metrics=vision_system.metrics,
+    start_task=socketio.start_background_task,
+    sleep=socketio.sleep,
+)
+
+
+def session_room(session_id):
+    """Sala de Socket.IO con los clientes que siguen la sesión `session_id`."""
+    return f'session_{session_id}'
+
+def write_best_lap(kind, existed, driver_id, session_id, track_id, lap_number, lap_time, set_at):
+    """Actualizar la tabla materializada `kind` dentro de la transacción en curso."""
+    values = {'lap_time': lap_time, 'lap_number': lap_number, 'set_at': set_at}
+    if kind == 'personal_best':
+        model, key = DriverBest, {'driver_id': driver_id}
+        values['session_id'] = session_id
+    elif kind == 'session_best':
+        model, key = SessionBest, {'session_id': session_id, 'driver_id': driver_id}
+    else:
+        model, key = TrackRecord, {'track_id': track_id}
+        values.update(driver_id=driver_id, session_id=session_id)
+        db.session.execute(update(Track).where(Track.id == track_id).values(record_lap=lap_time))
+    if existed:
+        db.session.execute(update(model).filter_by(**key).values(**values))
+    else:
+        db.session.add(model(**key, **values))
+
+
+def persist_laps(batch):
+    """Guardar un lote de vueltas en una sola transacción y notificar al frontend."""
+    with app.app_context():
+        active_id = registry.active_session_id
+        # Contadores de sesiones ya cerradas (vueltas encoladas o recuperadas del diario)
+        closed_counts = {}
+        # Números asignados en este lote por sesión, por si su sesión se cierra a mitad
+        assigned = {}
+        updates = []
+        standings = []
+        # (vuelta, instante del cruce en el reloj de captura) para el photo-finish
+        clips = []
+        for event in batch:
+            # Buscar conductor
+            driver = registry.driver_for_tag(event.tag_id)
+            if not driver:
+                print(f"Tag desconocido: {event.tag_id}")
+                continue
+            session_id = event.session_id or active_id
+            if session_id is None:
+                continue
+            # Número de vuelta desde el contador en memoria (sin COUNT) si la
+            # sesión sigue activa; None si se cerró (también a mitad de lote)
+            lap_number = registry.next_lap_number(session_id, driver.id)
+            is_active = lap_number is not None
+            if not is_active:
+                if session_id not in closed_counts:
+                    counts = lap_counts_for_session(session_id)
+                    # Las vueltas de este lote aún no están en la BD
+                    for driver_id, n in assigned.get(session_id, {}).items():
+                        counts[driver_id] = max(counts.get(driver_id, 0), n)
+                    closed_counts[session_id] = counts
+                counts = closed_counts[session_id]
+                lap_number = counts[driver.id] = counts.get(driver.id, 0) + 1
+            assigned.setdefault(session_id, {})[driver.id] = lap_number
+            new_lap = Lap(
+                session_id=session_id,
+                driver_id=driver.id,
+                lap_number=lap_number,
+                lap_time=event.lap_time,
+                timestamp=event.crossed_at or datetime.utcnow()
+            )
+            db.session.add(new_lap)
+            if photo_finish_worker is not None and event.crossing is not None:
+                clips.append((new_lap, event.crossing))
+            improved = {}
+            if is_active:
+                standings.append((driver, event.lap_time))
+                # Mejores vueltas: comparación en memoria y escritura solo si mejora
+                improved = best_laps.improve(driver.id, event.lap_time)
+                for kind, existed in improved.items():
+                    write_best_lap(kind, existed, driver.id, session_id, best_laps.track_id,
+                                   lap_number, event.lap_time, new_lap.timestamp)
+            updates.append((session_id, {
+                'driver_id': driver.id,
+                'driver_name': driver.name,
+                'nickname': driver.nickname,
+                'lap_time': round(event.lap_time, 3),
+                'lap_number': lap_number,
+                'tag_id': event.tag_id,
+                'badges': [kind for kind in BEST_KINDS if kind in improved]
+            }))
+        if updates:
+            try:
+                if clips:
+                    # Los ids hacen falta tras el commit: tomarlos sin recargar las filas
+                    db.session.flush()
+                    clips = [(lap.id, crossing) for lap, crossing in clips]
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # Los números reservados no llegaron a la BD: reconstruir contadores
+                active_id = registry.active_session_id
+                registry.set_lap_counts(active_id, lap_counts_for_session(active_id))
+                load_best_laps(active_id, best_laps.track_id)
+                raise
+
+    for lap_id, crossing in clips:
+        photo_finish_worker.request(lap_id, crossing)
+    # Enviar eventos en tiempo real a la sala de cada sesión (tras confirmar la transacción)
+    for session_id, payload in updates:
+        broadcaster.publish('lap_update', payload, room=session_room(session_id))
+    # Solo las filas de la clasificación que cambiaron con este lote
+    delta = leaderboard.record_laps(standings)
+    if delta:
+        broadcaster.publish('leaderboard_delta', delta, room=session_room(active_id))
+    return len(updates)
+
+
+# Diario de vueltas: cada vuelta se anota antes de encolarse y se recupera al
+# arrancar si el proceso cayó antes de guardarla (se abre en `startup()`)
+lap_journal = None
+
+# Las vueltas se guardan en un hilo aparte: el detector solo encola
+lap_writer = LapWriter(
+    persist_laps,
+    max_batch=app.config.get('LAP_WRITER_BATCH', 64),
+    flush_interval=app.config.get('LAP_WRITER_FLUSH_MS', 50) / 1000.0,
+    retries=app.config.get('LAP_WRITER_RETRIES', 3),
+    retry_backoff=app.config.get('LAP_WRITER_RETRY_MS', 100) / 1000.0,
+    metrics=vision_system.metrics,
+)
+
+
+def open_lap_journal():
+    """Abrir el diario de vueltas (`LAP_JOURNAL_PATH`) y conectarlo al escritor."""
+    global lap_journal
+    if lap_journal is not None or not app.config.get('LAP_JOURNAL_PATH'):
+        return
+    try:
+        lap_journal = LapJournal(
+            app.config['LAP_JOURNAL_PATH'],
+            fsync=app.config.get('LAP_JOURNAL_FSYNC', 'batch'),
+            compact_bytes=app.config.get('LAP_JOURNAL_COMPACT_KB', 64) * 1024,
+        )
+        atexit.register(lap_journal.close)
+        vision_system.metrics.describe('laps_replayed', 'Vueltas recuperadas del diario al arrancar')
+        lap_writer.journal = lap_journal
+    except Exception as e:
+        print(f"No se pudo abrir el diario de vueltas: {e}")
+
 
-# Callback que se ejecuta cuando el detector ve una vuelta
+def save_lap_clip(lap_id, info):
+    """Enlazar con su vuelta la tira de photo-finish recién guardada (hilo del photo-finish)."""
+    with app.app_context():
+        try:
+            db.session.merge(LapClip(lap_id=lap_id, **info))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error guardando el photo-finish de la vuelta {lap_id}: {e}")
+
+
+# Photo-finish: tira de frames alrededor de cada cruce, generada en segundo plano
+photo_finish_worker = None
+if vision_system.photo_finish is not None:
+    photo_finish_worker = PhotoFinishWorker(
+        vision_system,
+        app.config.get('PHOTO_FINISH_DIR'),
+        on_clip=save_lap_clip,
+        before=app.config.get('PHOTO_FINISH_BEFORE_MS', 300) / 1000.0,
+        after=app.config.get('PHOTO_FINISH_AFTER_MS', 300) / 1000.0,
+        max_frames=app.config.get('PHOTO_FINISH_MAX_FRAMES', 12),
+        margin=app.config.get('PHOTO_FINISH_MARGIN', 120),
+        metrics=vision_system.metrics,
+    )
+
+# Grabación del stream crudo: el hilo de captura solo copia y encola
+recorder = SessionRecorder(
+    app.config.get('RECORD_DIR'),
+    fmt=app.config.get('RECORD_FORMAT', 'bmp'),
+    budget_bytes=app.config.get('RECORD_QUEUE_MB', 256) * 1024 * 1024,
+    fps=app.config.get('CAMERA_FPS', 30),
+    metrics=vision_system.metrics,
+)
+vision_system.recorder = recorder
+atexit.register(recorder.stop)
+
+
+# Callback que se ejecuta (en el hilo del detector) cuando se ve una vuelta
 def handle_new_lap(tag_id, lap_time):
     # Ignorar notificaciones si el detector está deshabilitado
     try:
@@ -44,59 +265,160 @@ def handle_new_lap(tag_id, lap_time):
     except Exception:
         pass
 
-    with app.app_context():
-        # Buscar conductor
-        driver = Driver.query.filter_by(tag_id=tag_id).first()
-        if not driver:
-            print(f"Tag desconocido: {tag_id}")
-            return
-
-        # Buscar sesión activa
-        active_session = Session.query.filter_by(is_active=True).first()
-        if active_session:
-            # Determinar número de vuelta
-            lap_count = Lap.query.filter_by(session_id=active_session.id, driver_id=driver.id).count()
-            new_lap = Lap(
-                session_id=active_session.id,
-                driver_id=driver.id,
-                lap_number=lap_count + 1,
-                lap_time=lap_time
-            )
-            db.session.add(new_lap)
-            db.session.commit()
-
-            # Enviar evento en tiempo real al frontend
-            socketio.emit('lap_update', {
-                'driver_name': driver.name,
-                'nickname': driver.nickname,
-                'lap_time': round(lap_time, 3),
-                'lap_number': lap_count + 1,
-                'tag_id': tag_id
-            })
+    # Instante real del cruce a partir del timestamp de captura. El monotónico
+    # viaja tal cual para el photo-finish; el UTC solo se usa para la BD
+    crossed_at = None
+    crossing = vision_system.last_crossing_time(tag_id) or None
+    if crossing:
+        crossed_at = datetime.utcnow() - timedelta(seconds=max(0.0, time.monotonic() - crossing))
+    lap_writer.submit(tag_id, lap_time, crossed_at, session_id=registry.active_session_id,
+                      crossing=crossing)
 
 # Conectar callback
 vision_system.on_lap_callback = handle_new_lap
+# Overlay en el navegador (PREVIEW_OVERLAY=client): solo el último de cada tick
+vision_system.on_overlay_callback = lambda meta: broadcaster.publish('overlay', meta, latest=True)
+
+
+def lap_counts_for_session(session_id):
+    """Último número de vuelta de cada piloto en la sesión (una sola consulta agrupada)."""
+    if session_id is None:
+        return {}
+    rows = (db.session.query(Lap.driver_id, func.max(Lap.lap_number))
+            .filter(Lap.session_id == session_id)
+            .group_by(Lap.driver_id)
+            .all())
+    return {driver_id: int(n or 0) for driver_id, n in rows}
 
 
-def refresh_allowed_tags():
-    """Leer los tags de la base de datos y actualizar el filtro del detector."""
+def load_registry():
+    """Cargar pilotos, sesión activa y contadores de vueltas desde la base de datos (al arrancar)."""
     try:
         with app.app_context():
-            tags = [d.tag_id for d in Driver.query.all() if d.tag_id is not None]
-            # Normalizar int
-            tags = [int(t) for t in tags]
-            vision_system.set_allowed_tags(tags)
+            active_session = Session.query.filter_by(is_active=True).order_by(Session.id.desc()).first()
+            session_id = active_session.id if active_session else None
+            drivers = Driver.query.all()
+            registry.load(drivers, session_id, lap_counts_for_session(session_id))
+            load_leaderboard(session_id, drivers)
+            load_best_laps(session_id, active_session.track_id if active_session else None)
     except Exception as e:
-        print(f"Error actualizando allowed_tags: {e}")
-
-# Inicializar allowed_tags con los pilotos actuales
-refresh_allowed_tags()
+        print(f"Error cargando pilotos y sesión activa: {e}")
+        # Sin tabla de pilotos no hay tags permitidos
+        vision_system.set_allowed_tags(registry.tag_ids())
+
+def load_best_laps(session_id, track_id):
+    """Cargar la caché de mejores vueltas desde las tablas materializadas (sin leer `Lap`)."""
+    personal = dict(db.session.query(DriverBest.driver_id, DriverBest.lap_time).all())
+    session = {}
+    if session_id is not None:
+        session = dict(db.session.query(SessionBest.driver_id, SessionBest.lap_time)
+                       .filter(SessionBest.session_id == session_id).all())
+    track = dict(db.session.query(TrackRecord.track_id, TrackRecord.lap_time).all())
+    best_laps.load(personal, session_id, track_id, session, track)
+
+
+def load_leaderboard(session_id, drivers):
+    """Reconstruir la clasificación de la sesión activa con sus vueltas guardadas."""
+    if session_id is None:
+        leaderboard.reset(None)
+        return
+    by_id = {d.id: d for d in drivers}
+    rows = (db.session.query(Lap.driver_id, Lap.lap_time)
+            .filter(Lap.session_id == session_id)
+            .order_by(Lap.driver_id, Lap.lap_number)
+            .all())
+    leaderboard.load(session_id, ((by_id[driver_id], lap_time)
+                                  for driver_id, lap_time in rows if driver_id in by_id))
+
+def replay_lap_journal():
+    """Volver a guardar las vueltas del diario que no llegaron a la BD (al arrancar).
+
+    Si el proceso cayó entre el commit y la confirmación en el diario, la vuelta
+    ya está en `lap`: se descarta comparando sesión, piloto, instante y tiempo.
+    """
+    if lap_journal is None:
+        return
+    pending = lap_journal.pending()
+    if not pending:
+        return
+    replay = []
+    try:
+        with app.app_context():
+            for event in pending:
+                driver = registry.driver_for_tag(event.tag_id)
+                if driver is not None and event.session_id is not None and event.crossed_at is not None:
+                    exists = (db.session.query(Lap.id)
+                              .filter(Lap.session_id == event.session_id, Lap.driver_id == driver.id,
+                                      Lap.timestamp == event.crossed_at, Lap.lap_time == event.lap_time)
+                              .first())
+                    if exists:
+                        continue
+                replay.append(event)
+    except Exception as e:
+        print(f"Error comprobando el diario de vueltas: {e}")
+        return
+    print(f"Diario de vueltas: {len(replay)} vueltas por guardar ({len(pending) - len(replay)} ya estaban en la BD)")
+    vision_system.metrics.inc('laps_replayed', len(replay))
+    # Las que ya estaban en la BD quedan confirmadas; las demás, cuando se guarden
+    replayed = {e.seq for e in replay}
+    lap_journal.ack([e.seq for e in pending if e.seq not in replayed])
+    # Guardado síncrono (el hilo del escritor aún no ha arrancado)
+    lap_writer.replay(replay)
+    lap_writer.flush()
+
+_started = False
+
+
+def startup():
+    """Arrancar la app en el proceso servidor: registro, diario de vueltas e hilos.
+
+    No se hace al importar `src.app` para que ningún otro proceso que lo
+    importe (scripts, procesos auxiliares) recupere vueltas del diario ni
+    arranque escritores propios. Lo llaman `run.py` y `wsgi.py`.
+    """
+    global _started
+    if _started:
+        return
+    _started = True
+    # Inicializar registro y allowed_tags con los pilotos actuales
+    load_registry()
+    open_lap_journal()
+    replay_lap_journal()
+    lap_writer.start()
+    atexit.register(lap_writer.stop)
+    broadcaster.start()
+    atexit.register(broadcaster.stop)
+    if photo_finish_worker is not None:
+        photo_finish_worker.start()
+        atexit.register(photo_finish_worker.stop)
 
 # Rutas Flask
 @app.route('/')
 def index():
     drivers = Driver.query.all()
-    return render_template('index.html', drivers=drivers)
+    return render_template('index.html', drivers=drivers, socketio_serializer=socketio_serializer)
+
+
+# Salas por sesión: al conectar se entra en la de la sesión activa
+@socketio.on('connect')
+def on_connect():
+    if registry.active_session_id is not None:
+        join_room(session_room(registry.active_session_id))
+
+
+@socketio.on('join_session')
+def on_join_session(data=None):
+    """Cambiar a la sala de otra sesión (por defecto la activa) y recibir su clasificación."""
+    session_id = (data or {}).get('session_id') or registry.active_session_id
+    for room in rooms():
+        if room.startswith('session_'):
+            leave_room(room)
+    if session_id is None:
+        return
+    join_room(session_room(session_id))
+    snapshot = leaderboard.snapshot()
+    if snapshot['session_id'] == session_id:
+        emit(BATCH_EVENT, [['leaderboard_snapshot', snapshot]])
 
 @app.route('/api/drivers', methods=['POST'])
 def add_driver():
@@ -105,11 +427,8 @@ def add_driver():
         new_driver = Driver(name=data['name'], nickname=data['nickname'], tag_id=data['tag_id'])
         db.session.add(new_driver)
         db.session.commit()
-        # Refrescar tags permitidos en el detector
-        try:
-            refresh_allowed_tags()
-        except Exception:
-            pass
+        # Actualizar registro (y tags permitidos en el detector)
+        registry.put_driver(new_driver)
         return jsonify({'status': 'ok'}), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 400
@@ -155,11 +474,11 @@ def update_driver(driver_id):
         if 'tag_id' in data:
             driver.tag_id = data['tag_id']
         db.session.commit()
-        # Refrescar tags permitidos
-        try:
-            refresh_allowed_tags()
-        except Exception:
-            pass
+        # Actualizar registro (y tags permitidos)
+        registry.put_driver(driver)
+        delta = leaderboard.update_driver(driver)
+        if delta:
+            broadcaster.publish('leaderboard_delta', delta, room=session_room(delta['session_id']))
         return jsonify({'status': 'ok', 'driver': driver.to_dict()})
     except Exception as e:
         return jsonify({'error': str(e)}), 400
@@ -171,11 +490,11 @@ def delete_driver(driver_id):
         driver = Driver.query.get_or_404(driver_id)
         db.session.delete(driver)
         db.session.commit()
-        # Refrescar tags permitidos
-        try:
-            refresh_allowed_tags()
-        except Exception:
-            pass
+        # Actualizar registro (y tags permitidos)
+        registry.remove_driver(driver_id)
+        delta = leaderboard.remove_driver(driver_id)
+        if delta:
+            broadcaster.publish('leaderboard_delta', delta, room=session_room(delta['session_id']))
         return jsonify({'status': 'deleted'})
     except Exception as e:
         return jsonify({'error': str(e)}), 400
@@ -186,8 +505,8 @@ def detector_start():
     try:
         print('Endpoint detector_start called (PID:', os.getpid(), ')')
         # Iniciar el hilo del detector si no está corriendo
-        if not getattr(vision_system, 'running', False):
-            vision_system.start()
+        if not vision_system.start():
+            return jsonify({'error': 'No se pudo abrir la cámara', 'running': False}), 500
         # Asegurar que el callback está asignado
         vision_system.on_lap_callback = handle_new_lap
         # Habilitar notificaciones
@@ -229,11 +548,121 @@ def detector_status():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/metrics', methods=['GET'])
+def api_metrics():
+    """Métricas del pipeline de visión: texto Prometheus por defecto, JSON con ?format=json."""
+    try:
+        metrics = vision_system.metrics
+        fmt = request.args.get('format')
+        if fmt is None:
+            best = request.accept_mimetypes.best_match(['text/plain', 'application/json'])
+            fmt = 'json' if best == 'application/json' else 'prometheus'
+        if fmt == 'json':
+            return jsonify(metrics.to_dict())
+        return Response(metrics.to_prometheus(), mimetype='text/plain; version=0.0.4')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/leaderboard', methods=['GET'])
+def get_leaderboard():
+    """Clasificación completa de la sesión activa (para clientes que se unen a mitad de carrera)."""
+    return jsonify(leaderboard.snapshot())
+
+
+@app.route('/api/personal-bests', methods=['GET'])
+def get_personal_bests():
+    """Mejor vuelta histórica de cada piloto, de la más rápida a la más lenta."""
+    rows = DriverBest.query.order_by(DriverBest.lap_time).all()
+    return jsonify({'items': [dict(r.to_dict(), nickname=r.driver.nickname if r.driver else None) for r in rows]})
+
+
+@app.route('/api/drivers/<int:driver_id>/best', methods=['GET'])
+def get_driver_best(driver_id):
+    best = db.session.get(DriverBest, driver_id)
+    return jsonify({'personal_best': best.to_dict() if best else None})
+
+
+@app.route('/api/sessions/<int:session_id>/bests', methods=['GET'])
+def get_session_bests(session_id):
+    """Mejor vuelta de cada piloto en la sesión, de la más rápida a la más lenta."""
+    db.get_or_404(Session, session_id)
+    rows = SessionBest.query.filter_by(session_id=session_id).order_by(SessionBest.lap_time).all()
+    return jsonify({'items': [dict(r.to_dict(), nickname=r.driver.nickname if r.driver else None) for r in rows]})
+
+
+@app.route('/api/tracks/<int:track_id>/record', methods=['GET'])
+def get_track_record(track_id):
+    db.get_or_404(Track, track_id)
+    record = db.session.get(TrackRecord, track_id)
+    return jsonify({'track_record': record.to_dict() if record else None})
+
+
+@app.route('/api/laps/<int:lap_id>/photo-finish', methods=['GET'])
+def get_lap_photo_finish(lap_id):
+    """Tira JPEG de photo-finish de la vuelta (frames alrededor del cruce)."""
+    clip = db.session.get(LapClip, lap_id)
+    if clip is None or not os.path.exists(clip.path):
+        return jsonify({'error': f'La vuelta {lap_id} no tiene photo-finish'}), 404
+    return send_file(clip.path, mimetype='image/jpeg', max_age=3600)
+
+
+@app.route('/api/sessions/<int:session_id>/photo-finishes', methods=['GET'])
+def get_session_photo_finishes(session_id):
+    """Vueltas de la sesión con photo-finish, en orden de guardado."""
+    db.get_or_404(Session, session_id)
+    rows = (db.session.query(LapClip, Lap)
+            .join(Lap, Lap.id == LapClip.lap_id)
+            .filter(Lap.session_id == session_id)
+            .order_by(Lap.id)
+            .all())
+    return jsonify({'items': [dict(clip.to_dict(), driver_id=lap.driver_id, lap_number=lap.lap_number,
+                                   lap_time=lap.lap_time, url=f'/api/laps/{lap.id}/photo-finish')
+                              for clip, lap in rows]})
+
+
+@app.route('/api/sessions/<int:session_id>/laps', methods=['GET'])
+def get_session_laps(session_id):
+    """Vueltas de una sesión con paginación por cursor (`after` = id de la última vuelta recibida)."""
+    db.get_or_404(Session, session_id)
+    # Un cursor inválido no puede tratarse como ausente: el cliente volvería a la primera página
+    try:
+        after = request.args.get('after')
+        after = int(after) if after is not None else None
+        limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+    except ValueError:
+        return jsonify({'error': "'after' y 'limit' deben ser enteros"}), 400
+    items, next_cursor = lap_export.laps_page(session_id, after=after, limit=limit)
+    return jsonify({'items': items, 'next_cursor': next_cursor, 'limit': limit})
+
+
+@app.route('/api/sessions/<int:session_id>/laps.<fmt>', methods=['GET'])
+def export_session_laps(session_id, fmt):
+    """Exportar todas las vueltas de una sesión en streaming (CSV o NDJSON)."""
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': f'Formato no soportado: {fmt}'}), 404
+    db.get_or_404(Session, session_id)
+    records = lap_export.iter_laps(session_id)
+    if fmt == 'csv':
+        body, mimetype = lap_export.iter_csv(records), 'text/csv'
+    else:
+        body, mimetype = lap_export.iter_ndjson(records), 'application/x-ndjson'
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=session_{session_id}_laps.{fmt}'
+    return response
+
+
 @app.route('/api/camera-config', methods=['GET'])
 def api_get_camera_config():
     try:
         cfg = camcfg.get_current() or {}
-        return jsonify(cfg)
+        # La versión sirve de ETag: los sondeos sin cambios responden 304
+        etag = f'"{camcfg.version()}"'
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status=304, headers={'ETag': etag})
+        response = jsonify(cfg)
+        response.headers['ETag'] = etag
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -242,9 +671,10 @@ def api_get_camera_config():
 def api_set_camera_config():
     try:
         data = request.get_json(force=True) or {}
-        # Guardar y aplicar. camcfg.save_and_apply reiniciará el detector si está en marcha
-        updated = camcfg.save_and_apply(data, vision_system=vision_system)
-        return jsonify({'ok': True, 'camera_config': updated})
+        # Guardar y aplicar: el detector recibe los cambios por su suscripción
+        # (y se reinicia si está en marcha y cambió algún parámetro de la cámara)
+        updated = camcfg.save_and_apply(data)
+        return jsonify({'ok': True, 'camera_config': updated, 'version': camcfg.version()})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -277,42 +707,117 @@ def api_camera_autotune():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/recording', methods=['GET'])
+def get_recording():
+    """Estado de la grabación: frames escritos/descartados y ritmo del disco (MB/s, FPS)."""
+    return jsonify(recorder.status())
+
+
+@app.route('/api/recording/start', methods=['POST'])
+def start_recording():
+    name = (request.get_json(silent=True) or {}).get('name')
+    if name is not None and (not str(name).strip() or os.path.basename(str(name)) != str(name)):
+        return jsonify({'error': f'Nombre de grabación no válido: {name}'}), 400
+    try:
+        recorder.start(name)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    except OSError as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify(recorder.status())
+
+
+@app.route('/api/recording/stop', methods=['POST'])
+def stop_recording():
+    return jsonify(recorder.stop())
+
+
 @app.route('/api/session/start', methods=['POST'])
 def start_session():
+    # Circuito opcional (para el récord del circuito)
+    track_id = (request.get_json(silent=True) or {}).get('track_id')
+    if track_id is not None and db.session.get(Track, track_id) is None:
+        return jsonify({'error': f'Circuito {track_id} no encontrado'}), 400
+
     # Cerrar sesiones anteriores
     old_sessions = Session.query.filter_by(is_active=True).all()
     for s in old_sessions:
         s.is_active = False
     
     # Nueva sesión
-    new_session = Session(type='race')
+    new_session = Session(type='race', track_id=track_id)
     db.session.add(new_session)
     db.session.commit()
+    registry.set_active_session(new_session.id)
+    leaderboard.reset(new_session.id)
+    best_laps.set_session(new_session.id, track_id)
     
     # Resetear timers del detector
-    vision_system.lap_timers = {}
+    vision_system.reset_lap_timers()
+
+    # Modo "grabar sesión": una grabación por sesión, desde su inicio
+    if app.config.get('RECORD_SESSIONS'):
+        try:
+            recorder.stop()
+            recorder.start(f'session_{new_session.id}')
+        except Exception as e:
+            print(f"No se pudo iniciar la grabación de la sesión: {e}")
     
-    socketio.emit('session_status', {'state': 'started'})
+    # A todos: cada cliente se pasa a la sala de la nueva sesión con `join_session`
+    broadcaster.publish('session_status', {'state': 'started', 'session_id': new_session.id})
     return jsonify({'status': 'started', 'session_id': new_session.id})
 
 # Streaming de Video (MJPEG)
-def gen_frames():
-    while True:
-        frame = vision_system.get_frame()
-        if frame:
+def gen_frames(profile=None):
+    # Mientras haya al menos un visor del perfil el detector dibuja y lo codifica
+    preview = vision_system.preview
+    profile = profile or preview.default_profile
+    metrics = vision_system.metrics
+    viewer = vision_system.frame_hub.subscribe(profile)
+    preview.subscribe(profile)
+    try:
+        while True:
+            skipped = viewer.skipped
+            item = viewer.next_frame()
+            if item is None:
+                # Dormir hasta el aviso del próximo frame (sin sondear); el
+                # timeout solo sirve para no quedarse colgado si la cámara para
+                try:
+                    eventlet.hubs.trampoline(viewer.fileno(), read=True, timeout=5.0)
+                except eventlet.Timeout:
+                    pass
+                continue
+            # Lo publicado mientras el cliente leía el anterior se salta: solo va el último
+            if viewer.skipped > skipped:
+                metrics.inc('preview_frames_skipped', viewer.skipped - skipped)
             yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        eventlet.sleep(0.02)
+                   b'Content-Type: image/jpeg\r\n\r\n' + item[1] + b'\r\n')
+            metrics.inc('preview_frames_sent')
+    finally:
+        preview.unsubscribe(profile)
+        viewer.close()
 
 @app.route('/video_feed')
 def video_feed():
-    return Response(gen_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    # Perfil del stream (full, medium, thumb... ver PREVIEW_PROFILES)
+    profile = request.args.get('profile') or vision_system.preview.default_profile
+    if profile not in vision_system.preview.profiles:
+        return jsonify({'error': f'Perfil de preview desconocido: {profile}'}), 404
+    return Response(gen_frames(profile), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+
+@app.route('/api/preview/profiles', methods=['GET'])
+def get_preview_profiles():
+    preview = vision_system.preview
+    return jsonify({'default': preview.default_profile,
+                    'profiles': [p.to_dict() for p in preview.profiles.values()]})
 
 if __name__ == '__main__':
     if not os.path.exists('visionlap.db'):
         with app.app_context():
             db.create_all()
             print("Base de datos creada.")
-    
+
+    startup()
     vision_system.start()
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,68 @@
+from threading import Lock
+
+# Tipos de mejor vuelta, en el orden en que se marcan en `lap_update`
+BEST_KINDS = ('session_best', 'personal_best', 'track_record')
+
+
+class BestLaps:
+    """Caché en memoria de las mejores vueltas materializadas.
+
+    Refleja las tablas `DriverBest` (por piloto), `SessionBest` (por piloto en
+    la sesión activa) y `TrackRecord` (por circuito) para que el guardado de
+    vueltas sepa en O(1), sin leer la base de datos, si una vuelta mejora
+    alguna de ellas. Se carga al arrancar (`load()`) y `set_session()` la
+    prepara para cada sesión nueva.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._session_id = None
+        self._track_id = None
+        # driver_id -> mejor tiempo
+        self._personal = {}
+        # driver_id -> mejor tiempo en la sesión activa
+        self._session = {}
+        # track_id -> récord
+        self._track = {}
+
+    def load(self, personal, session_id=None, track_id=None, session=None, track=None):
+        """Reemplazar el contenido: `personal` y `session` son {driver_id: tiempo}, `track` {track_id: tiempo}."""
+        with self._lock:
+            self._personal = dict(personal or {})
+            self._session_id = session_id
+            self._track_id = track_id
+            self._session = dict(session or {})
+            self._track = dict(track or {})
+
+    def set_session(self, session_id, track_id=None):
+        with self._lock:
+            self._session_id = session_id
+            self._track_id = track_id
+            self._session = {}
+
+    @property
+    def session_id(self):
+        return self._session_id
+
+    @property
+    def track_id(self):
+        return self._track_id
+
+    def improve(self, driver_id, lap_time):
+        """Registrar una vuelta y devolver {tipo: existía_fila} de cada mejor vuelta que supera.
+
+        `existía_fila` indica si la tabla ya tenía fila para esa clave (UPDATE)
+        o si hay que crearla (INSERT).
+        """
+        improved = {}
+        with self._lock:
+            for kind, table, key in (('session_best', self._session, driver_id),
+                                     ('personal_best', self._personal, driver_id),
+                                     ('track_record', self._track, self._track_id)):
+                if key is None:
+                    continue
+                best = table.get(key)
+                if best is None or lap_time < best:
+                    improved[kind] = best is not None
+                    table[key] = lap_time
+        return improved
@@ -0,0 +1,96 @@
+import time
+from threading import Thread, Lock
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Evento Socket.IO con el lote de un tick: lista de [nombre, datos] en orden de publicación
+BATCH_EVENT = 'race_events'
+
+
+class Broadcaster:
+    """Agrupa los eventos en tiempo real por tick y por sala de Socket.IO.
+
+    Los productores (escritor de vueltas, rutas) llaman a `publish()`, que solo
+    añade el evento al lote pendiente de su sala. Una tarea de fondo, cada
+    `interval` segundos, hace un único `emit(BATCH_EVENT, [[evento, datos], ...], to=sala)`
+    por sala con eventos (sala None = todos los clientes). Así el coste en el
+    bucle de eventlet es un envío por sala y tick, no uno por vuelta y cliente.
+
+    La tarea se lanza con `start_task(func)` y espera con `sleep(segundos)`; la
+    app pasa `socketio.start_background_task` y `socketio.sleep` para que el
+    bucle sea un greenlet de eventlet y no un hilo del sistema emitiendo por
+    su cuenta. Sin ellos se usa un hilo y `time.sleep` (scripts y pruebas).
+    """
+
+    def __init__(self, emit, interval=0.05, metrics=None, start_task=None, sleep=None):
+        self.emit = emit
+        self.interval = max(0.001, float(interval))
+        self.metrics = metrics
+        self.start_task = start_task
+        self.sleep = sleep or time.sleep
+        self._lock = Lock()
+        # sala -> lista de [evento, datos]
+        self._pending = {}
+        self._running = False
+        self._thread = None
+        if metrics is not None:
+            metrics.describe('broadcast_events', 'Eventos en tiempo real publicados')
+            metrics.describe('broadcast_emits', 'Envíos Socket.IO de lotes de eventos')
+
+    def publish(self, event, data, room=None, latest=False):
+        """Añadir un evento al lote de la sala. Con `latest=True` sustituye al del
+        mismo nombre aún pendiente (solo interesa el último, p. ej. el overlay)."""
+        with self._lock:
+            events = self._pending.setdefault(room, [])
+            if latest:
+                for item in events:
+                    if item[0] == event:
+                        item[1] = data
+                        break
+                else:
+                    events.append([event, data])
+            else:
+                events.append([event, data])
+        if self.metrics is not None:
+            self.metrics.inc('broadcast_events')
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        if self.start_task is not None:
+            self._thread = self.start_task(self._run)
+        else:
+            t = Thread(target=self._run, name='broadcaster')
+            t.daemon = True
+            t.start()
+            self._thread = t
+
+    def stop(self):
+        # La tarea sale en su siguiente tick; lo pendiente se envía ya
+        self._running = False
+        self._thread = None
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+        for room, events in pending.items():
+            try:
+                if room is None:
+                    self.emit(BATCH_EVENT, events)
+                else:
+                    self.emit(BATCH_EVENT, events, to=room)
+                if self.metrics is not None:
+                    self.metrics.inc('broadcast_emits')
+            except Exception as e:
+                logger.exception(f"Error enviando {len(events)} eventos a la sala {room}: {e}")
+
+    def _run(self):
+        while self._running:
+            # Dejar que se acumulen los eventos del tick
+            self.sleep(self.interval)
+            self.flush()
@@ -1,7 +1,12 @@
 import json
+import time
 from pathlib import Path
+from threading import RLock
 import config as global_config
 import os
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 BASE = Path(__file__).resolve().parent.parent
@@ -22,18 +27,98 @@ CAMERA_KEYS = [
     'FINISH_LINE'
 ]
 
+# Llaves que solo se aplican al abrir la cámara (requieren reiniciar el detector)
+RESTART_KEYS = [k for k in CAMERA_KEYS if k != 'FINISH_LINE']
+
+# Copia en memoria del fichero: solo se vuelve a leer si cambia su mtime.
+# `version` aumenta con cada cambio de contenido (guardado o edición externa).
+_lock = RLock()
+_cache = {'data': None, 'mtime': None, 'version': 0}
+_subscribers = []
+# Cambios ya aplicados pendientes de notificar: (changed, version). Se notifican
+# fuera de `_lock` para que un suscriptor lento (o que vuelva a leer la
+# configuración desde otro hilo) no bloquee al resto.
+_notices = []
+
+
+def _mtime():
+    try:
+        return CONFIG_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
 
 def _read_file():
     if CONFIG_FILE.exists():
         try:
             return json.loads(CONFIG_FILE.read_text(encoding='utf-8'))
-        except Exception:
+        except Exception as e:
+            logger.error(f"No se pudo leer {CONFIG_FILE}: {e}")
             return None
     return None
 
 
 def _write_file(data: dict):
-    CONFIG_FILE.write_text(json.dumps(data, indent=2), encoding='utf-8')
+    """Escritura atómica: fichero temporal en el mismo directorio, fsync y rename."""
+    tmp = CONFIG_FILE.with_name(CONFIG_FILE.name + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(data, indent=2))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, CONFIG_FILE)
+    _cache['mtime'] = _mtime()
+
+
+def _diff(old: dict, new: dict):
+    return {k: v for k, v in new.items() if (old or {}).get(k) != v}
+
+
+def _set_cached(data: dict, mtime):
+    """Actualizar la caché y dejar pendiente el aviso de las llaves que cambiaron.
+
+    Se llama con `_lock` tomado; el aviso lo entrega `_notify()` al soltarlo.
+    """
+    # Misma forma que al leer el JSON (tuplas -> listas) para comparar sin falsos cambios
+    data = json.loads(json.dumps(data))
+    changed = _diff(_cache['data'], data)
+    _cache['data'] = data
+    _cache['mtime'] = mtime
+    if not changed:
+        return changed
+    _cache['version'] += 1
+    _notices.append((changed, _cache['version']))
+    return changed
+
+
+def _notify():
+    """Entregar a los suscriptores los cambios pendientes (sin `_lock` tomado)."""
+    with _lock:
+        notices = list(_notices)
+        _notices.clear()
+        subscribers = list(_subscribers)
+    for changed, version in notices:
+        for fn in subscribers:
+            try:
+                fn(dict(changed), version)
+            except Exception as e:
+                logger.exception(f"Error notificando cambio de configuración de cámara: {e}")
+
+
+def subscribe(fn):
+    """Registrar `fn(changed, version)`, llamada con solo las llaves que cambian."""
+    with _lock:
+        if fn not in _subscribers:
+            _subscribers.append(fn)
+
+
+def unsubscribe(fn):
+    with _lock:
+        if fn in _subscribers:
+            _subscribers.remove(fn)
+
+
+def version():
+    return _cache['version']
 
 
 def _module_value(key):
@@ -48,7 +133,19 @@ def load_or_create_from_module_config(app_config=None):
     `config` (o `app_config` si se pasa) y persistirla.
     También aplica los valores leídos al módulo `config` en memoria.
     """
+    with _lock:
+        data = _load_or_create(app_config)
+    _notify()
+    return data
+
+
+def _load_or_create(app_config=None):
     data = _read_file()
+    if data is None and CONFIG_FILE.exists():
+        # Fichero ilegible: conservarlo aparte en lugar de sobrescribirlo sin más
+        broken = CONFIG_FILE.with_name(f"{CONFIG_FILE.name}.corrupt-{int(time.time())}")
+        os.replace(CONFIG_FILE, broken)
+        logger.error(f"{CONFIG_FILE} no es JSON válido; se guarda en {broken} y se regenera")
     if data is None:
         # Construir desde module config o app_config
         out = {}
@@ -74,7 +171,8 @@ def load_or_create_from_module_config(app_config=None):
 
     # Aplicar los valores leídos al módulo config en memoria
     _apply_to_module(data)
-    return data
+    _set_cached(data, _mtime())
+    return dict(data)
 
 
 def _apply_to_module(d: dict):
@@ -104,57 +202,95 @@ def _apply_to_module(d: dict):
 
 
 def get_current():
-    """Devolver la configuración actualmente en disco (y aplicada en memoria)."""
-    data = _read_file()
-    if data is None:
-        data = load_or_create_from_module_config()
+    """Devolver la configuración vigente (y aplicada en memoria).
+
+    Sirve la copia en memoria; solo se vuelve a leer el fichero si su mtime
+    cambió (p. ej. editado a mano), y en ese caso se aplica y se notifica.
+    """
+    with _lock:
+        data = _current()
+    _notify()
     return data
 
 
+def _current():
+    # Con `_lock` tomado
+    mtime = _mtime()
+    if _cache['data'] is not None and mtime == _cache['mtime']:
+        return dict(_cache['data'])
+    if _cache['data'] is not None and mtime is not None:
+        data = _read_file()
+        if data is None:
+            # Contenido ilegible: mantener la última configuración válida
+            _cache['mtime'] = mtime
+            return dict(_cache['data'])
+        _apply_to_module(data)
+        _set_cached(data, mtime)
+        return dict(data)
+    return _load_or_create()
+
+
 def save_and_apply(new_cfg: dict, vision_system=None):
     """
     Actualiza la configuración persistente y aplica los valores al módulo `config`.
-    Si se pasa `vision_system`, intenta aplicar la reconfiguración en tiempo de ejecución
-    reiniciando el detector (stop/start) cuando sea necesario.
+    Los suscriptores (`subscribe()`) reciben solo las llaves que cambiaron. Si se
+    pasa `vision_system`, se le aplican directamente esos cambios
+    (`apply_to_vision_system`).
     """
-    cur = get_current() or {}
-    merged = dict(cur)
-    for k, v in new_cfg.items():
-        if k not in CAMERA_KEYS:
-            # Ignorar claves desconocidas
-            continue
-        merged[k] = v
-
-    # Normalizar: si CAMERA_RESOLUTION viene como dict o lista, convertir a lista para JSON
-    if 'CAMERA_RESOLUTION' in merged and isinstance(merged['CAMERA_RESOLUTION'], (tuple,)):
-        merged['CAMERA_RESOLUTION'] = list(merged['CAMERA_RESOLUTION'])
+    with _lock:
+        cur = _current() or {}
+        merged = dict(cur)
+        for k, v in new_cfg.items():
+            if k not in CAMERA_KEYS:
+                # Ignorar claves desconocidas
+                continue
+            merged[k] = v
 
-    _write_file(merged)
+        # Normalizar: si CAMERA_RESOLUTION viene como dict o lista, convertir a lista para JSON
+        if 'CAMERA_RESOLUTION' in merged and isinstance(merged['CAMERA_RESOLUTION'], (tuple,)):
+            merged['CAMERA_RESOLUTION'] = list(merged['CAMERA_RESOLUTION'])
 
-    # Aplicar a módulo
-    _apply_to_module(merged)
+        changed = _diff(cur, merged)
+        if changed:
+            _write_file(merged)
+            # Aplicar a módulo
+            _apply_to_module(merged)
+            _set_cached(merged, _cache['mtime'])
+    _notify()
 
-    # Si se proporcionó vision_system, intentar reconfigurar en caliente
     if vision_system is not None:
-        try:
-            # Actualizar atributos que RaceSystem usa
-            if 'CAMERA_IDX' in merged:
-                vision_system.camera_idx = int(merged['CAMERA_IDX'])
-            if 'CAMERA_RESOLUTION' in merged:
-                res = merged['CAMERA_RESOLUTION']
-                if isinstance(res, list):
-                    vision_system.resolution = (int(res[0]), int(res[1]))
-            # Si está en marcha, reiniciarlo para aplicar cambios
-            if getattr(vision_system, 'running', False):
-                try:
-                    vision_system.stop()
-                except Exception:
-                    pass
-                try:
-                    vision_system.start()
-                except Exception:
-                    pass
-        except Exception:
-            pass
-
-    return merged
+        apply_to_vision_system(vision_system, changed)
+    return dict(merged)
+
+
+def apply_to_vision_system(vision_system, changed: dict):
+    """Reconfigurar `RaceSystem` en caliente con las llaves de `changed`.
+
+    La línea de meta se aplica sin parar el detector; el resto de parámetros de
+    cámara solo se leen al abrirla, así que reinician el detector si está en marcha.
+    """
+    if not changed:
+        return
+    try:
+        # Actualizar atributos que RaceSystem usa
+        if 'CAMERA_IDX' in changed:
+            vision_system.camera_idx = int(changed['CAMERA_IDX'])
+        if 'CAMERA_RESOLUTION' in changed:
+            res = changed['CAMERA_RESOLUTION']
+            if isinstance(res, list):
+                vision_system.resolution = (int(res[0]), int(res[1]))
+        if changed.get('FINISH_LINE'):
+            # Recalcula también la región de detección alrededor de la meta
+            vision_system.set_finish_line(changed['FINISH_LINE'])
+        # Si está en marcha y cambió algo de la cámara, reiniciarlo para aplicarlo
+        if any(k in changed for k in RESTART_KEYS) and getattr(vision_system, 'running', False):
+            try:
+                vision_system.stop()
+            except Exception:
+                pass
+            try:
+                vision_system.start()
+            except Exception:
+                pass
+    except Exception:
+        pass
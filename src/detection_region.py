@@ -0,0 +1,177 @@
+import cv2
+import numpy as np
+from collections import namedtuple
+from threading import Lock
+
+
+# Detección de un tag en coordenadas de frame completo. Sustituye al objeto
+# `Detection` de pupil_apriltags para poder trasladar centro/esquinas desde
+# el recorte donde se detectó (y para poder enviarla entre procesos).
+TagDetection = namedtuple('TagDetection', ['tag_id', 'center', 'corners', 'decision_margin', 'hamming'])
+
+ROI_MODES = ('full', 'band', 'polygon')
+
+
+def detect_in_rects(detector, gray, origin=(0, 0), rects=None):
+    """Ejecutar `detector.detect` sobre `gray` (o sobre subventanas) y
+    devolver `TagDetection` en coordenadas del frame completo.
+
+    `origin` es la posición (x, y) de la esquina superior izquierda de `gray`
+    dentro del frame completo. `rects` es una lista opcional de ventanas
+    (x0, y0, x1, y1) en coordenadas de frame completo; si es None se analiza
+    toda la imagen. Si varias ventanas detectan el mismo tag se conserva la
+    detección con mayor decision_margin.
+    """
+    ox, oy = int(origin[0]), int(origin[1])
+    h, w = gray.shape[:2]
+    if rects is None:
+        windows = [(0, 0, w, h)]
+    else:
+        windows = []
+        for (x0, y0, x1, y1) in rects:
+            # Pasar a coordenadas locales y recortar a los límites de la imagen
+            lx0 = max(0, int(x0) - ox)
+            ly0 = max(0, int(y0) - oy)
+            lx1 = min(w, int(x1) - ox)
+            ly1 = min(h, int(y1) - oy)
+            if lx1 - lx0 >= 8 and ly1 - ly0 >= 8:
+                windows.append((lx0, ly0, lx1, ly1))
+
+    found = {}
+    for (lx0, ly0, lx1, ly1) in windows:
+        if (lx0, ly0, lx1, ly1) == (0, 0, w, h):
+            sub = gray
+        else:
+            # detect() necesita memoria contigua
+            sub = np.ascontiguousarray(gray[ly0:ly1, lx0:lx1])
+        offset = np.array([ox + lx0, oy + ly0], dtype=np.float64)
+        for tag in detector.detect(sub):
+            det = TagDetection(
+                tag_id=int(tag.tag_id),
+                center=np.asarray(tag.center, dtype=np.float64) + offset,
+                corners=np.asarray(tag.corners, dtype=np.float64) + offset,
+                decision_margin=float(tag.decision_margin),
+                hamming=int(tag.hamming),
+            )
+            prev = found.get(det.tag_id)
+            if prev is None or det.decision_margin > prev.decision_margin:
+                found[det.tag_id] = det
+    return list(found.values())
+
+
+class DetectionRegion:
+    """Región del frame en la que se buscan tags.
+
+    Modos:
+    - 'full': frame completo (comportamiento original).
+    - 'band': banda de `band` píxeles alrededor del segmento de meta.
+    - 'polygon': polígono dibujado por el usuario (lista de puntos [x, y]).
+
+    `prepare()` devuelve un snapshot inmutable (rect, mask) que el hilo de
+    detección usa sin bloquear; se recalcula solo cuando cambia la línea de
+    meta, la configuración o la resolución.
+    """
+
+    def __init__(self, mode='full', band=100, polygon=None):
+        self._lock = Lock()
+        self.mode = mode if mode in ROI_MODES else 'full'
+        self.band = max(1, int(band))
+        self.polygon = self._normalize_polygon(polygon)
+        self._finish_line = None
+        self._snapshot = None
+        self._snapshot_key = None
+
+    @staticmethod
+    def _normalize_polygon(polygon):
+        if not polygon:
+            return None
+        pts = [(int(p[0]), int(p[1])) for p in polygon]
+        return pts if len(pts) >= 3 else None
+
+    def configure(self, mode=None, band=None, polygon=None):
+        """Cambiar modo/banda/polígono; el snapshot se recalcula en el siguiente frame."""
+        with self._lock:
+            if mode is not None:
+                if mode not in ROI_MODES:
+                    raise ValueError(f"roi_mode inválido: {mode}")
+                self.mode = mode
+            if band is not None:
+                self.band = max(1, int(band))
+            if polygon is not None:
+                self.polygon = self._normalize_polygon(polygon)
+            self._snapshot_key = None
+
+    def set_finish_line(self, finish_line):
+        with self._lock:
+            self._finish_line = finish_line
+            self._snapshot_key = None
+
+    def to_dict(self):
+        return {
+            'roi_mode': self.mode,
+            'roi_band': self.band,
+            'roi_polygon': [list(p) for p in self.polygon] if self.polygon else None,
+        }
+
+    def prepare(self, frame_shape):
+        """Devolver (rect, mask) para un frame de forma `frame_shape`.
+
+        `rect` es (x0, y0, x1, y1) en coordenadas de frame completo y `mask`
+        es una imagen uint8 del tamaño del recorte (255 dentro de la región)
+        o None si la región es exactamente el rectángulo.
+        """
+        h, w = int(frame_shape[0]), int(frame_shape[1])
+        with self._lock:
+            key = (h, w)
+            if self._snapshot is not None and self._snapshot_key == key:
+                return self._snapshot
+            self._snapshot = self._build(h, w)
+            self._snapshot_key = key
+            return self._snapshot
+
+    def _region_polygon(self):
+        if self.mode == 'polygon' and self.polygon:
+            return np.array(self.polygon, dtype=np.float64)
+        if self.mode == 'band' and self._finish_line:
+            p1 = np.array(self._finish_line[0], dtype=np.float64)
+            p2 = np.array(self._finish_line[1], dtype=np.float64)
+            d = p2 - p1
+            length = float(np.hypot(d[0], d[1]))
+            if length < 1e-6:
+                d = np.array([1.0, 0.0])
+            else:
+                d = d / length
+            n = np.array([-d[1], d[0]])
+            b = float(self.band)
+            # Segmento engrosado `band` píxeles en ambas direcciones
+            return np.array([
+                p1 - d * b - n * b,
+                p2 + d * b - n * b,
+                p2 + d * b + n * b,
+                p1 - d * b + n * b,
+            ])
+        return None
+
+    def _build(self, h, w):
+        poly = self._region_polygon()
+        if poly is None:
+            return (0, 0, w, h), None
+
+        x0 = max(0, int(np.floor(poly[:, 0].min())))
+        y0 = max(0, int(np.floor(poly[:, 1].min())))
+        x1 = min(w, int(np.ceil(poly[:, 0].max())) + 1)
+        y1 = min(h, int(np.ceil(poly[:, 1].max())) + 1)
+        if x1 - x0 < 8 or y1 - y0 < 8:
+            # Región fuera del frame o degenerada: usar frame completo
+            return (0, 0, w, h), None
+
+        # Si el polígono es un rectángulo alineado con los ejes no hace falta máscara
+        xs = np.unique(np.round(poly[:, 0]))
+        ys = np.unique(np.round(poly[:, 1]))
+        if len(poly) == 4 and len(xs) == 2 and len(ys) == 2:
+            return (x0, y0, x1, y1), None
+
+        mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        local = np.round(poly - np.array([x0, y0])).astype(np.int32)
+        cv2.fillPoly(mask, [local], 255)
+        return (x0, y0, x1, y1), mask
@@ -2,11 +2,21 @@ import cv2
 import time
 import numpy as np
 from pupil_apriltags import Detector
-from threading import Thread, Lock
+from threading import Thread, Event
 import socket
 import config
 import os
 import logging
+from src.frame_ring import FrameRing
+from src.detection_region import DetectionRegion, detect_in_rects
+from src.detector_pool import DetectorPool
+from src.tag_tracker import TagTracker
+from src.tag_state import TagState, detection_batch
+from src.metrics import MetricsRegistry
+from src.preview import PreviewEncoder, DEFAULT_PROFILES, parse_profiles
+from src.frame_hub import FrameHub
+from src.photo_finish import PhotoFinishBuffer
+from src.frame_source import CameraSource
 
 # Logger para este módulo
 logger = logging.getLogger(__name__)
@@ -45,6 +55,10 @@ env_debug = os.environ.get('VISION_DEBUG')
 if env_debug:
     set_global_debug_categories(env_debug)
 
+# Motivos de descarte de una detección, en el orden en que se comprueban
+FILTER_REASONS = ('family', 'decision_margin', 'hamming', 'area', 'allowed')
+
+
 class RaceSystem:
     def __init__(self, camera_idx=None, resolution=None, finish_line=None):
         # Inicialización de cámara
@@ -70,10 +84,15 @@ class RaceSystem:
 
         # No abrir la cámara aquí: la abriremos al llamar a start(),
         # así la cámara permanece apagada hasta que el detector se active.
+        # `self.cap` es la FrameSource activa (cámara por defecto).
         self.cap = None
+        # Fuente alternativa (vídeo, imágenes, sintética). None = cámara en vivo
+        self.frame_source = None
         
-        # Detector AprilTag (Familia 16h5 para velocidad/distancia)
-        self.at_detector = Detector(
+        # Detector AprilTag (Familia 16h5 para velocidad/distancia).
+        # Se guardan los parámetros porque Detector no los expone y los
+        # workers del pool necesitan construir su propia instancia.
+        self.detector_params = dict(
             families='tag16h5',
             nthreads=4,
             # Ajustes por defecto más permisivos para detección en movimiento.
@@ -87,10 +106,43 @@ class RaceSystem:
             decode_sharpening=0.5,
             debug=0
         )
+        self.at_detector = Detector(**self.detector_params)
+        # Pool opcional de procesos detectores (0 = detección en el propio hilo)
+        self.detector_workers = max(0, int(getattr(config, 'DETECTOR_WORKERS', 0)))
+        self.detector_worker_threads = max(1, int(getattr(config, 'DETECTOR_WORKER_THREADS', 1)))
+        self._detector_pool = None
 
         self.running = False
-        self.lock = Lock()
-        self.frame_out = None
+        # Métricas del pipeline: histogramas por etapa y contadores (/api/metrics)
+        self.metrics = MetricsRegistry()
+        self.metrics.describe('frames_captured', 'Frames entregados por la fuente')
+        self.metrics.describe('frames_dropped', 'Frames sobrescritos en el ring antes de procesarse')
+        self.metrics.describe('frames_processed', 'Frames que pasaron por la lógica de cruces')
+        self.metrics.describe('detections', 'Tags detectados')
+        self.metrics.describe('detections_filtered', 'Detecciones descartadas por motivo',
+                              [{'reason': r} for r in FILTER_REASONS])
+        self.metrics.describe('laps', 'Vueltas notificadas al callback')
+        self.metrics.describe('lap_callback_errors', 'Excepciones en el callback de vuelta')
+        self.metrics.gauge('fps', lambda: self.fps_ema, 'FPS procesados (media exponencial)')
+        self.metrics.gauge('ring_capacity', lambda: self.ring_capacity, 'Capacidad del ring de frames')
+        # Preview MJPEG: se codifica en otro hilo y solo si hay visores conectados;
+        # el hub reparte cada JPEG (con su seq) a todos los visores del perfil
+        self.frame_hub = FrameHub()
+        self.metrics.describe('preview_frames_sent', 'Frames del preview enviados a visores')
+        self.metrics.describe('preview_frames_skipped', 'Frames del preview saltados por visores lentos')
+        self.metrics.gauge('preview_viewers', self.frame_hub.subscribers, 'Visores conectados a /video_feed')
+        self.preview = PreviewEncoder(
+            fps=getattr(config, 'PREVIEW_FPS', 30),
+            quality=getattr(config, 'PREVIEW_JPEG_QUALITY', 80),
+            metrics=self.metrics,
+            profiles=parse_profiles(getattr(config, 'PREVIEW_PROFILES', '')) or DEFAULT_PROFILES,
+            hub=self.frame_hub,
+        )
+        # Photo-finish: últimos frames en gris (sin overlay) dentro del presupuesto de memoria
+        pf_budget = float(getattr(config, 'PHOTO_FINISH_MB', 0)) * 1024 * 1024
+        self.photo_finish = PhotoFinishBuffer(pf_budget) if pf_budget > 0 else None
+        # Grabación opcional del stream crudo (`SessionRecorder`, la asigna la app)
+        self.recorder = None
         # FPS tracking (EMA)
         self._last_frame_time = None
         self.fps_ema = None
@@ -99,25 +151,47 @@ class RaceSystem:
         self.enabled = True
         # Hilo que procesa frames
         self._thread = None
+        # Hilo de captura: lee de la cámara y deja los frames en el ring buffer
+        self._capture_thread = None
+        # Ring buffer de frames capturados (se crea al recibir el primer frame)
+        self._ring = None
+        self.ring_capacity = max(2, int(getattr(config, 'FRAME_RING_SIZE', 8)))
+        # Fin de la fuente (replay) y señal de que el procesado terminó
+        self._source_eof = False
+        self._finished = Event()
+        self.frames_processed = 0
+        self._dropped_seen = 0
+        self._realtime_source = True
         # Socket usado como lock (bind a localhost:DETECTOR_LOCK_PORT)
         self._lock_sock = None
         
         # Línea de meta (Coordenadas X1, Y1, X2, Y2)
         # Se debería poder configurar desde la UI
-        self.finish_line = finish_line
+        self.finish_line = None
+        # Región de detección: solo se preprocesa y analiza el recorte alrededor de la meta
+        self.detection_region = DetectionRegion(
+            mode=getattr(config, 'DETECTION_ROI_MODE', 'full'),
+            band=getattr(config, 'DETECTION_ROI_BAND', 100),
+        )
+        self.set_finish_line(finish_line)
+        # Seguimiento de tags para detectar solo en ventanas alrededor de las predicciones
+        self.tag_tracker = TagTracker(
+            enabled=bool(int(getattr(config, 'TRACKER_ENABLED', 0))),
+            full_scan_interval=getattr(config, 'TRACKER_FULL_SCAN_INTERVAL', 10),
+        )
         
-        # Estado de seguimiento
-        # última posición confirmada (usada para comparar prev->current en cruces)
-        self.last_confirmed = {}  # {tag_id: (center_tuple, timestamp)}
-        # última posición vista (no necesariamente confirmada)
-        self.last_seen = {}
-        self.lap_timers = {}     # {tag_id: last_crossing_time}
+        # Estado de seguimiento por tag (arrays indexados por tag ID): contador de
+        # confirmación, última posición confirmada/vista, último cruce y máscara
+        # de tags permitidos
+        self.tag_state = TagState()
         self.min_lap_time = 2.0  # Segundos de debounce
         # Conjunto opcional de tags permitidos (solo estos se procesan)
         # Si es None -> se procesan todos los tags detectados
         self.allowed_tags = None
-        # Contadores y umbrales para reducir falsos positivos
-        self.detection_counts = {}  # {tag_id: consecutive_frames_seen}
+        # Una posición confirmada más antigua que esto no sirve como punto previo
+        # del cruce (el tag salió de la región y volvió a entrar)
+        self.max_track_gap = 1.0
+        # Umbrales para reducir falsos positivos
         self.min_detection_frames = 1  # cuántos frames consecutivos requiere confirmar
         # Reducir area mínima para que tags levemente borrosos/más pequeños sigan detectándose
         self.min_tag_area = 150  # área mínima en píxels para considerar un tag real
@@ -135,18 +209,33 @@ class RaceSystem:
         
         # Callbacks para notificar a la app principal
         self.on_lap_callback = None
+        # Callback opcional por frame procesado: (capture_time, tags, latency), donde
+        # latency es el tiempo desde que el frame salió del ring hasta acabar la lógica
+        # de cruces (lo usa benchmark.py)
+        self.on_frame_callback = None
+        # Overlay del preview: 'server' lo dibuja sobre el frame; 'client' deja el
+        # frame limpio y pasa los metadatos de cada frame a `on_overlay_callback(meta)`
+        self.overlay_mode = getattr(config, 'PREVIEW_OVERLAY', 'server')
+        self.on_overlay_callback = None
         # Debug categories a nivel de instancia (complementan las globales)
         # Si no está vacío, su presencia habilita logs de la categoría además de las globales
         self.debug_categories = set()
         # CLAHE para mejorar contraste adaptativo antes de detección (útil en movimiento)
-        try:
-            # clipLimit y tileGridSize son conservadores para no introducir artefactos
-            self._clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        except Exception:
-            self._clahe = None
+        # clipLimit y tileGridSize son conservadores para no introducir artefactos (0 = sin CLAHE)
+        self.clahe_clip_limit = 2.0
+        self._clahe = self._make_clahe(self.clahe_clip_limit)
         # Valor devuelto por el último autotune (informativo)
         self._last_autotune = None
 
+    @staticmethod
+    def _make_clahe(clip_limit):
+        if not clip_limit or clip_limit <= 0:
+            return None
+        try:
+            return cv2.createCLAHE(clipLimit=float(clip_limit), tileGridSize=(8, 8))
+        except Exception:
+            return None
+
     def set_debug_categories(self, categories):
         """Establecer categorías de debug para esta instancia (lista o comma string).
 
@@ -184,26 +273,45 @@ class RaceSystem:
             except Exception as e:
                 print(f"Cámara: No se pudo establecer {name} a {value}. Error: {e}")
 
+    def set_frame_source(self, source):
+        """Usar otra FrameSource (vídeo, imágenes, sintética) en el próximo start().
+
+        Pasar None para volver a la cámara en vivo.
+        """
+        self.frame_source = source
+
     def start(self):
+        """Abrir la fuente y arrancar los hilos; devuelve False si no se pudo
+        (lock ocupado o fuente que no abre), con `wait_finished()` ya resuelto."""
         if self.running:
-            return
-        # Intentar adquirir lock local para evitar duplicados entre procesos
-        try:
-            port = getattr(config, 'DETECTOR_LOCK_PORT', 57001)
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            s.bind(('127.0.0.1', int(port)))
-            s.listen(1)
-            self._lock_sock = s
-        except OSError as e:
-            # Si el bind falla, otro proceso ya tiene la cámara/lock
-            print(f"No se inicia detector: puerto lock en uso ({e})")
-            return
-            
-        # Si la cámara no está abierta, (re)abrirla
+            return True
+        source = self.frame_source
+        # El lock entre procesos solo protege la cámara física
+        if source is None or getattr(source, 'realtime', False):
+            # Intentar adquirir lock local para evitar duplicados entre procesos
+            try:
+                port = getattr(config, 'DETECTOR_LOCK_PORT', 57001)
+                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                s.bind(('127.0.0.1', int(port)))
+                s.listen(1)
+                self._lock_sock = s
+            except OSError as e:
+                # Si el bind falla, otro proceso ya tiene la cámara/lock
+                print(f"No se inicia detector: puerto lock en uso ({e})")
+                self._finished.set()
+                return False
+
+        # Si la fuente no está abierta, (re)abrirla
         try:
-            if not (self.cap and getattr(self.cap, 'isOpened', lambda: False)()):
-                self.cap = cv2.VideoCapture(self.camera_idx, cv2.CAP_DSHOW)
+            if source is not None and not (self.cap is source and source.isOpened()):
+                if not source.open():
+                    raise RuntimeError(f"no se pudo abrir la fuente {source!r}")
+                self.cap = source
+                logger.info(f"Fuente de frames abierta: {type(source).__name__} (tiempo real={source.realtime})")
+            elif source is None and not (self.cap and getattr(self.cap, 'isOpened', lambda: False)()):
+                self.cap = CameraSource(self.camera_idx)
+                self.cap.open()
 
                 # --- Configuración de la Cámara ---
                 # Básica
@@ -227,14 +335,28 @@ class RaceSystem:
             if self._lock_sock:
                 self._lock_sock.close()
                 self._lock_sock = None
-            return
+            self._finished.set()
+            return False
 
         self.running = True
+        self.preview.start()
+        # El ring se recrea en cada arranque por si cambió la resolución
+        self._ring = None
+        self._source_eof = False
+        self._finished.clear()
+        self.frames_processed = 0
+        self._dropped_seen = 0
+        self._realtime_source = bool(getattr(self.cap, 'realtime', True))
+        ct = Thread(target=self._capture_loop)
+        ct.daemon = True
+        ct.start()
+        self._capture_thread = ct
         t = Thread(target=self._process_loop)
         t.daemon = True
         t.start()
         self._thread = t
         logger.info(f"Detector thread iniciado en PID {os.getpid()}")
+        return True
 
     def _intersect(self, p1, p2, p3, p4):
         """
@@ -272,143 +394,420 @@ class RaceSystem:
 
         return False
 
-    def _process_loop(self):
+    def _crossing_fraction(self, p1, p2, p3, p4):
+        """
+        Fracción t en [0, 1] del recorrido p1->p2 en la que se cruza el
+        segmento p3-p4, o None si no se cruzan (mismo criterio que `_intersect`).
+        El instante del cruce se interpola como t_prev + t * (t_now - t_prev).
+        """
+        if not self._intersect(p1, p2, p3, p4):
+            return None
+
+        rx, ry = p2[0] - p1[0], p2[1] - p1[1]
+        sx, sy = p4[0] - p3[0], p4[1] - p3[1]
+        qx, qy = p3[0] - p1[0], p3[1] - p1[1]
+        denom = rx * sy - ry * sx
+        if denom != 0:
+            t = (qx * sy - qy * sx) / denom
+            return min(1.0, max(0.0, float(t)))
+
+        # Casos colineales/paralelos: tomar el primer punto de contacto con la meta
+        rr = rx * rx + ry * ry
+        if rr == 0:
+            return 0.0
+        t3 = (qx * rx + qy * ry) / rr
+        t4 = ((p4[0] - p1[0]) * rx + (p4[1] - p1[1]) * ry) / rr
+        lo = max(0.0, min(t3, t4))
+        return min(1.0, float(lo))
+
+    def _capture_loop(self):
+        """Capturar frames en cuanto el driver los entrega.
+
+        Cada frame se marca con `time.monotonic()` justo después de `grab()`
+        y se escribe directamente en un slot del ring buffer, de modo que el
+        tiempo de detección no afecta a los tiempos de vuelta ni frena la cámara.
+        """
+        metrics = self.metrics
         while self.running:
-            if not (self.cap and getattr(self.cap, 'isOpened', lambda: False)()):
+            cap = self.cap
+            if not (cap and getattr(cap, 'isOpened', lambda: False)()):
                 # Si la cámara no está abierta, esperar un poco
                 time.sleep(0.05)
                 continue
 
-            ret, frame = self.cap.read()
-            if not ret:
+            try:
+                # La fuente devuelve el timestamp de captura (reloj monotónico o el del fichero)
+                t0 = time.perf_counter()
+                capture_time = cap.grab()
+                metrics.observe('grab', time.perf_counter() - t0)
+                if capture_time is None:
+                    if getattr(cap, 'eof', False):
+                        # Fin de la grabación: dejar que la detección vacíe el ring
+                        logger.info("Fuente de frames agotada")
+                        self._source_eof = True
+                        if self._ring is not None:
+                            self._ring.close()
+                        return
+                    time.sleep(0.01)
+                    continue
+
+                ring = self._ring
+                if ring is None:
+                    # Primer frame: dimensionar el ring con la resolución real del driver
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        continue
+                    # Las fuentes que no son en tiempo real no deben perder frames
+                    ring = FrameRing(self.ring_capacity, frame.shape, frame.dtype,
+                                     lossless=not getattr(cap, 'realtime', True))
+                    slot, buf = ring.begin_write()
+                    np.copyto(buf, frame)
+                    ring.commit(slot, capture_time)
+                    self._ring = ring
+                    metrics.inc('frames_captured')
+                    self._record(buf, capture_time)
+                    continue
+
+                slot, buf = ring.begin_write()
+                t0 = time.perf_counter()
+                ret, frame = cap.retrieve(buf)
+                if not ret:
+                    ring.abort(slot)
+                    continue
+                metrics.observe('retrieve', time.perf_counter() - t0)
+                if frame is not buf:
+                    # El driver devolvió otro buffer (p. ej. cambio de formato)
+                    if frame.shape != buf.shape:
+                        ring.abort(slot)
+                        logger.warning(f"Frame con forma inesperada {frame.shape}, se esperaba {buf.shape}")
+                        continue
+                    np.copyto(buf, frame)
+                ring.commit(slot, capture_time)
+                metrics.inc('frames_captured')
+                self._record(buf, capture_time)
+            except Exception as e:
+                if self.running:
+                    logger.exception(f"Error capturando frame: {e}")
+                time.sleep(0.01)
+
+    def _record(self, frame, capture_time):
+        """Pasar el frame recién capturado a la grabación, si hay una en curso (no bloquea)."""
+        recorder = self.recorder
+        if recorder is not None and recorder.active:
+            recorder.submit(frame, capture_time)
+
+    def _process_loop(self):
+        try:
+            if self.detector_workers > 0:
+                self._pool_loop()
+            else:
+                self._detect_loop()
+        finally:
+            self._finished.set()
+
+    def _detect_loop(self):
+        frame = None
+        last_seq = -1
+        while self.running:
+            ring = self._ring
+            if ring is None:
+                if self._source_eof:
+                    return
+                # Esperar a que el hilo de captura entregue el primer frame
                 time.sleep(0.01)
                 continue
 
-            # Conversión a gris para detección
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            # Aplicar CLAHE (si está disponible) para mejorar contraste y ayudar
-            # a detectar tags en movimiento/condiciones de bajo contraste.
-            if getattr(self, '_clahe', None) is not None:
-                try:
-                    gray = self._clahe.apply(gray)
-                except Exception:
-                    # Si CLAHE falla, continuar con la imagen en gris
-                    pass
-            
-            # Detección de tags
-            tags = self.at_detector.detect(gray)
-            if tags:
-                self._dbg('detection', f"Detected {len(tags)} tags")
-            
-            current_time = time.time()
-            
-            # Visualización: Dibujar línea de meta
+            if frame is None or frame.shape != ring.shape:
+                frame = np.empty(ring.shape, dtype=ring.dtype)
+            got = ring.read(last_seq, frame, timeout=0.1)
+            if got is None:
+                if ring.closed and ring.latest_seq() <= last_seq:
+                    # Fuente agotada y todos sus frames procesados
+                    return
+                continue
+            # Usar el timestamp de captura, no el de fin de procesado
+            last_seq, current_time = got
+            dequeued_at = time.monotonic()
+            self._observe_dequeue(ring, current_time, dequeued_at)
+
+            roi_rect, roi_mask = self.detection_region.prepare(frame.shape)
+            gray = self._preprocess(frame, roi_rect, roi_mask)
+
+            # Ventanas predichas por el tracker (None = región completa)
+            rects, expected = self.tag_tracker.plan(current_time, roi_rect)
+
+            # Detección de tags (coordenadas devueltas en frame completo)
+            t0 = time.perf_counter()
+            tags = detect_in_rects(self.at_detector, gray, origin=roi_rect[:2], rects=rects)
+            self.metrics.observe('detect', time.perf_counter() - t0)
+            self.tag_tracker.update(current_time, tags, expected)
+            self._process_detections(frame, tags, current_time, roi_rect, dequeued_at)
+
+    def _pool_loop(self):
+        """Variante de `_process_loop` que reparte la detección en procesos.
+
+        Cada frame se preprocesa aquí y se escribe en un slot de memoria
+        compartida; los resultados vuelven reordenados por número de
+        secuencia, de modo que la lógica de cruces ve los frames en orden.
+        """
+        ring = None
+        pool = None
+        frames = None
+        last_seq = -1
+        try:
+            while self.running:
+                if ring is None or ring is not self._ring:
+                    ring = self._ring
+                    if ring is None:
+                        if self._source_eof:
+                            return
+                        time.sleep(0.01)
+                        continue
+                    if pool is not None:
+                        pool.close()
+                    pool = DetectorPool(
+                        workers=self.detector_workers,
+                        frame_shape=ring.shape[:2],
+                        detector_params=self._worker_detector_params(),
+                    )
+                    self._detector_pool = pool
+                    # Copia BGR de cada frame en vuelo (para dibujar al recibir el resultado)
+                    frames = np.empty((pool.slots,) + ring.shape, dtype=ring.dtype)
+
+                # Entregar a la lógica de vueltas los resultados ya ordenados
+                for job in pool.collect():
+                    slot, current_time, roi_rect, expected, dequeued_at, submitted = job.meta
+                    self.metrics.observe('detect', time.perf_counter() - submitted)
+                    self.tag_tracker.update(current_time, job.tags, expected)
+                    self._process_detections(frames[slot], job.tags, current_time, roi_rect, dequeued_at)
+                    pool.release(slot)
+
+                slot = pool.acquire()
+                if slot is None:
+                    # Todos los slots en vuelo: esperar resultados
+                    pool.wait(timeout=0.05)
+                    continue
+
+                got = ring.read(last_seq, frames[slot], timeout=0.05)
+                if got is None:
+                    pool.release(slot)
+                    if ring.closed and ring.latest_seq() <= last_seq:
+                        # Fuente agotada: terminar cuando no quede nada en vuelo
+                        if pool.pending == 0:
+                            return
+                        pool.wait(timeout=0.05)
+                    continue
+                last_seq, current_time = got
+                dequeued_at = time.monotonic()
+                self._observe_dequeue(ring, current_time, dequeued_at)
+
+                roi_rect, roi_mask = self.detection_region.prepare(frames[slot].shape)
+                x0, y0, x1, y1 = roi_rect
+                out = pool.gray_view(slot, (y1 - y0, x1 - x0))
+                self._preprocess(frames[slot], roi_rect, roi_mask, out=out)
+                rects, expected = self.tag_tracker.plan(current_time, roi_rect)
+                pool.submit(slot, origin=(x0, y0), rects=rects,
+                            meta=(slot, current_time, roi_rect, expected, dequeued_at, time.perf_counter()))
+        finally:
+            if pool is not None:
+                pool.close()
+            self._detector_pool = None
+
+    def _observe_dequeue(self, ring, capture_time, dequeued_at):
+        """Registrar la espera en el ring y los frames perdidos desde la última lectura."""
+        dropped = ring.dropped
+        if dropped != self._dropped_seen:
+            self.metrics.inc('frames_dropped', max(0, dropped - self._dropped_seen))
+            self._dropped_seen = dropped
+        # Con fuentes grabadas el timestamp no es del reloj local
+        if self._realtime_source:
+            self.metrics.observe('queue', max(0.0, dequeued_at - capture_time))
+
+    def _worker_detector_params(self):
+        # Con varios procesos, cada Detector usa pocos hilos para no sobresuscribir CPU
+        return dict(self.detector_params, nthreads=self.detector_worker_threads)
+
+    def _preprocess(self, frame, roi_rect, roi_mask, out=None):
+        """Recortar a la región de detección y devolver el recorte en gris con CLAHE.
+
+        Solo el recorte se convierte y ecualiza. Si se pasa `out`, el resultado
+        se escribe ahí (p. ej. en memoria compartida) en lugar de reservar.
+        """
+        x0, y0, x1, y1 = roi_rect
+        crop = frame[y0:y1, x0:x1]
+
+        # Conversión a gris para detección
+        t0 = time.perf_counter()
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY, dst=out)
+        t1 = time.perf_counter()
+        self.metrics.observe('cvtcolor', t1 - t0)
+        # Aplicar CLAHE (si está disponible) para mejorar contraste y ayudar
+        # a detectar tags en movimiento/condiciones de bajo contraste.
+        if getattr(self, '_clahe', None) is not None:
+            try:
+                gray = self._clahe.apply(gray, dst=gray)
+                self.metrics.observe('clahe', time.perf_counter() - t1)
+            except Exception:
+                # Si CLAHE falla, continuar con la imagen en gris
+                pass
+        # Fuera del polígono/banda la imagen queda en negro
+        if roi_mask is not None:
+            cv2.bitwise_and(gray, roi_mask, dst=gray)
+        return gray
+
+    def _process_detections(self, frame, tags, current_time, roi_rect, dequeued_at=None):
+        """Aplicar filtros, confirmación y lógica de cruce a las detecciones de un frame,
+        y entregar el frame con overlay al preview si hay visores."""
+        rx0, ry0, rx1, ry1 = roi_rect
+        metrics = self.metrics
+        t_start = time.perf_counter()
+        # Tiempo dedicado a dibujar y al callback (se descuenta de 'filter')
+        t_draw = 0.0
+        t_callback = 0.0
+        self.frames_processed += 1
+        metrics.inc('frames_processed')
+        if tags:
+            self._dbg('detection', f"Detected {len(tags)} tags")
+            metrics.inc('detections', len(tags))
+        # Guardar el frame limpio (antes del overlay) para el photo-finish
+        if self.photo_finish is not None:
+            self.photo_finish.push(frame, current_time)
+
+        # Solo preparar el overlay si el preview va a usar este frame: dibujado
+        # sobre el frame (modo 'server') o como metadatos para el navegador ('client')
+        draw = self.preview.wants_frame()
+        burn = draw and self.overlay_mode != 'client'
+        overlay = {} if (draw and not burn and self.on_overlay_callback is not None) else None
+
+        # Visualización: Dibujar línea de meta
+        if burn:
+            t0 = time.perf_counter()
             try:
                 cv2.line(frame, self.finish_line[0], self.finish_line[1], (0, 255, 0), 2)
             except Exception as e:
                 logger.exception(f"Error dibujando línea de meta con finish_line={self.finish_line}: {e}")
+            if self.detection_region.mode != 'full':
+                cv2.rectangle(frame, (rx0, ry0), (rx1 - 1, ry1 - 1), (128, 128, 128), 1)
+            t_draw += time.perf_counter() - t0
+
+        state = self.tag_state
+        batch = detection_batch(tags)
+        ids = batch.ids
+        # Filtros básicos por lotes sobre todas las detecciones del frame:
+        # decision_margin, hamming, área del polígono y tags permitidos
+        in_range = state.in_range(ids)
+        ok_margin = batch.margins >= self.min_decision_margin
+        ok_hamming = batch.hamming <= self.max_hamming
+        ok_area = (batch.areas == 0) | (batch.areas >= self.min_tag_area)
+        quality = in_range & ok_margin & ok_hamming & ok_area
+        accepted = quality & state.allowed[np.where(in_range, ids, 0)]
+        # Una detección de baja calidad reinicia la confirmación de su tag
+        state.detection_counts[ids[in_range & ~quality]] = 0
+        # Tags no permitidos: solo actualizar la última vista para evitar ruido repetido
+        blocked = quality & ~accepted
+        state.seen_pos[ids[blocked]] = batch.centers[blocked]
+        state.seen_time[ids[blocked]] = current_time
+        if len(ids) and not accepted.all():
+            # Contadores por motivo, con la misma precedencia que el log de debug
+            for reason, mask in (
+                ('family', ~in_range),
+                ('decision_margin', in_range & ~ok_margin),
+                ('hamming', in_range & ok_margin & ~ok_hamming),
+                ('area', in_range & ok_margin & ok_hamming & ~ok_area),
+                ('allowed', blocked),
+            ):
+                n = int(np.count_nonzero(mask))
+                if n:
+                    metrics.inc('detections_filtered', n, reason=reason)
+        if self._dbg_on('filter'):
+            for i in np.flatnonzero(~accepted):
+                if not in_range[i]:
+                    reason = "fuera de la familia tag16h5"
+                elif not ok_margin[i]:
+                    reason = f"baja decision_margin={batch.margins[i]}"
+                elif not ok_hamming[i]:
+                    reason = f"hamming={batch.hamming[i]}"
+                elif not ok_area[i]:
+                    reason = f"area pequeña={batch.areas[i]}"
+                else:
+                    reason = "no está en allowed_tags"
+                self._dbg('filter', f"Tag {ids[i]} ignorado por {reason}")
+
+        for i in np.flatnonzero(accepted):
+            tag = tags[i]
+            tag_id = int(ids[i])
+            # Posición en subpíxel para la interpolación del cruce; entera para dibujar
+            center_f = (float(batch.centers[i, 0]), float(batch.centers[i, 1]))
+            center = (int(center_f[0]), int(center_f[1]))
+
+            # Contador de frames consecutivos para confirmar detección
+            state.detection_counts[tag_id] += 1
+            if overlay is not None:
+                overlay[tag_id] = {
+                    'id': tag_id,
+                    'corners': np.round(np.asarray(tag.corners, dtype=np.float64), 1).tolist(),
+                    'center': [round(center_f[0], 1), round(center_f[1], 1)],
+                    'confirmed': bool(state.detection_counts[tag_id] >= self.min_detection_frames),
+                    'crossed': False,
+                }
+            if state.detection_counts[tag_id] < self.min_detection_frames:
+                self._dbg('detection', f"Tag {tag_id} visto {state.detection_counts[tag_id]} / {self.min_detection_frames} frames, esperando confirmación")
+                # Actualizar última posición vista pero no la confirmada
+                state.seen_pos[tag_id] = center_f
+                state.seen_time[tag_id] = current_time
+                # Intento fallback para pases rápidos: si existe una posición confirmada
+                # reciente y la ventana de tiempo es pequeña, comprobar intersección
+                if self.allow_quick_pass:
+                    prev_time = float(state.confirmed_time[tag_id])
+                    # Si la confirmada fue reciente (no hace mucho desde prev_time); NaN = ninguna
+                    if (current_time - prev_time) <= self.quick_pass_time:
+                        prev_center = (float(state.confirmed_pos[tag_id, 0]), float(state.confirmed_pos[tag_id, 1]))
+                        try:
+                            frac = self._crossing_fraction(prev_center, center_f, self.finish_line[0], self.finish_line[1])
+                            self._dbg('intersection', f"Quick-pass intersection for tag {tag_id}: prev={prev_center}, now={center_f}, crossed={frac is not None}, t={frac}")
+                        except Exception as e:
+                            logger.exception(f"Error quick-pass intersection for tag {tag_id}: {e}")
+                            frac = None
+
+                        if frac is not None:
+                            # Instante del cruce interpolado entre las dos capturas
+                            crossing_time = prev_time + frac * (current_time - prev_time)
+                            last_lap = float(state.lap_timers[tag_id])
+                            # Debounce check
+                            if (crossing_time - last_lap) > self.min_lap_time:
+                                lap_duration = crossing_time - last_lap
+                                state.lap_timers[tag_id] = crossing_time
+                                logger.info(f"Tag {tag_id} quick-pass lap detected. duration={lap_duration:.3f}s")
+                                if last_lap > 0 and self.on_lap_callback and self.enabled:
+                                    t0 = time.perf_counter()
+                                    try:
+                                        self._dbg('callback', f"Invocando callback (quick-pass) para tag {tag_id}")
+                                        self.on_lap_callback(tag_id, lap_duration)
+                                        metrics.inc('laps')
+                                    except Exception as e:
+                                        metrics.inc('lap_callback_errors')
+                                        logger.exception(f"Error en on_lap_callback quick-pass para tag {tag_id}: {e}")
+                                    elapsed = time.perf_counter() - t0
+                                    metrics.observe('lap_callback', elapsed)
+                                    t_callback += elapsed
+                                if overlay is not None:
+                                    overlay[tag_id]['crossed'] = True
+                            # Actualizar confirmada y continuar
+                            state.confirmed_pos[tag_id] = center_f
+                            state.confirmed_time[tag_id] = current_time
+                            # reset contador
+                            state.detection_counts[tag_id] = 0
+                            continue
 
-            detected_this_frame = set()
-            for tag in tags:
-                tag_id = tag.tag_id
-                detected_this_frame.add(tag_id)
-                # filtros básicos: decision_margin, hamming, área del polígono
-                try:
-                    dm = getattr(tag, 'decision_margin', None)
-                    ham = getattr(tag, 'hamming', None)
-                    corners = getattr(tag, 'corners', None)
-                except Exception:
-                    dm = None; ham = None; corners = None
-
-                # Calcular área si tenemos corners
-                area = 0
-                if corners is not None:
-                    try:
-                        pts = [(float(p[0]), float(p[1])) for p in corners]
-                        # shoelace
-                        a = 0.0
-                        for i in range(len(pts)):
-                            x1, y1 = pts[i]
-                            x2, y2 = pts[(i+1) % len(pts)]
-                            a += x1*y2 - x2*y1
-                        area = abs(a) / 2.0
-                    except Exception:
-                        area = 0
-
-                if dm is not None and dm < self.min_decision_margin:
-                    self._dbg('filter', f"Tag {tag_id} ignorado por baja decision_margin={dm}")
-                    self.detection_counts[int(tag_id)] = 0
-                    continue
-                if ham is not None and ham > self.max_hamming:
-                    self._dbg('filter', f"Tag {tag_id} ignorado por hamming={ham}")
-                    self.detection_counts[int(tag_id)] = 0
-                    continue
-                if area and area < self.min_tag_area:
-                    self._dbg('filter', f"Tag {tag_id} ignorado por area pequeña={area}")
-                    self.detection_counts[int(tag_id)] = 0
-                    continue
-                # Filtrar tags no permitidos si se ha provisto una lista
-                try:
-                    if self.allowed_tags is not None and int(tag_id) not in self.allowed_tags:
-                        self._dbg('filter', f"Tag {tag_id} ignorado: no está en allowed_tags")
-                        # Actualizar última vista para evitar ruido repetido
-                        self.last_seen[tag_id] = ((int(tag.center[0]), int(tag.center[1])), current_time)
-                        continue
-                except Exception:
-                    # En caso de problemas al castear/comprobar, seguir procesando normalmente
-                    logger.exception(f"Error comprobando allowed_tags para tag {tag_id}")
-                    pass
-                center = (int(tag.center[0]), int(tag.center[1]))
-
-                # Contador de frames consecutivos para confirmar detección
-                self.detection_counts[tag_id] = self.detection_counts.get(tag_id, 0) + 1
-                if self.detection_counts.get(tag_id, 0) < self.min_detection_frames:
-                    self._dbg('detection', f"Tag {tag_id} visto {self.detection_counts.get(tag_id)} / {self.min_detection_frames} frames, esperando confirmación")
-                    # Actualizar última posición vista pero no la confirmada
-                    self.last_seen[tag_id] = (center, current_time)
-                    # Intento fallback para pases rápidos: si existe una posición confirmada
-                    # reciente y la ventana de tiempo es pequeña, comprobar intersección
-                    if self.allow_quick_pass:
-                        prev = self.last_confirmed.get(tag_id)
-                        if prev is not None:
-                            prev_center, prev_time = prev
-                            # Si la confirmada fue reciente (no hace mucho desde prev_time)
-                            if (current_time - prev_time) <= self.quick_pass_time:
-                                try:
-                                    crossed_quick = self._intersect(prev_center, center, self.finish_line[0], self.finish_line[1])
-                                    self._dbg('intersection', f"Quick-pass intersection for tag {tag_id}: prev={prev_center}, now={center}, crossed={crossed_quick}")
-                                except Exception as e:
-                                    logger.exception(f"Error quick-pass intersection for tag {tag_id}: {e}")
-                                    crossed_quick = False
-
-                                if crossed_quick:
-                                    last_lap = self.lap_timers.get(tag_id, 0)
-                                    # Debounce check
-                                    if (current_time - last_lap) > self.min_lap_time:
-                                        lap_duration = current_time - last_lap
-                                        self.lap_timers[tag_id] = current_time
-                                        logger.info(f"Tag {tag_id} quick-pass lap detected. duration={lap_duration:.3f}s")
-                                        if last_lap > 0 and self.on_lap_callback and self.enabled:
-                                            try:
-                                                self._dbg('callback', f"Invocando callback (quick-pass) para tag {tag_id}")
-                                                self.on_lap_callback(tag_id, lap_duration)
-                                            except Exception as e:
-                                                logger.exception(f"Error en on_lap_callback quick-pass para tag {tag_id}: {e}")
-                                    # Actualizar confirmada y continuar
-                                    self.last_confirmed[tag_id] = (center, current_time)
-                                    # reset contador
-                                    self.detection_counts[tag_id] = 0
-                                    continue
-
-                    # No dibujar nada hasta estar confirmado para evitar falsos positivos visibles
-                    continue
+                # No dibujar nada hasta estar confirmado para evitar falsos positivos visibles
+                continue
 
-                # Ahora el tag está confirmado: dibujar contorno usando corners si están disponibles
+            # Ahora el tag está confirmado: dibujar contorno usando corners si están disponibles
+            if burn:
+                t0 = time.perf_counter()
                 try:
-                    corners = getattr(tag, 'corners', None)
-                    if corners is not None:
-                        pts = np.array([[int(p[0]), int(p[1])] for p in corners], dtype=np.int32)
-                        cv2.polylines(frame, [pts], True, (0, 255, 0), 2)
+                    pts = np.asarray(tag.corners).astype(np.int32)
+                    cv2.polylines(frame, [pts], True, (0, 255, 0), 2)
                 except Exception:
                     # fallback: dibujar centro
                     cv2.circle(frame, center, 4, (0, 0, 255), -1)
@@ -419,90 +818,124 @@ class RaceSystem:
                                 cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
                 except Exception:
                     pass
+                t_draw += time.perf_counter() - t0
+
+            # Lógica de Vuelta: usar la última posición confirmada como 'prev'
+            prev_time = float(state.confirmed_time[tag_id])
+            # NaN (ninguna) o demasiado antigua: el tag salió de la región y volvió a
+            # entrar, así que el segmento prev->actual no es una trayectoria real
+            if not (current_time - prev_time) <= self.max_track_gap:
+                # No hay posición previa confirmada reciente: establecer la actual y continuar
+                state.confirmed_pos[tag_id] = center_f
+                state.confirmed_time[tag_id] = current_time
+                continue
 
-                # Lógica de Vuelta: usar la última posición confirmada como 'prev'
-                prev = self.last_confirmed.get(tag_id)
-                if prev is None:
-                    # No hay posición previa confirmada: establecer la confirmada actual y continuar
-                    self.last_confirmed[tag_id] = (center, current_time)
-                    continue
-
-                prev_center, prev_time = prev
+            prev_center = (float(state.confirmed_pos[tag_id, 0]), float(state.confirmed_pos[tag_id, 1]))
 
-                # Verificar si cruzó la línea virtual
-                try:
-                    crossed = self._intersect(prev_center, center, self.finish_line[0], self.finish_line[1])
-                    self._dbg('intersection', f"Intersección check for tag {tag_id}: prev={prev_center}, now={center}, line={self.finish_line}, crossed={crossed}")
-                except Exception as e:
-                    logger.exception(f"Error comprobando intersección para tag {tag_id}: {e}")
-                    crossed = False
-
-                if crossed:
-                    last_lap = self.lap_timers.get(tag_id, 0)
-                    logger.info(f"Tag {tag_id} cruzó la línea. prev={prev_center} now={center} last_lap={last_lap}")
-
-                    # Debounce check
-                    if (current_time - last_lap) > self.min_lap_time:
-                        lap_duration = current_time - last_lap
-                        self.lap_timers[tag_id] = current_time
-                        logger.info(f"Tag {tag_id} lap detected. duration={lap_duration:.3f}s")
-
-                        # Si no es la primera detección (salida), registrar vuelta
-                        if last_lap > 0 and self.on_lap_callback and self.enabled:
-                            try:
-                                self._dbg('callback', f"Invocando callback de vuelta para tag {tag_id}")
-                                self.on_lap_callback(tag_id, lap_duration)
-                                # Feedback visual en el frame
-                                cv2.circle(frame, center, 15, (255, 255, 0), -1)
-                            except Exception as e:
-                                logger.exception(f"Error en on_lap_callback para tag {tag_id}: {e}")
-                    else:
-                        # Caso: debounce (muy próxima a la última vuelta)
-                        if last_lap == 0:
-                            # Primera detección (Start)
-                            self.lap_timers[tag_id] = current_time
-                            logger.info(f"Tag {tag_id} primer cruce detectado (inicio), timestamp registrado")
-                        else:
-                            logger.debug(f"Tag {tag_id} cruce ignorado por debounce: {current_time - last_lap:.3f}s desde última")
-
-                # Actualizar posición confirmada para el siguiente frame
-                self.last_confirmed[tag_id] = (center, current_time)
-
-            # Reseteo de counters para tags que no aparecieron este frame
+            # Verificar si cruzó la línea virtual
             try:
-                for tid in list(self.detection_counts.keys()):
-                    if tid not in detected_this_frame:
-                        self.detection_counts[tid] = 0
-            except Exception:
-                pass
+                frac = self._crossing_fraction(prev_center, center_f, self.finish_line[0], self.finish_line[1])
+                self._dbg('intersection', f"Intersección check for tag {tag_id}: prev={prev_center}, now={center_f}, line={self.finish_line}, crossed={frac is not None}, t={frac}")
+            except Exception as e:
+                logger.exception(f"Error comprobando intersección para tag {tag_id}: {e}")
+                frac = None
+
+            if frac is not None:
+                # Instante del cruce interpolado entre las dos capturas (sub-frame)
+                crossing_time = prev_time + frac * (current_time - prev_time)
+                last_lap = float(state.lap_timers[tag_id])
+                logger.info(f"Tag {tag_id} cruzó la línea. prev={prev_center} now={center_f} t={frac:.3f} last_lap={last_lap}")
+
+                # Debounce check
+                if (crossing_time - last_lap) > self.min_lap_time:
+                    lap_duration = crossing_time - last_lap
+                    state.lap_timers[tag_id] = crossing_time
+                    logger.info(f"Tag {tag_id} lap detected. duration={lap_duration:.3f}s")
+
+                    # Si no es la primera detección (salida), registrar vuelta
+                    if last_lap > 0 and self.on_lap_callback and self.enabled:
+                        t0 = time.perf_counter()
+                        try:
+                            self._dbg('callback', f"Invocando callback de vuelta para tag {tag_id}")
+                            self.on_lap_callback(tag_id, lap_duration)
+                            metrics.inc('laps')
+                        except Exception as e:
+                            metrics.inc('lap_callback_errors')
+                            logger.exception(f"Error en on_lap_callback para tag {tag_id}: {e}")
+                        elapsed = time.perf_counter() - t0
+                        metrics.observe('lap_callback', elapsed)
+                        t_callback += elapsed
+                        # Feedback visual en el frame
+                        if burn:
+                            cv2.circle(frame, center, 15, (255, 255, 0), -1)
+                        elif overlay is not None:
+                            overlay[tag_id]['crossed'] = True
+                else:
+                    # Caso: debounce (muy próxima a la última vuelta)
+                    if last_lap == 0:
+                        # Primera detección (Start)
+                        state.lap_timers[tag_id] = crossing_time
+                        logger.info(f"Tag {tag_id} primer cruce detectado (inicio), timestamp registrado")
+                    else:
+                        logger.debug(f"Tag {tag_id} cruce ignorado por debounce: {crossing_time - last_lap:.3f}s desde última")
+
+            # Actualizar posición confirmada para el siguiente frame
+            state.confirmed_pos[tag_id] = center_f
+            state.confirmed_time[tag_id] = current_time
 
-            # Comprimir frame para streaming MJPEG
+        # Reseteo de counters para tags que no aparecieron este frame (una sola máscara)
+        state.reset_missing_counts(ids[in_range])
+        metrics.observe('filter', time.perf_counter() - t_start - t_draw - t_callback)
+
+        # Entregar el frame al hilo de preview (la codificación JPEG ocurre allí)
+        if draw:
+            t0 = time.perf_counter()
             # Dibujar contador de FPS en la esquina superior izquierda
             try:
-                if self.fps_ema is not None:
+                if burn and self.fps_ema is not None:
                     cv2.putText(frame, f"FPS:{self.fps_ema:.1f}", (8, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
             except Exception:
                 pass
-
-            with self.lock:
-                _, buffer = cv2.imencode('.jpg', frame)
-                self.frame_out = buffer.tobytes()
-            # Actualizar FPS EMA (después de procesar/encoder)
+            self.preview.submit(frame)
+            metrics.observe('draw', t_draw + time.perf_counter() - t0)
+        if overlay is not None:
+            # Overlay en el navegador: metadatos del frame que acaba de entrar al preview.
+            # No lleva número de frame: el <img> MJPEG no dice qué frame muestra, así
+            # que el cliente dibuja siempre el último overlay recibido
             try:
-                if self._last_frame_time is None:
-                    self._last_frame_time = current_time
+                self.on_overlay_callback({
+                    't': round(float(current_time), 6),
+                    'size': [int(frame.shape[1]), int(frame.shape[0])],
+                    'finish_line': [list(p) for p in self.finish_line],
+                    'roi': [int(v) for v in roi_rect] if self.detection_region.mode != 'full' else None,
+                    'fps': round(self.fps_ema, 1) if self.fps_ema is not None else None,
+                    'tags': list(overlay.values()),
+                })
+            except Exception as e:
+                logger.exception(f"Error en on_overlay_callback: {e}")
+        # Actualizar FPS EMA (después de procesar/encoder)
+        try:
+            if self._last_frame_time is None:
+                self._last_frame_time = current_time
+            else:
+                dt = max(1e-6, current_time - self._last_frame_time)
+                inst_fps = 1.0 / dt
+                if self.fps_ema is None:
+                    self.fps_ema = inst_fps
                 else:
-                    dt = max(1e-6, current_time - self._last_frame_time)
-                    inst_fps = 1.0 / dt
-                    if self.fps_ema is None:
-                        self.fps_ema = inst_fps
-                    else:
-                        self.fps_ema = (1.0 - self._fps_alpha) * self.fps_ema + self._fps_alpha * inst_fps
-                    self._last_frame_time = current_time
-            except Exception:
-                pass
-            # Pequeña pausa para no saturar la CPU
-            time.sleep(0.005)
+                    self.fps_ema = (1.0 - self._fps_alpha) * self.fps_ema + self._fps_alpha * inst_fps
+                self._last_frame_time = current_time
+        except Exception:
+            pass
+
+        latency = (time.monotonic() - dequeued_at) if dequeued_at is not None else None
+        if latency is not None:
+            metrics.observe('frame', latency)
+        if self.on_frame_callback is not None:
+            try:
+                self.on_frame_callback(current_time, tags, latency)
+            except Exception as e:
+                logger.exception(f"Error en on_frame_callback: {e}")
 
     def stop(self):
         """Detener el hilo y liberar la cámara."""
@@ -510,6 +943,12 @@ class RaceSystem:
         self.enabled = False
         # Marcar para que el hilo termine
         self.running = False
+        # Despertar al hilo de detección si está esperando frames
+        try:
+            if self._ring is not None:
+                self._ring.close()
+        except Exception:
+            pass
         # Liberar la cámara lo antes posible para desbloquear read()
         try:
             if self.cap:
@@ -536,13 +975,38 @@ class RaceSystem:
         except Exception:
             pass
 
-        # Esperar al hilo (con timeout corto)
         try:
-            if self._thread and self._thread.is_alive():
-                self._thread.join(timeout=1.0)
+            self.preview.stop()
         except Exception:
             pass
 
+        # Esperar a los hilos (con timeout corto)
+        for th in (self._capture_thread, self._thread):
+            try:
+                if th and th.is_alive():
+                    th.join(timeout=1.0)
+            except Exception:
+                pass
+
+    def set_finish_line(self, finish_line):
+        """Actualizar la línea de meta y la región de detección asociada."""
+        fl = tuple((int(p[0]), int(p[1])) for p in finish_line)
+        self.finish_line = fl
+        self.detection_region.set_finish_line(fl)
+        logger.info(f"finish_line actualizada: {fl}")
+
+    def last_crossing_time(self, tag_id):
+        """Timestamp de captura (reloj monotónico) del último cruce del tag, o None."""
+        try:
+            t = float(self.tag_state.lap_timers[int(tag_id)])
+        except (IndexError, ValueError, TypeError):
+            return None
+        return t or None
+
+    def reset_lap_timers(self):
+        """Olvidar el último cruce de todos los tags (nueva sesión)."""
+        self.tag_state.reset_laps()
+
     def set_allowed_tags(self, tags):
         """Establecer el conjunto de tag IDs permitidos.
 
@@ -554,6 +1018,7 @@ class RaceSystem:
             else:
                 # Normalizar a set de ints
                 self.allowed_tags = set(int(t) for t in tags)
+            self.tag_state.set_allowed(self.allowed_tags)
             logger.info(f"allowed_tags actualizado: {self.allowed_tags}")
         except Exception as e:
             logger.exception(f"Error estableciendo allowed_tags: {e}")
@@ -562,14 +1027,22 @@ class RaceSystem:
         """Devolver la configuración relevante del detector para mostrar/editar en UI."""
         try:
             return {
-                'quad_decimate': getattr(self.at_detector, 'quad_decimate', None) if hasattr(self.at_detector, 'quad_decimate') else None,
-                'quad_sigma': getattr(self.at_detector, 'quad_sigma', None) if hasattr(self.at_detector, 'quad_sigma') else None,
-                'decode_sharpening': getattr(self.at_detector, 'decode_sharpening', None) if hasattr(self.at_detector, 'decode_sharpening') else None,
+                'quad_decimate': self.detector_params.get('quad_decimate'),
+                'quad_sigma': self.detector_params.get('quad_sigma'),
+                'decode_sharpening': self.detector_params.get('decode_sharpening'),
+                'clahe_clip_limit': self.clahe_clip_limit,
+                'detector_workers': self.detector_workers,
+                **self.tag_tracker.to_dict(),
+                'preview_fps': self.preview.fps,
+                'preview_jpeg_quality': self.preview.quality,
+                'preview_overlay': self.overlay_mode,
                 'min_tag_area': self.min_tag_area,
                 'min_decision_margin': self.min_decision_margin,
                 'min_detection_frames': self.min_detection_frames,
                 'allow_quick_pass': bool(self.allow_quick_pass),
-                'quick_pass_time': float(self.quick_pass_time)
+                'quick_pass_time': float(self.quick_pass_time),
+                'max_track_gap': float(self.max_track_gap),
+                **self.detection_region.to_dict()
             }
         except Exception as e:
             logger.exception(f"Error obteniendo detector config: {e}")
@@ -579,8 +1052,10 @@ class RaceSystem:
         """Aplicar configuración al detector en caliente.
 
         cfg puede contener: quad_decimate, quad_sigma, decode_sharpening,
-        min_tag_area, min_decision_margin, min_detection_frames,
-        allow_quick_pass, quick_pass_time
+        clahe_clip_limit (0 = sin CLAHE), min_tag_area, min_decision_margin, min_detection_frames,
+        allow_quick_pass, quick_pass_time, max_track_gap, roi_mode, roi_band, roi_polygon,
+        tracker_enabled, tracker_full_scan_interval, preview_fps, preview_jpeg_quality,
+        preview_overlay ('server' o 'client')
         """
         try:
             # Normalizar y aplicar umbrales locales
@@ -607,11 +1082,11 @@ class RaceSystem:
             ds_v = _f(ds)
 
             # Revisar si hay que recrear el detector (parámetros de construcción cambiaron)
-            if qd_v is not None and qd_v != getattr(self.at_detector, 'quad_decimate', None):
+            if qd_v is not None and qd_v != self.detector_params.get('quad_decimate'):
                 changed_detector = True
-            if qs_v is not None and qs_v != getattr(self.at_detector, 'quad_sigma', None):
+            if qs_v is not None and qs_v != self.detector_params.get('quad_sigma'):
                 changed_detector = True
-            if ds_v is not None and ds_v != getattr(self.at_detector, 'decode_sharpening', None):
+            if ds_v is not None and ds_v != self.detector_params.get('decode_sharpening'):
                 changed_detector = True
 
             # Aplicar ajustes no relacionados con la instancia del detector
@@ -634,26 +1109,57 @@ class RaceSystem:
             qpt = _f(cfg.get('quick_pass_time'))
             if qpt is not None:
                 self.quick_pass_time = float(qpt)
+            mtg = _f(cfg.get('max_track_gap'))
+            if mtg is not None:
+                self.max_track_gap = max(0.0, mtg)
+            ccl = _f(cfg.get('clahe_clip_limit'))
+            if ccl is not None and ccl != self.clahe_clip_limit:
+                self.clahe_clip_limit = max(0.0, ccl)
+                self._clahe = self._make_clahe(self.clahe_clip_limit)
+
+            # Región de detección (roi_polygon: lista de [x, y])
+            roi_mode = cfg.get('roi_mode')
+            roi_band = _i(cfg.get('roi_band'))
+            roi_polygon = cfg.get('roi_polygon')
+            if roi_mode is not None or roi_band is not None or roi_polygon is not None:
+                try:
+                    self.detection_region.configure(mode=roi_mode, band=roi_band, polygon=roi_polygon)
+                except Exception as e:
+                    logger.exception(f"Error configurando región de detección: {e}")
+
+            # Detección por ventanas guiada por el tracker
+            te = cfg.get('tracker_enabled')
+            if te is not None:
+                if isinstance(te, str):
+                    te = te.lower() in ('1', 'true', 'yes', 'on')
+                self.tag_tracker.enabled = bool(te)
+                self.tag_tracker.reset()
+            tfs = _i(cfg.get('tracker_full_scan_interval'))
+            if tfs is not None:
+                self.tag_tracker.full_scan_interval = max(1, tfs)
+
+            # Preview MJPEG
+            self.preview.configure(fps=_f(cfg.get('preview_fps')), quality=_i(cfg.get('preview_jpeg_quality')))
+            overlay_mode = cfg.get('preview_overlay')
+            if overlay_mode in ('server', 'client'):
+                self.overlay_mode = overlay_mode
 
             # Si hay cambios que requieren recrear el Detector, hacerlo ahora
             if changed_detector:
                 # Construir parámetros basados en actuales y valores nuevos
-                new_qd = qd_v if qd_v is not None else getattr(self.at_detector, 'quad_decimate', 1)
-                new_qs = qs_v if qs_v is not None else getattr(self.at_detector, 'quad_sigma', 0.0)
-                new_ds = ds_v if ds_v is not None else getattr(self.at_detector, 'decode_sharpening', 0.25)
+                new_qd = qd_v if qd_v is not None else self.detector_params.get('quad_decimate', 1)
+                new_qs = qs_v if qs_v is not None else self.detector_params.get('quad_sigma', 0.0)
+                new_ds = ds_v if ds_v is not None else self.detector_params.get('decode_sharpening', 0.25)
 
                 try:
-                    new_detector = Detector(
-                        families='tag16h5',
-                        nthreads=4,
-                        quad_decimate=new_qd,
-                        quad_sigma=new_qs,
-                        refine_edges=1,
-                        decode_sharpening=new_ds,
-                        debug=0
-                    )
+                    params = dict(self.detector_params, quad_decimate=new_qd, quad_sigma=new_qs, decode_sharpening=new_ds)
+                    new_detector = Detector(**params)
                     # Asignar de forma atómica; detect() en curso puede terminar sin problemas
                     self.at_detector = new_detector
+                    self.detector_params = params
+                    pool = self._detector_pool
+                    if pool is not None:
+                        pool.update_params(self._worker_detector_params())
                     logger.info(f"Detector recreado con quad_decimate={new_qd} quad_sigma={new_qs} decode_sharpening={new_ds}")
                 except Exception as e:
                     logger.exception(f"Error recreando detector con nuevos parámetros: {e}")
@@ -757,6 +1263,9 @@ class RaceSystem:
             result['error'] = str(e)
             return result
 
-    def get_frame(self):
-        with self.lock:
-            return self.frame_out
\ No newline at end of file
+    def wait_finished(self, timeout=None):
+        """Esperar a que el procesado termine (fuente agotada o stop())."""
+        return self._finished.wait(timeout)
+
+    def get_frame(self, profile=None):
+        return self.preview.get_frame(profile)
\ No newline at end of file
@@ -0,0 +1,256 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from collections import namedtuple, deque
+import queue
+import time
+import logging
+import numpy as np
+from src.detection_region import detect_in_rects
+
+logger = logging.getLogger(__name__)
+
+# Resultado entregado en orden: `seq` es el número de envío al pool, `tags`
+# la lista de TagDetection y `meta` lo que el llamante pasó en `submit()`.
+PoolResult = namedtuple('PoolResult', ['seq', 'tags', 'meta'])
+
+
+def _worker_main(shm_name, slots, slot_size, detector_params, tasks, results):
+    """Proceso detector: cada uno posee su propia instancia de `Detector`."""
+    from pupil_apriltags import Detector
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        flat = np.ndarray((slots, slot_size), dtype=np.uint8, buffer=shm.buf)
+        detector = Detector(**detector_params)
+        while True:
+            msg = tasks.get()
+            if msg is None:
+                break
+            if msg[0] == 'params':
+                detector = Detector(**msg[1])
+                continue
+            _, seq, slot, shape, origin, rects = msg
+            h, w = shape
+            gray = flat[slot, :h * w].reshape(h, w)
+            try:
+                tags = detect_in_rects(detector, gray, origin, rects)
+            except Exception:
+                tags = []
+            results.put((seq, tags))
+        del flat
+    finally:
+        shm.close()
+
+
+class DetectorPool:
+    """Pool de procesos detectores con frames en memoria compartida.
+
+    El hilo de detección reserva un slot (`acquire()`), escribe en él la
+    imagen en gris preprocesada (`gray_view()`), la envía (`submit()`) y
+    recoge los resultados con `collect()`, que los devuelve reordenados por
+    número de secuencia. El slot se libera con `release()` una vez procesado.
+    Todos los métodos se llaman desde un único hilo.
+
+    Un worker que muere (segfault, OOM) se detecta al recoger resultados: se
+    arranca otro en su lugar y sus trabajos se reenvían (hasta `max_retries`
+    veces cada uno; después se entregan sin detecciones). Un trabajo sin
+    resultado tras `result_timeout` se entrega vacío para no bloquear el
+    orden, pero su slot no vuelve a quedar libre hasta que llega el resultado
+    tardío o muere el worker, porque este aún puede estar leyéndolo.
+    """
+
+    def __init__(self, workers, frame_shape, detector_params, slots=None,
+                 result_timeout=5.0, start_method='spawn', max_retries=1):
+        self.workers = max(1, int(workers))
+        self.slots = max(self.workers, int(slots or self.workers * 2))
+        self.result_timeout = float(result_timeout)
+        self.max_retries = max(0, int(max_retries))
+        self.restarts = 0
+        h, w = int(frame_shape[0]), int(frame_shape[1])
+        self._slot_size = h * w
+
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slots * self._slot_size)
+        self._flat = np.ndarray((self.slots, self._slot_size), dtype=np.uint8, buffer=self._shm.buf)
+        self._shapes = [None] * self.slots
+        self._free = deque(range(self.slots))
+
+        self._ctx = mp.get_context(start_method)
+        self._detector_params = dict(detector_params)
+        self._results = self._ctx.Queue()
+        self._tasks = [None] * self.workers
+        self._procs = [None] * self.workers
+        self._inflight = [0] * self.workers
+        for i in range(self.workers):
+            self._spawn(i)
+
+        self._next_submit = 0
+        self._next_emit = 0
+        # seq -> [meta, worker, submit_time, mensaje, reenvíos]
+        self._pending = {}
+        # seq -> tags ya recibidos pero aún no entregados en orden
+        self._done = {}
+        # seq -> (worker, slot) entregados vacíos por timeout y aún sin resultado
+        self._abandoned = {}
+        # Slots retenidos por un trabajo abandonado y, de ellos, los ya liberados por el llamante
+        self._held = set()
+        self._held_released = set()
+        logger.info(f"DetectorPool iniciado: workers={self.workers} slots={self.slots} frame={w}x{h}")
+
+    def _spawn(self, worker):
+        q = self._ctx.Queue()
+        p = self._ctx.Process(
+            target=_worker_main,
+            args=(self._shm.name, self.slots, self._slot_size, self._detector_params, q, self._results),
+            daemon=True,
+        )
+        p.start()
+        self._tasks[worker] = q
+        self._procs[worker] = p
+        self._inflight[worker] = 0
+
+    @property
+    def pending(self):
+        """Trabajos enviados cuyo resultado aún no se ha entregado."""
+        return len(self._pending)
+
+    def acquire(self):
+        """Reservar un slot libre o devolver None si todos están en vuelo."""
+        return self._free.popleft() if self._free else None
+
+    def release(self, slot):
+        if slot in self._held:
+            # Un worker aún puede leerlo: se libera al llegar su resultado o al morir
+            self._held_released.add(slot)
+            return
+        self._free.append(slot)
+
+    def _unhold(self, slot):
+        self._held.discard(slot)
+        if slot in self._held_released:
+            self._held_released.discard(slot)
+            self._free.append(slot)
+
+    def gray_view(self, slot, shape):
+        """Vista contigua (h, w) del slot en memoria compartida."""
+        h, w = int(shape[0]), int(shape[1])
+        self._shapes[slot] = (h, w)
+        return self._flat[slot, :h * w].reshape(h, w)
+
+    def submit(self, slot, origin=(0, 0), meta=None, rects=None):
+        """Encolar la detección del slot en el worker menos cargado."""
+        seq = self._next_submit
+        self._next_submit += 1
+        msg = ('detect', seq, slot, self._shapes[slot], tuple(origin), rects)
+        self._pending[seq] = [meta, None, time.monotonic(), msg, 0]
+        self._dispatch(seq)
+        return seq
+
+    def _dispatch(self, seq):
+        entry = self._pending[seq]
+        worker = min(range(self.workers), key=lambda i: self._inflight[i])
+        self._inflight[worker] += 1
+        entry[1] = worker
+        self._tasks[worker].put(entry[3])
+
+    def update_params(self, detector_params):
+        """Recrear el Detector de cada worker con nuevos parámetros."""
+        self._detector_params = dict(detector_params)
+        for q in self._tasks:
+            q.put(('params', dict(detector_params)))
+
+    def _check_workers(self):
+        """Reemplazar los workers muertos y reenviar sus trabajos."""
+        for worker, p in enumerate(self._procs):
+            if p.is_alive():
+                continue
+            logger.error(f"DetectorPool: worker {worker} caído (exitcode={p.exitcode}), se reinicia")
+            self.restarts += 1
+            for seq, (w, slot) in list(self._abandoned.items()):
+                if w == worker:
+                    del self._abandoned[seq]
+                    self._unhold(slot)
+            self._spawn(worker)
+            for seq in sorted(self._pending):
+                entry = self._pending[seq]
+                if entry[1] != worker or seq in self._done:
+                    continue
+                entry[4] += 1
+                if entry[4] > self.max_retries:
+                    logger.warning(f"DetectorPool: seq={seq} descartado tras {self.max_retries} reenvíos")
+                    self._done[seq] = []
+                    continue
+                self._dispatch(seq)
+
+    def _drain(self, timeout=0.0):
+        self._check_workers()
+        try:
+            if timeout and timeout > 0:
+                msg = self._results.get(timeout=timeout)
+            else:
+                msg = self._results.get_nowait()
+        except queue.Empty:
+            return
+        while True:
+            seq, tags = msg
+            entry = self._pending.get(seq)
+            if entry is not None and seq not in self._done:
+                self._inflight[entry[1]] -= 1
+                self._done[seq] = tags
+            elif seq in self._abandoned:
+                # Resultado tardío: el worker ya no lee el slot
+                worker, slot = self._abandoned.pop(seq)
+                self._inflight[worker] -= 1
+                self._unhold(slot)
+            try:
+                msg = self._results.get_nowait()
+            except queue.Empty:
+                return
+
+    def wait(self, timeout=0.05):
+        """Bloquear hasta recibir algún resultado (o agotar `timeout`)."""
+        self._drain(timeout)
+
+    def collect(self):
+        """Devolver los resultados disponibles en orden de secuencia."""
+        self._drain()
+        out = []
+        while self._next_emit in self._pending:
+            seq = self._next_emit
+            if seq not in self._done:
+                meta, worker, submitted, msg, _ = self._pending[seq]
+                if time.monotonic() - submitted < self.result_timeout:
+                    break
+                # Worker colgado: no bloquear el orden para siempre, pero el
+                # slot sigue ocupado hasta que responda o muera
+                logger.warning(f"DetectorPool: sin resultado para seq={seq} tras {self.result_timeout}s, se descarta")
+                slot = msg[2]
+                self._abandoned[seq] = (worker, slot)
+                self._held.add(slot)
+                self._done[seq] = []
+            meta = self._pending.pop(seq)[0]
+            out.append(PoolResult(seq, self._done.pop(seq), meta))
+            self._next_emit += 1
+        return out
+
+    def close(self):
+        """Parar los workers y liberar la memoria compartida."""
+        for q in self._tasks:
+            try:
+                q.put(None)
+            except Exception:
+                pass
+        for p in self._procs:
+            try:
+                p.join(timeout=1.0)
+                if p.is_alive():
+                    p.terminate()
+            except Exception:
+                pass
+        self._procs = []
+        self._tasks = []
+        try:
+            del self._flat
+            self._shm.close()
+            self._shm.unlink()
+        except Exception:
+            pass
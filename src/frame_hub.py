@@ -0,0 +1,125 @@
+import select
+import socket
+from threading import Lock
+
+
+class FrameSubscription:
+    """Visor de un canal del `FrameHub`.
+
+    Cada publicación escribe un byte en un socketpair propio del visor (si ya
+    tenía uno pendiente no se acumula más), de modo que esperar un frame nuevo
+    es esperar a que `fileno()` sea legible: `wait()` con `select` desde un
+    hilo, o `eventlet.hubs.trampoline(sub.fileno(), read=True)` desde un
+    greenlet, sin sondear. `next_frame()` devuelve siempre el último frame:
+    un visor lento se salta los intermedios en lugar de acumularlos.
+    """
+
+    def __init__(self, hub, channel):
+        self.hub = hub
+        self.channel = channel
+        self.last_seq = 0
+        self.skipped = 0
+        self._rsock, self._wsock = socket.socketpair()
+        self._rsock.setblocking(False)
+        self._wsock.setblocking(False)
+        self._signaled = False
+
+    def fileno(self):
+        return self._rsock.fileno()
+
+    def _notify(self):
+        if self._signaled:
+            return
+        self._signaled = True
+        try:
+            self._wsock.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _drain(self):
+        self._signaled = False
+        try:
+            while self._rsock.recv(64):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def wait(self, timeout=None):
+        """Bloquear el hilo hasta que haya un frame posterior al último entregado."""
+        if self.hub.latest(self.channel)[0] > self.last_seq:
+            return True
+        ready, _, _ = select.select([self._rsock], [], [], timeout)
+        return bool(ready)
+
+    def next_frame(self):
+        """(seq, bytes) del último frame si es posterior al entregado; si no, None."""
+        self._drain()
+        seq, data = self.hub.latest(self.channel)
+        if seq <= self.last_seq or data is None:
+            return None
+        if self.last_seq:
+            self.skipped += seq - self.last_seq - 1
+        self.last_seq = seq
+        return seq, data
+
+    def close(self):
+        self.hub.unsubscribe(self)
+        for s in (self._rsock, self._wsock):
+            try:
+                s.close()
+            except OSError:
+                pass
+
+
+class FrameHub:
+    """Distribución de frames codificados a N visores.
+
+    El productor (el codificador del preview) llama a `publish(canal, datos)`
+    una vez por frame; cada canal numera sus frames con un `seq` creciente y
+    guarda solo el último. Los visores (`subscribe()`) reciben un aviso por
+    frame nuevo y se quedan con el último, así que el coste por frame es un
+    único encode y un byte por visor.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        # canal -> (seq, datos)
+        self._latest = {}
+        self._subscribers = {}
+
+    def publish(self, channel, data):
+        with self._lock:
+            seq = self._latest.get(channel, (0, None))[0] + 1
+            self._latest[channel] = (seq, data)
+            subs = list(self._subscribers.get(channel, ()))
+        for sub in subs:
+            sub._notify()
+        return seq
+
+    def latest(self, channel):
+        with self._lock:
+            return self._latest.get(channel, (0, None))
+
+    def clear(self, channel):
+        """Olvidar el último frame del canal (sin reiniciar su `seq`)."""
+        with self._lock:
+            seq = self._latest.get(channel, (0, None))[0]
+            self._latest[channel] = (seq, None)
+
+    def subscribe(self, channel):
+        sub = FrameSubscription(self, channel)
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subscribers.get(sub.channel, [])
+            if sub in subs:
+                subs.remove(sub)
+
+    def subscribers(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return len(self._subscribers.get(channel, ()))
+            return sum(len(s) for s in self._subscribers.values())
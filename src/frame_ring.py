@@ -0,0 +1,106 @@
+import numpy as np
+from threading import Condition
+
+
+class FrameRing:
+    """Buffer circular preasignado de frames con timestamp de captura.
+
+    Un único productor (hilo de captura) escribe en los slots con
+    `begin_write()`/`commit()` y un consumidor (hilo de detección) lee
+    con `read()`, que copia el frame a un buffer propio del consumidor.
+    Si el consumidor se queda atrás, los frames más antiguos se
+    sobrescriben y se contabilizan en `dropped`. Con `lossless=True` el
+    productor espera en `begin_write()` en lugar de sobrescribir (para
+    fuentes que no son en tiempo real, como la reproducción de vídeos).
+    """
+
+    def __init__(self, capacity, shape, dtype=np.uint8, lossless=False):
+        self.capacity = int(capacity)
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self._frames = np.zeros((self.capacity,) + self.shape, dtype=dtype)
+        self._stamps = np.zeros(self.capacity, dtype=np.float64)
+        # seq del frame guardado en cada slot (-1 = vacío o escribiéndose)
+        self._seqs = np.full(self.capacity, -1, dtype=np.int64)
+        self._cond = Condition()
+        # Siguiente número de secuencia a escribir
+        self._head = 0
+        self._writing = None
+        self._closed = False
+        self.lossless = bool(lossless)
+        # Último seq entregado al consumidor
+        self._read_seq = -1
+        self.dropped = 0
+
+    def begin_write(self):
+        """Reservar el siguiente slot para escritura.
+
+        Devuelve (slot, array) donde `array` es la vista del slot que el
+        productor debe rellenar antes de llamar a `commit(slot, ts)`.
+        """
+        with self._cond:
+            if self.lossless:
+                # Esperar a que el consumidor haya leído el frame que ocupa el slot
+                self._cond.wait_for(lambda: self._closed or self._read_seq >= self._head - self.capacity)
+            slot = self._head % self.capacity
+            # Invalidar el slot para que el consumidor no lo lea a medias
+            self._seqs[slot] = -1
+            self._writing = slot
+            return slot, self._frames[slot]
+
+    def commit(self, slot, timestamp):
+        """Publicar el slot escrito con su timestamp de captura."""
+        with self._cond:
+            self._stamps[slot] = timestamp
+            self._seqs[slot] = self._head
+            self._head += 1
+            self._writing = None
+            self._cond.notify_all()
+
+    def abort(self, slot):
+        """Descartar una escritura reservada (p. ej. si retrieve() falla)."""
+        with self._cond:
+            if self._writing == slot:
+                self._writing = None
+
+    def read(self, after_seq, out, timeout=None):
+        """Copiar en `out` el siguiente frame posterior a `after_seq`.
+
+        Bloquea hasta `timeout` segundos si no hay frames nuevos. Devuelve
+        (seq, timestamp) o None si se agotó el tiempo o el buffer se cerró.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._closed or self._head - 1 > after_seq, timeout):
+                return None
+            if self._head - 1 <= after_seq:
+                return None
+            seq = max(after_seq + 1, self._head - self.capacity)
+            # Saltar slots invalidados (el productor está escribiendo encima)
+            while seq < self._head and self._seqs[seq % self.capacity] != seq:
+                seq += 1
+            if seq >= self._head:
+                return None
+            self.dropped += seq - (after_seq + 1) if after_seq >= 0 else 0
+            slot = seq % self.capacity
+            np.copyto(out, self._frames[slot])
+            self._read_seq = seq
+            if self.lossless:
+                self._cond.notify_all()
+            return seq, float(self._stamps[slot])
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def latest_seq(self):
+        with self._cond:
+            return self._head - 1
+
+    def close(self):
+        """Marcar el fin del stream y despertar a productor y consumidor.
+
+        Los frames ya publicados se pueden seguir leyendo.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
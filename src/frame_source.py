@@ -0,0 +1,305 @@
+import os
+import time
+import csv
+from abc import ABC, abstractmethod
+from pathlib import Path
+import numpy as np
+import cv2
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.pgm', '.tif', '.tiff')
+
+
+def read_timestamps(path):
+    """Leer un sidecar CSV `frame,timestamp` y devolver la lista de timestamps (s)."""
+    stamps = []
+    with open(path, newline='', encoding='utf-8') as fh:
+        for row in csv.reader(fh):
+            if not row or not row[0].strip().lstrip('-').isdigit():
+                # Cabecera o línea vacía
+                continue
+            stamps.append(float(row[1]))
+    return stamps
+
+
+class FrameSource(ABC):
+    """Origen de frames para `RaceSystem`.
+
+    Sigue la interfaz de `cv2.VideoCapture` que usa el hilo de captura
+    (`isOpened`, `retrieve`, `release`, `get`, `set`), salvo `grab()`, que
+    devuelve el timestamp de captura en segundos o None si no hay frame.
+
+    `realtime` indica si los frames llegan al ritmo de un reloj externo
+    (cámara). Las fuentes que no son en tiempo real (ficheros, sintéticas)
+    se consumen sin descartar frames y tan rápido como lo permita la CPU;
+    `eof` pasa a True cuando se agotan. Las subclases deben implementar
+    `grab()` y `retrieve()`.
+    """
+
+    realtime = False
+
+    def __init__(self):
+        self.eof = False
+
+    def open(self):
+        return True
+
+    def isOpened(self):
+        return False
+
+    @abstractmethod
+    def grab(self):
+        """Capturar el siguiente frame; devuelve su timestamp o None."""
+
+    @abstractmethod
+    def retrieve(self, image=None):
+        """(ok, frame) del último `grab()`."""
+
+    def read(self):
+        if self.grab() is None:
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        pass
+
+    def get(self, prop):
+        return -1
+
+    def set(self, prop, value):
+        return False
+
+
+class _PacedSource(FrameSource):
+    """Base para fuentes con timestamps propios y reproducción opcional a velocidad real.
+
+    `speed` = 0 reproduce lo más rápido posible; 1.0 a velocidad real.
+    Los timestamps se desplazan a la base monotónica de la apertura para que
+    nunca valgan 0 (los temporizadores de vuelta usan 0 como "sin salida").
+    """
+
+    def __init__(self, speed=0.0):
+        super().__init__()
+        self.speed = float(speed or 0.0)
+        self._base = None
+        self._wall_start = None
+        self._first_ts = None
+
+    def _reset(self):
+        self.eof = False
+        self._index = -1
+        self._base = None
+
+    def _stamp(self, t):
+        if self._base is None:
+            self._base = time.monotonic()
+            self._wall_start = self._base
+            self._first_ts = t
+        rel = t - self._first_ts
+        if self.speed > 0:
+            delay = self._wall_start + rel / self.speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return self._base + rel
+
+    def source_time(self, timestamp):
+        """Convertir un timestamp entregado por `grab()` al tiempo propio de la fuente."""
+        if self._base is None:
+            return None
+        return timestamp - self._base + self._first_ts
+
+
+class CameraSource(FrameSource):
+    """Cámara en vivo vía OpenCV; timestamp = reloj monotónico al completar `grab()`."""
+
+    realtime = True
+
+    def __init__(self, index=0, backend=None):
+        super().__init__()
+        self.index = index
+        # En Windows, cv2.CAP_DSHOW suele ser más rápido para inicializar
+        if backend is None:
+            backend = cv2.CAP_DSHOW if os.name == 'nt' else cv2.CAP_ANY
+        self.backend = backend
+        self._cap = None
+
+    def open(self):
+        self._cap = cv2.VideoCapture(self.index, self.backend)
+        return self._cap.isOpened()
+
+    def isOpened(self):
+        return bool(self._cap is not None and self._cap.isOpened())
+
+    def grab(self):
+        if not self._cap.grab():
+            return None
+        return time.monotonic()
+
+    def retrieve(self, image=None):
+        return self._cap.retrieve(image)
+
+    def read(self):
+        return self._cap.read()
+
+    def release(self):
+        if self._cap is not None:
+            self._cap.release()
+
+    def get(self, prop):
+        return self._cap.get(prop)
+
+    def set(self, prop, value):
+        return self._cap.set(prop, value)
+
+
+class VideoFileSource(_PacedSource):
+    """Vídeo grabado. Los timestamps salen del sidecar `<vídeo>.timestamps.csv`
+    si existe o, si no, de la posición del contenedor (CAP_PROP_POS_MSEC)."""
+
+    def __init__(self, path, timestamps=None, speed=0.0, fps=None):
+        super().__init__(speed)
+        self.path = str(path)
+        self.timestamps_path = timestamps
+        self.fps = fps
+        self._cap = None
+        self._stamps = None
+        self._index = -1
+
+    def open(self):
+        self._reset()
+        self._cap = cv2.VideoCapture(self.path)
+        if not self._cap.isOpened():
+            logger.error(f"No se pudo abrir el vídeo {self.path}")
+            return False
+        if not self.fps:
+            self.fps = self._cap.get(cv2.CAP_PROP_FPS) or 30.0
+        sidecar = self.timestamps_path or (self.path + '.timestamps.csv')
+        if os.path.exists(sidecar):
+            self._stamps = read_timestamps(sidecar)
+        return True
+
+    def isOpened(self):
+        return bool(self._cap is not None and self._cap.isOpened())
+
+    def grab(self):
+        if not self._cap.grab():
+            self.eof = True
+            return None
+        self._index += 1
+        if self._stamps is not None and self._index < len(self._stamps):
+            t = self._stamps[self._index]
+        else:
+            ms = self._cap.get(cv2.CAP_PROP_POS_MSEC)
+            t = ms / 1000.0 if (ms and ms > 0) else self._index / float(self.fps)
+        return self._stamp(t)
+
+    def retrieve(self, image=None):
+        return self._cap.retrieve(image)
+
+    def release(self):
+        if self._cap is not None:
+            self._cap.release()
+
+    def get(self, prop):
+        return self._cap.get(prop)
+
+
+class ImageDirSource(_PacedSource):
+    """Directorio de imágenes (orden alfabético). Timestamps desde
+    `timestamps.csv` en el propio directorio o a partir de `fps`."""
+
+    def __init__(self, directory, timestamps=None, speed=0.0, fps=30.0):
+        super().__init__(speed)
+        self.directory = Path(directory)
+        self.timestamps_path = timestamps
+        self.fps = float(fps)
+        self._files = None
+        self._stamps = None
+        self._index = -1
+
+    def open(self):
+        self._reset()
+        if not self.directory.is_dir():
+            logger.error(f"No existe el directorio {self.directory}")
+            return False
+        self._files = sorted(p for p in self.directory.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+        sidecar = Path(self.timestamps_path) if self.timestamps_path else self.directory / 'timestamps.csv'
+        if sidecar.exists():
+            self._stamps = read_timestamps(sidecar)
+        return True
+
+    def isOpened(self):
+        return self._files is not None
+
+    def grab(self):
+        if self._index + 1 >= len(self._files):
+            self.eof = True
+            return None
+        self._index += 1
+        if self._stamps is not None and self._index < len(self._stamps):
+            t = self._stamps[self._index]
+        else:
+            t = self._index / self.fps
+        return self._stamp(t)
+
+    def retrieve(self, image=None):
+        frame = cv2.imread(str(self._files[self._index]), cv2.IMREAD_COLOR)
+        if frame is None:
+            return False, None
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+
+    def release(self):
+        self._files = None
+
+
+class SyntheticSource(_PacedSource):
+    """Generador en memoria: `scene.render(t, out)` dibuja el frame del instante t."""
+
+    def __init__(self, scene, fps=120.0, count=None, duration=None, speed=0.0):
+        super().__init__(speed)
+        self.scene = scene
+        self.fps = float(fps)
+        if count is None and duration is not None:
+            count = int(duration * self.fps)
+        self.count = count
+        self._index = -1
+        self._opened = False
+        self._buf = None
+
+    def open(self):
+        self._reset()
+        self._opened = True
+        self._buf = np.empty(self.scene.shape, dtype=np.uint8)
+        return True
+
+    def isOpened(self):
+        return self._opened
+
+    def grab(self):
+        if self.count is not None and self._index + 1 >= self.count:
+            self.eof = True
+            return None
+        self._index += 1
+        return self._stamp(self._index / self.fps)
+
+    def retrieve(self, image=None):
+        out = image if (image is not None and image.shape == self._buf.shape) else self._buf
+        self.scene.render(self._index / self.fps, out)
+        return True, out
+
+    def release(self):
+        self._opened = False
+
+
+def open_source(spec, **kwargs):
+    """Crear una fuente a partir de una cadena: índice de cámara, ruta de vídeo o directorio."""
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.isdigit()):
+        return CameraSource(int(spec))
+    if os.path.isdir(spec):
+        return ImageDirSource(spec, **kwargs)
+    return VideoFileSource(spec, **kwargs)
@@ -0,0 +1,78 @@
+import csv
+import io
+import json
+from sqlalchemy import select
+from src.models import db, Driver, Lap
+
+# Columnas de cada vuelta en la API y en las exportaciones, en este orden
+LAP_FIELDS = ('id', 'session_id', 'lap_number', 'driver_id', 'tag_id', 'driver_name',
+              'nickname', 'lap_time', 'timestamp', 'is_valid')
+
+# Filas que se piden a la BD de cada vez al exportar
+EXPORT_CHUNK_SIZE = 1000
+
+
+def laps_select(session_id, after=None):
+    """SELECT de las vueltas de una sesión en orden de guardado (`Lap.id`), desde el cursor `after`."""
+    stmt = (select(Lap.id, Lap.session_id, Lap.lap_number, Lap.driver_id, Driver.tag_id,
+                   Driver.name, Driver.nickname, Lap.lap_time, Lap.timestamp, Lap.is_valid)
+            .outerjoin(Driver, Driver.id == Lap.driver_id)
+            .where(Lap.session_id == session_id)
+            .order_by(Lap.id))
+    if after is not None:
+        stmt = stmt.where(Lap.id > after)
+    return stmt
+
+
+def lap_record(row):
+    record = dict(zip(LAP_FIELDS, row))
+    if record['timestamp'] is not None:
+        record['timestamp'] = record['timestamp'].isoformat()
+    return record
+
+
+def laps_page(session_id, after=None, limit=100):
+    """Una página de vueltas con paginación por cursor: (items, next_cursor).
+
+    `next_cursor` es el `id` de la última vuelta devuelta, o None si no hay más.
+    """
+    rows = db.session.execute(laps_select(session_id, after).limit(limit + 1)).all()
+    items = [lap_record(r) for r in rows[:limit]]
+    next_cursor = items[-1]['id'] if len(rows) > limit else None
+    return items, next_cursor
+
+
+def iter_laps(session_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """Recorrer las vueltas de la sesión sin cargarlas todas (`yield_per`)."""
+    stmt = laps_select(session_id).execution_options(yield_per=chunk_size)
+    for row in db.session.execute(stmt):
+        yield lap_record(row)
+
+
+def iter_csv(records, chunk_size=EXPORT_CHUNK_SIZE):
+    """Generar el CSV (con cabecera) en bloques de hasta `chunk_size` filas."""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=LAP_FIELDS)
+    writer.writeheader()
+    n = 0
+    for record in records:
+        writer.writerow(record)
+        n += 1
+        if n >= chunk_size:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate(0)
+            n = 0
+    yield buf.getvalue()
+
+
+def iter_ndjson(records, chunk_size=EXPORT_CHUNK_SIZE):
+    """Generar NDJSON (un objeto por línea) en bloques de hasta `chunk_size` líneas."""
+    lines = []
+    for record in records:
+        lines.append(json.dumps(record, ensure_ascii=False))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
@@ -0,0 +1,192 @@
+import os
+import struct
+import zlib
+from datetime import datetime, timedelta
+from threading import Lock
+import logging
+
+from src.lap_writer import LapEvent
+
+logger = logging.getLogger(__name__)
+
+# Cabecera: magic, versión, relleno y último seq confirmado en la BD
+_HEADER = struct.Struct('<4sH2xQ')
+_MAGIC = b'VLJ1'
+_VERSION = 1
+# Registro de tamaño fijo: seq, session_id (0 = ninguna), tag_id, lap_time,
+# instante del cruce en µs UTC desde epoch (0 = desconocido) y CRC32 de lo anterior
+_RECORD = struct.Struct('<QIH2xdqI')
+_PAYLOAD = struct.Struct('<QIH2xdq')
+
+FSYNC_POLICIES = ('always', 'batch', 'none')
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _to_us(dt):
+    if dt is None:
+        return 0
+    return (dt - _EPOCH) // timedelta(microseconds=1)
+
+
+def _from_us(us):
+    return _EPOCH + timedelta(microseconds=us) if us else None
+
+
+class LapJournal:
+    """Diario binario de solo-añadir con las vueltas pendientes de guardar.
+
+    `append()` escribe el registro con `os.write` (sobrevive a la caída del
+    proceso en cuanto vuelve) y devuelve su número de secuencia. La política
+    `fsync` decide cuándo se fuerza a disco: `always` en cada `append()`,
+    `batch` cuando el escritor de vueltas llama a `sync()` antes de guardar y
+    notificar un lote (una sola llamada por lote), o `none`.
+
+    Tras el commit en la BD el escritor llama a `ack(seqs)` con los seq del
+    lote. La cabecera guarda el mayor seq por debajo del cual todo está
+    confirmado (si un lote falla, sus vueltas frenan esa marca aunque los
+    lotes siguientes se guarden); al arrancar, `pending()` devuelve las
+    vueltas con seq posterior para volver a guardarlas. Cuando el fichero
+    pasa de `compact_bytes` se reescribe solo con lo no confirmado.
+    """
+
+    def __init__(self, path, fsync='batch', compact_bytes=65536):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Política de fsync desconocida: {fsync}")
+        self.path = path
+        self.fsync = fsync
+        self.compact_bytes = max(_HEADER.size + _RECORD.size, int(compact_bytes))
+        self._lock = Lock()
+        self._dirty = False
+        self._fd = None
+        self._acked = 0
+        self._pending = []
+        self._open()
+        self._next_seq = max([self._acked] + [e.seq for e in self._pending]) + 1
+        # Seqs anotados (o recuperados al abrir) aún sin confirmar
+        self._outstanding = {e.seq for e in self._pending}
+        # Tamaño a partir del cual compactar (crece si quedan muchas sin confirmar)
+        self._compact_at = self.compact_bytes
+
+    def _open(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        data = b''
+        chunk = os.read(fd, 1 << 20)
+        while chunk:
+            data += chunk
+            chunk = os.read(fd, 1 << 20)
+        if len(data) < _HEADER.size:
+            # Fichero nuevo (o cabecera incompleta): empezar de cero
+            os.ftruncate(fd, 0)
+            os.write(fd, _HEADER.pack(_MAGIC, _VERSION, 0))
+            os.fsync(fd)
+            self._fd = fd
+            return
+        magic, version, acked = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            os.close(fd)
+            raise ValueError(f"{self.path} no es un diario de vueltas válido")
+        self._acked = acked
+        offset = _HEADER.size
+        while offset + _RECORD.size <= len(data):
+            seq, session_id, tag_id, lap_time, crossed_us, crc = _RECORD.unpack_from(data, offset)
+            if zlib.crc32(data[offset:offset + _PAYLOAD.size]) != crc:
+                break
+            if seq > acked:
+                self._pending.append(LapEvent(tag_id, lap_time, _from_us(crossed_us),
+                                              session_id or None, seq))
+            offset += _RECORD.size
+        if offset < len(data):
+            # Cola a medio escribir (caída durante un append): descartarla
+            logger.warning(f"Diario de vueltas: se descartan {len(data) - offset} bytes incompletos al final")
+            os.ftruncate(fd, offset)
+        os.lseek(fd, 0, os.SEEK_END)
+        self._fd = fd
+
+    def append(self, tag_id, lap_time, crossed_at=None, session_id=None):
+        """Añadir una vuelta y devolver su seq."""
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            payload = _PAYLOAD.pack(seq, session_id or 0, tag_id, lap_time, _to_us(crossed_at))
+            os.write(self._fd, payload + struct.pack('<I', zlib.crc32(payload)))
+            self._outstanding.add(seq)
+            if self.fsync == 'always':
+                os.fsync(self._fd)
+            else:
+                self._dirty = True
+        return seq
+
+    def sync(self):
+        """Forzar a disco lo añadido desde el último `sync()` (política `batch`)."""
+        if self.fsync != 'batch' or not self._dirty:
+            return
+        with self._lock:
+            self._dirty = False
+            os.fsync(self._fd)
+
+    def ack(self, seqs):
+        """Marcar como guardadas en la BD las vueltas `seqs` (un seq o varios).
+
+        La marca de la cabecera solo avanza hasta justo antes del seq sin
+        confirmar más antiguo: una vuelta de un lote que falló sigue
+        pendiente aunque se confirmen vueltas posteriores.
+        """
+        if isinstance(seqs, int):
+            seqs = (seqs,)
+        with self._lock:
+            self._outstanding.difference_update(seqs)
+            mark = (min(self._outstanding) - 1) if self._outstanding else self._next_seq - 1
+            if mark > self._acked:
+                self._acked = mark
+                os.pwrite(self._fd, _HEADER.pack(_MAGIC, _VERSION, mark), 0)
+            # Compactar aunque la marca no avance: se quitan también las
+            # confirmadas que quedan por detrás de una vuelta aún pendiente
+            if os.fstat(self._fd).st_size >= self._compact_at:
+                self._compact()
+
+    def pending(self):
+        """Vueltas del diario aún no confirmadas (las encontradas al abrirlo)."""
+        with self._lock:
+            return [e for e in self._pending if e.seq in self._outstanding]
+
+    @property
+    def acked(self):
+        return self._acked
+
+    @property
+    def last_seq(self):
+        return self._next_seq - 1
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.fsync(self._fd)
+                os.close(self._fd)
+                self._fd = None
+
+    def _compact(self):
+        """Reescribir el diario solo con los registros sin confirmar (con el lock tomado)."""
+        size = os.fstat(self._fd).st_size
+        os.lseek(self._fd, _HEADER.size, os.SEEK_SET)
+        data = os.read(self._fd, size - _HEADER.size)
+        keep = bytearray()
+        for offset in range(0, len(data) - _RECORD.size + 1, _RECORD.size):
+            if _RECORD.unpack_from(data, offset)[0] in self._outstanding:
+                keep += data[offset:offset + _RECORD.size]
+        tmp = self.path + '.tmp'
+        fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, _HEADER.pack(_MAGIC, _VERSION, self._acked) + bytes(keep))
+            os.fsync(fd)
+        except Exception:
+            os.close(fd)
+            raise
+        os.replace(tmp, self.path)
+        os.close(self._fd)
+        os.lseek(fd, 0, os.SEEK_END)
+        self._fd = fd
+        self._dirty = False
+        self._compact_at = max(self.compact_bytes, 2 * (_HEADER.size + len(keep)))
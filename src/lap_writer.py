@@ -0,0 +1,166 @@
+import time
+import queue
+from collections import namedtuple
+from threading import Thread
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Vuelta pendiente de guardar: `crossed_at` es el instante (datetime UTC) del
+# cruce calculado a partir del timestamp de captura, no el de la inserción.
+# `session_id` es la sesión activa al detectarla (None = la activa al guardar)
+# y `seq` su número en el diario de vueltas (None si no hay diario).
+# `crossing` es el mismo instante en el reloj monotónico de captura, tal cual
+# lo dio el detector (para el photo-finish; None en las recuperadas del diario).
+LapEvent = namedtuple('LapEvent', ['tag_id', 'lap_time', 'crossed_at', 'session_id', 'seq', 'crossing'],
+                      defaults=(None, None, None))
+
+
+class LapWriter:
+    """Cola de escritura diferida para las vueltas.
+
+    El hilo de detección solo llama a `submit()`, que encola y vuelve sin
+    tocar la base de datos. Un hilo propio vacía la cola por lotes y llama a
+    `handler(batch)` con hasta `max_batch` eventos (puede devolver cuántos
+    guardó). Un lote se cierra como mucho `flush_interval` segundos después
+    de su primer evento, de modo que la latencia hasta la BD y el frontend
+    está acotada.
+
+    Si `handler` falla (p. ej. la BD está bloqueada), el mismo lote se
+    reintenta antes que cualquier otro, hasta `retries` veces con espera
+    exponencial desde `retry_backoff` segundos; solo se da por perdido (y se
+    cuenta en `lap_persist_errors`) cuando se agotan los reintentos.
+
+    Con `journal` (un `LapJournal`) cada vuelta se anota en el diario antes
+    de encolarla; el lote se fuerza a disco antes de llamar a `handler` y se
+    confirma en el diario cuando `handler` vuelve sin error.
+    """
+
+    def __init__(self, handler, max_batch=64, flush_interval=0.05, max_queue=10000, metrics=None,
+                 journal=None, retries=3, retry_backoff=0.1):
+        self.handler = handler
+        self.journal = journal
+        self.max_batch = max(1, int(max_batch))
+        self.flush_interval = max(0.0, float(flush_interval))
+        self.retries = max(0, int(retries))
+        self.retry_backoff = max(0.0, float(retry_backoff))
+        self.metrics = metrics
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._running = False
+        self._thread = None
+        if metrics is not None:
+            metrics.describe('laps_persisted', 'Vueltas guardadas por el escritor diferido')
+            metrics.describe('laps_dropped', 'Vueltas descartadas por cola llena')
+            metrics.describe('lap_persist_retries', 'Reintentos de lotes de vueltas que fallaron al guardarse')
+            metrics.describe('lap_persist_errors', 'Lotes de vueltas descartados tras agotar los reintentos')
+            metrics.gauge('lap_queue_depth', self._queue.qsize, 'Vueltas pendientes de guardar')
+
+    def submit(self, tag_id, lap_time, crossed_at=None, session_id=None, crossing=None):
+        """Encolar una vuelta. Nunca bloquea; devuelve False si la cola está llena."""
+        seq = None
+        if self.journal is not None:
+            try:
+                seq = self.journal.append(tag_id, lap_time, crossed_at, session_id)
+            except Exception as e:
+                logger.exception(f"Error anotando la vuelta del tag {tag_id} en el diario: {e}")
+        try:
+            self._queue.put_nowait(LapEvent(tag_id, lap_time, crossed_at, session_id, seq, crossing))
+            return True
+        except queue.Full:
+            logger.error(f"Cola de vueltas llena, se descarta la vuelta del tag {tag_id} ({lap_time:.3f}s)")
+            if self.metrics is not None:
+                self.metrics.inc('laps_dropped')
+            return False
+
+    def replay(self, events):
+        """Volver a encolar vueltas recuperadas del diario (ya anotadas, con su `seq`)."""
+        for event in events:
+            self._queue.put(event)
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        t = Thread(target=self._run, name='lap-writer')
+        t.daemon = True
+        t.start()
+        self._thread = t
+
+    def stop(self, timeout=2.0):
+        """Parar el hilo tras guardar lo que quede en la cola."""
+        self._running = False
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+        self._thread = None
+        # Lo que no llegó a procesar el hilo se guarda aquí
+        self.flush()
+
+    def flush(self):
+        """Guardar de forma síncrona todo lo pendiente (desde el hilo llamante)."""
+        while True:
+            batch = self._take_batch(block=False)
+            if not batch:
+                return
+            self._write(batch)
+
+    def _take_batch(self, block=True):
+        try:
+            first = self._queue.get(timeout=0.5) if block else self._queue.get_nowait()
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        if self.journal is not None:
+            t0 = time.perf_counter()
+            try:
+                self.journal.sync()
+            except Exception as e:
+                logger.exception(f"Error sincronizando el diario de vueltas: {e}")
+            if self.metrics is not None:
+                self.metrics.observe('journal_sync', time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                saved = self.handler(batch)
+            except Exception as e:
+                if attempt < self.retries:
+                    delay = self.retry_backoff * (2 ** attempt)
+                    logger.warning(f"Error guardando lote de {len(batch)} vueltas (intento {attempt + 1}), "
+                                   f"se reintenta en {delay:.2f}s: {e}")
+                    if self.metrics is not None:
+                        self.metrics.inc('lap_persist_retries')
+                    time.sleep(delay)
+                    continue
+                logger.exception(f"Error guardando lote de {len(batch)} vueltas, se descarta "
+                                 f"tras {attempt + 1} intentos: {e}")
+                if self.metrics is not None:
+                    self.metrics.inc('lap_persist_errors')
+                break
+            if self.journal is not None:
+                seqs = [e.seq for e in batch if e.seq is not None]
+                if seqs:
+                    self.journal.ack(seqs)
+            if self.metrics is not None:
+                self.metrics.inc('laps_persisted', len(batch) if saved is None else int(saved))
+            break
+        if self.metrics is not None:
+            self.metrics.observe('lap_persist', time.perf_counter() - t0)
+
+    def _run(self):
+        while self._running:
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
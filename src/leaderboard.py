@@ -0,0 +1,165 @@
+from bisect import bisect_left
+from threading import Lock
+
+
+class _Standing:
+    __slots__ = ('driver_id', 'tag_id', 'name', 'nickname', 'laps', 'last', 'best', 'total', 'cumulative')
+
+    def __init__(self, driver):
+        self.driver_id = driver.id
+        self.tag_id = driver.tag_id
+        self.name = driver.name
+        self.nickname = driver.nickname
+        self.laps = 0
+        self.last = None
+        self.best = None
+        self.total = 0.0
+        # Tiempo acumulado al completar cada vuelta (para el gap a igualdad de vueltas)
+        self.cumulative = []
+
+    def key(self):
+        # Más vueltas primero; a igualdad, menos tiempo total
+        return (-self.laps, self.total, self.driver_id)
+
+
+class Leaderboard:
+    """Clasificación incremental de la sesión activa.
+
+    Mantiene por piloto vueltas, última, mejor, tiempo total, posición y gap
+    al líder, con el orden en una lista de claves ordenada: cada vuelta
+    localiza su nueva posición por búsqueda binaria y solo cambian las filas
+    entre la posición antigua y la nueva (más el propio piloto). El gap es la
+    diferencia con el paso del líder por la misma vuelta, así que solo se
+    recalcula para todos cuando cambia el líder.
+
+    `record_laps()` devuelve un delta `{'seq', 'session_id', 'rows', 'removed'}`
+    con las filas que cambiaron (y los pilotos quitados, `remove_driver()`); `snapshot()` devuelve la clasificación completa con
+    el mismo `seq`, de modo que un cliente que se une a mitad de carrera pide
+    el snapshot y aplica los deltas con `seq` posterior.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._session_id = None
+        self._seq = 0
+        self._entries = {}
+        self._order = []
+
+    @property
+    def session_id(self):
+        return self._session_id
+
+    def reset(self, session_id=None):
+        with self._lock:
+            self._session_id = session_id
+            self._entries = {}
+            self._order = []
+            self._seq += 1
+
+    def load(self, session_id, laps):
+        """Reconstruir la sesión a partir de `laps`: (driver, lap_time) en orden de vuelta por piloto."""
+        with self._lock:
+            self._session_id = session_id
+            self._entries = {}
+            self._order = []
+            for driver, lap_time in laps:
+                self._add_lap(driver, lap_time)
+            self._seq += 1
+
+    def record_laps(self, laps):
+        """Añadir vueltas `(driver, lap_time)` y devolver el delta, o None si no hay cambios."""
+        with self._lock:
+            changed = set()
+            for driver, lap_time in laps:
+                changed |= self._add_lap(driver, lap_time)
+            if not changed:
+                return None
+            return self._delta(changed)
+
+    def update_driver(self, driver):
+        """Actualizar nombre/tag de un piloto ya clasificado; devuelve el delta o None."""
+        with self._lock:
+            entry = self._entries.get(driver.id)
+            if entry is None:
+                return None
+            entry.name, entry.nickname, entry.tag_id = driver.name, driver.nickname, driver.tag_id
+            return self._delta({driver.id})
+
+    def remove_driver(self, driver_id):
+        """Quitar a un piloto (p. ej. borrado); devuelve el delta o None si no estaba."""
+        with self._lock:
+            entry = self._entries.pop(driver_id, None)
+            if entry is None:
+                return None
+            index = bisect_left(self._order, entry.key())
+            del self._order[index]
+            if index == 0:
+                # Sin líder anterior: cambia la referencia del gap de todos
+                changed = set(self._entries)
+            else:
+                # Los que iban detrás suben un puesto
+                changed = {key[2] for key in self._order[index:]}
+            return self._delta(changed, removed=[driver_id])
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'seq': self._seq,
+                'session_id': self._session_id,
+                'rows': [self._row(i) for i in range(len(self._order))],
+            }
+
+    def _add_lap(self, driver, lap_time):
+        """Aplicar una vuelta y devolver los driver_id cuyas filas cambiaron."""
+        entry = self._entries.get(driver.id)
+        old_leader = self._order[0][2] if self._order else None
+        if entry is None:
+            entry = self._entries[driver.id] = _Standing(driver)
+            old_index = len(self._order)
+        else:
+            old_index = bisect_left(self._order, entry.key())
+            del self._order[old_index]
+        lap_time = float(lap_time)
+        entry.laps += 1
+        entry.last = lap_time
+        entry.best = lap_time if entry.best is None else min(entry.best, lap_time)
+        entry.total += lap_time
+        entry.cumulative.append(entry.total)
+        key = entry.key()
+        new_index = bisect_left(self._order, key)
+        self._order.insert(new_index, key)
+        if self._order[0][2] != old_leader:
+            # Nuevo líder: cambia la referencia del gap de todos
+            return set(self._entries)
+        # Las filas entre la nueva y la antigua posición bajan un puesto
+        last = min(old_index, len(self._order) - 1)
+        return {self._order[i][2] for i in range(new_index, last + 1)}
+
+    def _row(self, index):
+        entry = self._entries[self._order[index][2]]
+        leader = self._entries[self._order[0][2]]
+        gap = None
+        if index > 0 and entry.laps:
+            gap = round(entry.cumulative[-1] - leader.cumulative[entry.laps - 1], 3)
+        return {
+            'driver_id': entry.driver_id,
+            'tag_id': entry.tag_id,
+            'name': entry.name,
+            'nickname': entry.nickname,
+            'position': index + 1,
+            'laps': entry.laps,
+            'last': None if entry.last is None else round(entry.last, 3),
+            'best': None if entry.best is None else round(entry.best, 3),
+            'total': round(entry.total, 3),
+            'gap': gap,
+        }
+
+    def _delta(self, driver_ids, removed=()):
+        self._seq += 1
+        rows = []
+        for driver_id in driver_ids:
+            entry = self._entries.get(driver_id)
+            if entry is not None:
+                rows.append(self._row(bisect_left(self._order, entry.key())))
+        rows.sort(key=lambda r: r['position'])
+        return {'seq': self._seq, 'session_id': self._session_id, 'rows': rows, 'removed': list(removed)}
@@ -0,0 +1,189 @@
+import time
+from bisect import bisect_left
+from threading import Lock
+
+# Límites (segundos) de los buckets de latencia: de 0.1 ms a 1 s
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.0075, 0.01,
+                   0.015, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0)
+
+# Etapas del pipeline, en el orden en que se exportan
+STAGES = ('grab', 'retrieve', 'queue', 'cvtcolor', 'clahe', 'detect',
+          'filter', 'lap_callback', 'draw', 'encode', 'frame', 'journal_sync', 'lap_persist', 'photo_finish', 'record_write')
+
+STAGE_HELP = {
+    'grab': 'espera del driver/fuente hasta tener frame',
+    'retrieve': 'decodificación del frame en el ring',
+    'queue': 'desde la captura hasta que la detección toma el frame',
+    'cvtcolor': 'conversión a gris del recorte',
+    'clahe': 'ecualización CLAHE',
+    'detect': 'detección de tags (ida y vuelta al pool si hay workers)',
+    'filter': 'filtros y lógica de cruces',
+    'lap_callback': 'callback de vuelta (persistencia y notificación)',
+    'draw': 'overlay del preview',
+    'encode': 'codificación JPEG del preview',
+    'frame': 'desde que se toma el frame hasta terminar su lógica',
+    'journal_sync': 'fsync del diario de vueltas antes de guardar un lote',
+    'lap_persist': 'guardado de un lote de vueltas y envío de eventos',
+    'photo_finish': 'extracción, composición y guardado de una tira de photo-finish',
+    'record_write': 'escritura a disco de un frame de la grabación',
+}
+
+
+class Histogram:
+    """Histograma de buckets fijos; `observe()` es O(log n) y sin reservas."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(float(b) for b in buckets)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        """Devolver (buckets acumulados [(le, n)], suma, total)."""
+        with self._lock:
+            counts = list(self._counts)
+            total_sum = self._sum
+            total = self._count
+        cumulative = []
+        acc = 0
+        for bound, n in zip(self.bounds + (float('inf'),), counts):
+            acc += n
+            cumulative.append((bound, acc))
+        return cumulative, total_sum, total
+
+    def quantile(self, q):
+        """Estimación del cuantil q (0-1) por interpolación lineal dentro del bucket."""
+        buckets, _, total = self.snapshot()
+        if total == 0:
+            return None
+        rank = q * total
+        prev_bound, prev_n = 0.0, 0
+        for bound, n in buckets:
+            if n >= rank:
+                if bound == float('inf'):
+                    return prev_bound
+                span = n - prev_n
+                frac = (rank - prev_n) / span if span else 1.0
+                return prev_bound + (bound - prev_bound) * frac
+            prev_bound, prev_n = bound, n
+        return prev_bound
+
+
+class MetricsRegistry:
+    """Histogramas por etapa y contadores del pipeline de visión.
+
+    Los hilos de captura, detección y preview llaman a `observe()`/`inc()`;
+    `to_prometheus()` y `to_dict()` generan la exportación para `/api/metrics`.
+    Los gauges se registran como funciones que se evalúan al exportar.
+    """
+
+    def __init__(self, prefix='visionlap', buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.stages = {name: Histogram(buckets) for name in STAGES}
+        # nombre -> {tupla de (label, valor): n}
+        self._counters = {}
+        self._counter_help = {}
+        self._gauges = {}
+        self._lock = Lock()
+        self.started = time.time()
+
+    def observe(self, stage, seconds):
+        hist = self.stages.get(stage)
+        if hist is None:
+            hist = self.stages.setdefault(stage, Histogram(DEFAULT_BUCKETS))
+        hist.observe(seconds)
+
+    def describe(self, name, help_text, label_sets=None):
+        """Documentar un contador y crear sus series a 0 (`label_sets`: lista de dicts)."""
+        self._counter_help[name] = help_text
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            for labels in (label_sets or [{}]):
+                series.setdefault(tuple(sorted(labels.items())), 0)
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def gauge(self, name, func, help_text=''):
+        """Registrar un gauge calculado al exportar (`func()` -> número o None)."""
+        self._gauges[name] = (func, help_text)
+
+    def _counter_snapshot(self):
+        with self._lock:
+            return {name: dict(series) for name, series in self._counters.items()}
+
+    def _gauge_values(self):
+        out = {}
+        for name, (func, _) in self._gauges.items():
+            try:
+                value = func()
+            except Exception:
+                value = None
+            if value is not None:
+                out[name] = float(value)
+        return out
+
+    def to_dict(self):
+        stages = {}
+        for name, hist in self.stages.items():
+            buckets, total_sum, total = hist.snapshot()
+            stages[name] = {
+                'help': STAGE_HELP.get(name, ''),
+                'count': total,
+                'sum': total_sum,
+                'mean': (total_sum / total) if total else None,
+                'p50': hist.quantile(0.5),
+                'p95': hist.quantile(0.95),
+                'p99': hist.quantile(0.99),
+                'buckets': [['+Inf' if b == float('inf') else b, n] for b, n in buckets],
+            }
+        counters = {}
+        for name, series in self._counter_snapshot().items():
+            if len(series) == 1 and () in series:
+                counters[name] = series[()]
+            else:
+                counters[name] = {','.join(f"{k}={v}" for k, v in key): n for key, n in series.items()}
+        return {
+            'uptime_seconds': time.time() - self.started,
+            'stages': stages,
+            'counters': counters,
+            'gauges': self._gauge_values(),
+        }
+
+    def to_prometheus(self):
+        p = self.prefix
+        lines = [
+            f"# HELP {p}_stage_seconds Duración de cada etapa del pipeline de visión",
+            f"# TYPE {p}_stage_seconds histogram",
+        ]
+        for name, hist in self.stages.items():
+            buckets, total_sum, total = hist.snapshot()
+            for bound, n in buckets:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{p}_stage_seconds_bucket{{stage="{name}",le="{le}"}} {n}')
+            lines.append(f'{p}_stage_seconds_sum{{stage="{name}"}} {total_sum!r}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{name}"}} {total}')
+        for name, series in sorted(self._counter_snapshot().items()):
+            metric = f"{p}_{name}_total"
+            lines.append(f"# HELP {metric} {self._counter_help.get(name, name)}")
+            lines.append(f"# TYPE {metric} counter")
+            for key, n in sorted(series.items()):
+                labels = ','.join(f'{k}="{v}"' for k, v in key)
+                lines.append(f"{metric}{{{labels}}} {n}" if labels else f"{metric} {n}")
+        for name, value in sorted(self._gauge_values().items()):
+            metric = f"{p}_{name}"
+            lines.append(f"# HELP {metric} {self._gauges[name][1] or name}")
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value!r}")
+        return '\n'.join(lines) + '\n'
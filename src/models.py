@@ -29,6 +29,10 @@ class Track(db.Model):
     
 class Session(db.Model):
     """Sesión de carrera (Práctica, Qualy, Carrera)."""
+    __table_args__ = (
+        # Búsqueda de la sesión activa
+        db.Index('ix_session_is_active', 'is_active'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     track_id = db.Column(db.Integer, db.ForeignKey('track.id'))
     type = db.Column(db.String(20), default='practice') # practice, qualy, race
@@ -38,6 +42,15 @@ class Session(db.Model):
 
 class Lap(db.Model):
     """Registro individual de una vuelta."""
+    __table_args__ = (
+        # Vueltas de un piloto en una sesión (numeración, mejores vueltas)
+        db.Index('ix_lap_session_driver', 'session_id', 'driver_id', 'lap_number'),
+        # Vueltas de una sesión en orden cronológico
+        db.Index('ix_lap_session_timestamp', 'session_id', 'timestamp'),
+        # Paginación por cursor y exportación de una sesión en orden de guardado
+        db.Index('ix_lap_session_id', 'session_id', 'id'),
+        db.Index('ix_lap_timestamp', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.Integer, db.ForeignKey('session.id'))
     driver_id = db.Column(db.Integer, db.ForeignKey('driver.id'))
@@ -47,4 +60,87 @@ class Lap(db.Model):
     sector_1 = db.Column(db.Float, nullable=True) # Extensible a sectores
     is_valid = db.Column(db.Boolean, default=True)
 
-    driver = db.relationship('Driver')
\ No newline at end of file
+    driver = db.relationship('Driver')
+class DriverBest(db.Model):
+    """Mejor vuelta histórica de cada piloto; se actualiza en la misma transacción que la vuelta."""
+    driver_id = db.Column(db.Integer, db.ForeignKey('driver.id'), primary_key=True)
+    lap_time = db.Column(db.Float, nullable=False)
+    session_id = db.Column(db.Integer, db.ForeignKey('session.id'))
+    lap_number = db.Column(db.Integer)
+    set_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    driver = db.relationship('Driver')
+
+    def to_dict(self):
+        return {
+            'driver_id': self.driver_id,
+            'lap_time': self.lap_time,
+            'session_id': self.session_id,
+            'lap_number': self.lap_number,
+            'set_at': self.set_at.isoformat() if self.set_at else None
+        }
+
+class SessionBest(db.Model):
+    """Mejor vuelta de cada piloto en cada sesión."""
+    session_id = db.Column(db.Integer, db.ForeignKey('session.id'), primary_key=True)
+    driver_id = db.Column(db.Integer, db.ForeignKey('driver.id'), primary_key=True)
+    lap_time = db.Column(db.Float, nullable=False)
+    lap_number = db.Column(db.Integer)
+    set_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    driver = db.relationship('Driver')
+
+    def to_dict(self):
+        return {
+            'session_id': self.session_id,
+            'driver_id': self.driver_id,
+            'lap_time': self.lap_time,
+            'lap_number': self.lap_number,
+            'set_at': self.set_at.isoformat() if self.set_at else None
+        }
+
+class TrackRecord(db.Model):
+    """Récord de cada circuito (también se refleja en `Track.record_lap`)."""
+    track_id = db.Column(db.Integer, db.ForeignKey('track.id'), primary_key=True)
+    driver_id = db.Column(db.Integer, db.ForeignKey('driver.id'))
+    lap_time = db.Column(db.Float, nullable=False)
+    session_id = db.Column(db.Integer, db.ForeignKey('session.id'))
+    lap_number = db.Column(db.Integer)
+    set_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    driver = db.relationship('Driver')
+
+    def to_dict(self):
+        return {
+            'track_id': self.track_id,
+            'driver_id': self.driver_id,
+            'lap_time': self.lap_time,
+            'session_id': self.session_id,
+            'lap_number': self.lap_number,
+            'set_at': self.set_at.isoformat() if self.set_at else None
+        }
+
+class LapClip(db.Model):
+    """Tira de photo-finish de una vuelta (frames alrededor del cruce)."""
+    lap_id = db.Column(db.Integer, db.ForeignKey('lap.id'), primary_key=True)
+    path = db.Column(db.String(255), nullable=False)
+    frames = db.Column(db.Integer)
+    # Desfase (s) del primer y último frame respecto al instante del cruce
+    start_offset = db.Column(db.Float)
+    end_offset = db.Column(db.Float)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    lap = db.relationship('Lap')
+
+    def to_dict(self):
+        return {
+            'lap_id': self.lap_id,
+            'frames': self.frames,
+            'start_offset': self.start_offset,
+            'end_offset': self.end_offset,
+            'width': self.width,
+            'height': self.height,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
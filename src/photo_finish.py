@@ -0,0 +1,251 @@
+import os
+import math
+import queue
+import time
+from threading import Lock, Thread
+import logging
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PhotoFinishBuffer:
+    """Ring de los últimos frames en gris con su timestamp de captura.
+
+    La memoria se reserva una sola vez, con el primer frame (cuando se
+    conoce la resolución): caben tantos frames como permita `budget_bytes`.
+    `push()` convierte el frame BGR directamente sobre su slot, sin reservas,
+    y `extract()` copia (fuera del hilo de detección) los frames de un
+    intervalo de tiempo.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = max(0, int(budget_bytes))
+        self.capacity = 0
+        self.shape = None
+        self._frames = None
+        self._stamps = None
+        # Siguiente número de secuencia a escribir
+        self._head = 0
+        self._lock = Lock()
+
+    def _allocate(self, shape):
+        frame_bytes = shape[0] * shape[1]
+        capacity = self.budget_bytes // frame_bytes if frame_bytes else 0
+        if capacity < 2:
+            logger.warning(f"PHOTO_FINISH_MB no alcanza para dos frames de {shape[1]}x{shape[0]}")
+            capacity = 0
+        self.capacity = int(capacity)
+        self.shape = shape
+        self._frames = np.zeros((self.capacity,) + shape, dtype=np.uint8) if capacity else None
+        self._stamps = np.full(self.capacity, np.nan, dtype=np.float64)
+        self._head = 0
+        logger.info(f"Photo-finish: {self.capacity} frames de {shape[1]}x{shape[0]} "
+                    f"({self.capacity * frame_bytes / 1e6:.1f} MB)")
+
+    def push(self, frame, timestamp):
+        """Guardar un frame BGR (o gris) con su timestamp de captura."""
+        shape = frame.shape[:2]
+        if shape != self.shape:
+            # Primer frame o cambio de resolución (reinicio de la cámara)
+            with self._lock:
+                self._allocate(shape)
+        if not self.capacity:
+            return
+        with self._lock:
+            slot = self._head % self.capacity
+            if frame.ndim == 3:
+                cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._frames[slot])
+            else:
+                np.copyto(self._frames[slot], frame)
+            self._stamps[slot] = timestamp
+            self._head += 1
+
+    def span(self):
+        """(timestamp más antiguo, más reciente) del buffer, o None si está vacío."""
+        with self._lock:
+            if not self._head or not self.capacity:
+                return None
+            newest = (self._head - 1) % self.capacity
+            oldest = self._head % self.capacity if self._head >= self.capacity else 0
+            return float(self._stamps[oldest]), float(self._stamps[newest])
+
+    def extract(self, start, end, max_frames=None, rect=None):
+        """Copias de los frames con timestamp en [start, end], en orden.
+
+        Con `max_frames` se toman frames repartidos uniformemente por el
+        intervalo y con `rect` (x0, y0, x1, y1) solo se copia ese recorte.
+        Devuelve (lista de frames, array de timestamps).
+        """
+        with self._lock:
+            if not self._head or not self.capacity:
+                return [], np.empty(0)
+            n = min(self._head, self.capacity)
+            slots = (np.arange(self._head - n, self._head) % self.capacity)
+            stamps = self._stamps[slots]
+            sel = slots[(stamps >= start) & (stamps <= end)]
+            if max_frames and len(sel) > max_frames:
+                sel = sel[np.linspace(0, len(sel) - 1, int(max_frames)).round().astype(int)]
+            if rect is not None:
+                x0, y0, x1, y1 = rect
+                frames = [self._frames[s, y0:y1, x0:x1].copy() for s in sel]
+            else:
+                frames = [self._frames[s].copy() for s in sel]
+            return frames, self._stamps[sel].copy()
+
+
+def finish_line_rect(finish_line, shape, margin):
+    """Recorte (x0, y0, x1, y1) alrededor de la línea de meta con `margin` px (0 = frame completo)."""
+    h, w = shape[:2]
+    if not margin or finish_line is None:
+        return 0, 0, w, h
+    (x1, y1), (x2, y2) = finish_line
+    x0 = max(0, min(x1, x2) - margin)
+    y0 = max(0, min(y1, y2) - margin)
+    return x0, y0, min(w, max(x1, x2) + margin + 1), min(h, max(y1, y2) + margin + 1)
+
+
+def compose_strip(frames, offsets, columns=4, finish_line=None, origin=(0, 0), highlight=None):
+    """Componer una tira de frames en rejilla, cada uno con su desfase (ms) respecto al cruce."""
+    n = len(frames)
+    h, w = frames[0].shape[:2]
+    cols = max(1, min(int(columns), n))
+    rows = math.ceil(n / cols)
+    sheet = np.zeros((rows * h, cols * w), dtype=np.uint8)
+    for i, (frame, offset) in enumerate(zip(frames, offsets)):
+        r, c = divmod(i, cols)
+        tile = sheet[r * h:(r + 1) * h, c * w:(c + 1) * w]
+        tile[:] = frame
+        if finish_line is not None:
+            (ax, ay), (bx, by) = finish_line
+            ox, oy = origin
+            cv2.line(tile, (ax - ox, ay - oy), (bx - ox, by - oy), 255, 1)
+        cv2.putText(tile, f"{offset * 1000:+.0f} ms", (4, 16), cv2.FONT_HERSHEY_SIMPLEX, 0.45, 255, 1)
+        if i == highlight:
+            cv2.rectangle(tile, (0, 0), (w - 1, h - 1), 255, 2)
+    return sheet
+
+
+class PhotoFinishWorker:
+    """Hilo que genera la tira de photo-finish de cada vuelta guardada.
+
+    `request(lap_id, crossing_time)` encola y vuelve sin bloquear (si la cola
+    está llena se descarta y se cuenta). El hilo espera a que el buffer tenga
+    los frames hasta `after` segundos después del cruce, extrae la ventana
+    [cruce - before, cruce + after], compone la tira en JPEG en `directory` y
+    llama a `on_clip(lap_id, info)` para enlazarla con la vuelta.
+    """
+
+    def __init__(self, vision_system, directory, on_clip=None, before=0.3, after=0.3,
+                 max_frames=12, columns=4, margin=120, quality=85, max_queue=64, metrics=None):
+        self.vision_system = vision_system
+        self.directory = directory
+        self.on_clip = on_clip
+        self.before = max(0.0, float(before))
+        self.after = max(0.0, float(after))
+        self.max_frames = max(1, int(max_frames))
+        self.columns = max(1, int(columns))
+        self.margin = max(0, int(margin))
+        self.quality = min(100, max(1, int(quality)))
+        self.metrics = metrics
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._running = False
+        self._thread = None
+        if metrics is not None:
+            metrics.describe('photo_finish_clips', 'Tiras de photo-finish guardadas')
+            metrics.describe('photo_finish_missed', 'Vueltas sin frames en el buffer de photo-finish')
+            metrics.describe('photo_finish_dropped', 'Peticiones de photo-finish descartadas por cola llena')
+
+    def request(self, lap_id, crossing_time):
+        """Pedir la tira de la vuelta `lap_id` (cruce en el reloj de captura). Nunca bloquea."""
+        try:
+            self._queue.put_nowait((lap_id, crossing_time))
+            return True
+        except queue.Full:
+            if self.metrics is not None:
+                self.metrics.inc('photo_finish_dropped')
+            return False
+
+    def start(self):
+        if self._running:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._running = True
+        t = Thread(target=self._run, name='photo-finish')
+        t.daemon = True
+        t.start()
+        self._thread = t
+
+    def stop(self, timeout=2.0):
+        self._running = False
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def path_for(self, lap_id):
+        return os.path.join(self.directory, f"lap_{int(lap_id)}.jpg")
+
+    def _run(self):
+        while self._running:
+            try:
+                lap_id, crossing = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._capture(lap_id, crossing)
+            except Exception as e:
+                logger.exception(f"Error generando el photo-finish de la vuelta {lap_id}: {e}")
+
+    def _wait_frames(self, until):
+        """Esperar a que el buffer llegue a `until` (o a que pase ese instante con margen)."""
+        buffer = self.vision_system.photo_finish
+        deadline = time.monotonic() + self.after + 1.0
+        while self._running and time.monotonic() < deadline:
+            span = buffer.span()
+            if span is not None and span[1] >= until:
+                return
+            time.sleep(0.02)
+
+    def _capture(self, lap_id, crossing):
+        buffer = self.vision_system.photo_finish
+        if buffer is None:
+            return
+        self._wait_frames(crossing + self.after)
+        t0 = time.perf_counter()
+        shape = buffer.shape
+        if shape is None:
+            return
+        finish_line = self.vision_system.finish_line
+        rect = finish_line_rect(finish_line, shape, self.margin)
+        frames, stamps = buffer.extract(crossing - self.before, crossing + self.after,
+                                        self.max_frames, rect)
+        if not frames:
+            if self.metrics is not None:
+                self.metrics.inc('photo_finish_missed')
+            logger.info(f"Photo-finish: sin frames para la vuelta {lap_id}")
+            return
+        offsets = stamps - crossing
+        sheet = compose_strip(frames, offsets, self.columns, finish_line, rect[:2],
+                              highlight=int(np.argmin(np.abs(offsets))))
+        ok, jpeg = cv2.imencode('.jpg', sheet, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality])
+        if not ok:
+            return
+        path = self.path_for(lap_id)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(jpeg.tobytes())
+        os.replace(tmp, path)
+        if self.metrics is not None:
+            self.metrics.observe('photo_finish', time.perf_counter() - t0)
+            self.metrics.inc('photo_finish_clips')
+        if self.on_clip is not None:
+            self.on_clip(lap_id, {
+                'path': path,
+                'frames': len(frames),
+                'start_offset': float(offsets[0]),
+                'end_offset': float(offsets[-1]),
+                'width': int(sheet.shape[1]),
+                'height': int(sheet.shape[0]),
+            })
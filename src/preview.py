@@ -0,0 +1,212 @@
+import cv2
+import time
+import numpy as np
+from threading import Thread, Lock, Event
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Perfiles por defecto: (nombre, ancho en px o None = resolución completa, calidad JPEG, FPS máx.)
+DEFAULT_PROFILES = (
+    ('full', None, 80, 30.0),
+    ('medium', 320, 70, 15.0),
+    ('thumb', 160, 60, 5.0),
+)
+
+
+def parse_profiles(spec):
+    """Leer perfiles de `nombre:ancho:calidad:fps,...` (ancho 0 = resolución completa)."""
+    profiles = []
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, width, quality, fps = (item.split(':') + ['', '', ''])[:4]
+        profiles.append((name.strip(), (int(width) or None) if width else None,
+                         int(quality or 80), float(fps or 30)))
+    return tuple(profiles)
+
+
+class PreviewProfile:
+    """Un stream del preview: ancho de salida, calidad JPEG, FPS máximos y sus visores."""
+
+    def __init__(self, name, width=None, quality=80, fps=30.0):
+        self.name = name
+        self.width = int(width) if width else None
+        self.quality = min(100, max(1, int(quality)))
+        self.fps = max(0.1, float(fps))
+        self.subscribers = 0
+        self.last_submit = 0.0
+        self.jpeg = None
+
+    def due(self, now):
+        return self.subscribers > 0 and (now - self.last_submit) >= 1.0 / self.fps
+
+    def to_dict(self):
+        return {'name': self.name, 'width': self.width, 'quality': self.quality,
+                'fps': self.fps, 'subscribers': self.subscribers}
+
+
+class PreviewEncoder:
+    """Codificación JPEG del preview en su propio hilo y solo bajo demanda.
+
+    Hay varios perfiles con nombre (p. ej. `full`, `medium` de 320 px y
+    `thumb` de 160 px), cada uno con su calidad JPEG y su límite de FPS. El
+    hilo de detección llama a `wants_frame()` para saber si merece la pena
+    dibujar el overlay y a `submit(frame)` para entregar el frame; ninguna de
+    las dos llamadas bloquea. Un perfil solo se codifica mientras tenga
+    suscriptores (`subscribe(profile)`/`unsubscribe(profile)`), y los tamaños
+    reducidos salen de una única pirámide por frame: cada nivel se reduce
+    desde el inmediatamente mayor. Con un `FrameHub` cada JPEG se publica
+    además en el canal del perfil para repartirlo a todos sus visores.
+    """
+
+    def __init__(self, fps=30, quality=80, metrics=None, profiles=DEFAULT_PROFILES, hub=None):
+        # MetricsRegistry opcional donde registrar el tiempo de codificación
+        self.metrics = metrics
+        self.hub = hub
+        self.profiles = {}
+        for name, width, p_quality, p_fps in profiles:
+            self.profiles[name] = PreviewProfile(name, width, p_quality, p_fps)
+        # `fps`/`quality` configuran el perfil principal (el de resolución completa)
+        self.default_profile = next((p.name for p in self.profiles.values() if p.width is None),
+                                    None)
+        if self.default_profile is None:
+            self.profiles['full'] = PreviewProfile('full', None, quality, fps)
+            self.default_profile = 'full'
+        self.configure(fps=fps, quality=quality)
+        self._sub_lock = Lock()
+        # Doble buffer: `_pending` lo rellena el detector, `_work` lo codifica el hilo
+        self._swap_lock = Lock()
+        self._pending = None
+        self._pending_due = ()
+        self._work = None
+        self._has_pending = False
+        self._event = Event()
+        self._out_lock = Lock()
+        self._running = False
+        self._thread = None
+
+    def _profile(self, name):
+        profile = self.profiles.get(name or self.default_profile)
+        if profile is None:
+            raise KeyError(f"Perfil de preview desconocido: {name}")
+        return profile
+
+    @property
+    def fps(self):
+        return self.profiles[self.default_profile].fps
+
+    @property
+    def quality(self):
+        return self.profiles[self.default_profile].quality
+
+    def subscribe(self, profile=None):
+        p = self._profile(profile)
+        with self._sub_lock:
+            p.subscribers += 1
+
+    def unsubscribe(self, profile=None):
+        p = self._profile(profile)
+        with self._sub_lock:
+            p.subscribers = max(0, p.subscribers - 1)
+            if p.subscribers == 0:
+                # No servir un frame antiguo al próximo visor
+                with self._out_lock:
+                    p.jpeg = None
+                if self.hub is not None:
+                    self.hub.clear(p.name)
+
+    @property
+    def subscribers(self):
+        return sum(p.subscribers for p in self.profiles.values())
+
+    def configure(self, fps=None, quality=None, profile=None):
+        p = self._profile(profile)
+        if fps is not None:
+            p.fps = max(0.1, float(fps))
+        if quality is not None:
+            p.quality = min(100, max(1, int(quality)))
+
+    def wants_frame(self):
+        """True si algún perfil tiene visores y ya le toca un nuevo frame según su límite de FPS."""
+        now = time.monotonic()
+        return any(p.due(now) for p in self.profiles.values())
+
+    def submit(self, frame):
+        """Entregar un frame (BGR) para codificar. Nunca bloquea al llamante."""
+        now = time.monotonic()
+        due = tuple(p for p in self.profiles.values() if p.due(now))
+        if not due:
+            return False
+        if not self._swap_lock.acquire(blocking=False):
+            return False
+        try:
+            if self._pending is None or self._pending.shape != frame.shape:
+                self._pending = np.empty_like(frame)
+            np.copyto(self._pending, frame)
+            # Si el hilo aún no tomó el frame anterior, sus perfiles también esperan este
+            self._pending_due = tuple(set(self._pending_due) | set(due)) if self._has_pending else due
+            self._has_pending = True
+            for p in due:
+                p.last_submit = now
+        finally:
+            self._swap_lock.release()
+        self._event.set()
+        return True
+
+    def get_frame(self, profile=None):
+        p = self._profile(profile)
+        with self._out_lock:
+            return p.jpeg
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        t = Thread(target=self._encode_loop)
+        t.daemon = True
+        t.start()
+        self._thread = t
+
+    def stop(self):
+        self._running = False
+        self._event.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def _encode(self, profile, image):
+        t0 = time.perf_counter()
+        ok, buffer = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), profile.quality])
+        if self.metrics is not None:
+            self.metrics.observe('encode', time.perf_counter() - t0)
+        if ok:
+            jpeg = buffer.tobytes()
+            with self._out_lock:
+                profile.jpeg = jpeg
+            if self.hub is not None:
+                self.hub.publish(profile.name, jpeg)
+
+    def _encode_loop(self):
+        while self._running:
+            if not self._event.wait(timeout=0.5):
+                continue
+            self._event.clear()
+            with self._swap_lock:
+                if not self._has_pending:
+                    continue
+                self._pending, self._work = self._work, self._pending
+                due = self._pending_due
+                self._has_pending = False
+            try:
+                # Pirámide: de mayor a menor ancho, cada nivel reducido desde el anterior
+                level = self._work
+                for profile in sorted(due, key=lambda p: -(p.width or level.shape[1])):
+                    width = profile.width
+                    if width and width < level.shape[1]:
+                        height = max(1, round(level.shape[0] * width / level.shape[1]))
+                        level = cv2.resize(level, (width, height), interpolation=cv2.INTER_AREA)
+                    self._encode(profile, level)
+            except Exception as e:
+                logger.exception(f"Error codificando preview: {e}")
@@ -0,0 +1,103 @@
+from collections import namedtuple
+from threading import Lock
+
+# Datos del piloto que necesita el guardado de vueltas (sin objetos ORM)
+DriverInfo = namedtuple('DriverInfo', ['id', 'name', 'nickname', 'tag_id'])
+
+
+class RaceRegistry:
+    """Registro en memoria de pilotos por tag, de la sesión activa y de su
+    último número de vuelta por piloto.
+
+    Se carga una vez al arrancar (`load()`) y las rutas que modifican pilotos
+    o sesiones lo actualizan tras el commit (`put_driver()`, `remove_driver()`,
+    `set_active_session()`), de modo que el guardado de vueltas no necesita
+    leer la base de datos: el número de cada vuelta sale de `next_lap_number()`
+    en lugar de un COUNT. `on_drivers_changed(tag_ids)` se llama cada vez que
+    cambia el conjunto de tags, p. ej. para actualizar el filtro del detector.
+    """
+
+    def __init__(self, on_drivers_changed=None):
+        self.on_drivers_changed = on_drivers_changed
+        self._lock = Lock()
+        self._by_tag = {}
+        self._tag_by_driver = {}
+        self._active_session_id = None
+        # driver_id -> último lap_number en la sesión activa
+        self._lap_counts = {}
+
+    def load(self, drivers, active_session_id=None, lap_counts=None):
+        """Reemplazar el contenido con `drivers` (objetos con id, name, nickname, tag_id)
+        y, para la sesión activa, `lap_counts` ({driver_id: último lap_number})."""
+        with self._lock:
+            self._by_tag = {}
+            self._tag_by_driver = {}
+            for d in drivers:
+                if d.tag_id is None:
+                    continue
+                info = DriverInfo(d.id, d.name, d.nickname, int(d.tag_id))
+                self._by_tag[info.tag_id] = info
+                self._tag_by_driver[info.id] = info.tag_id
+            self._active_session_id = active_session_id
+            self._lap_counts = dict(lap_counts or {})
+        self._notify()
+
+    def driver_for_tag(self, tag_id):
+        return self._by_tag.get(tag_id)
+
+    def tag_ids(self):
+        with self._lock:
+            return sorted(self._by_tag)
+
+    def put_driver(self, driver):
+        """Insertar o actualizar un piloto (también si cambió de tag)."""
+        with self._lock:
+            old_tag = self._tag_by_driver.pop(driver.id, None)
+            if old_tag is not None:
+                self._by_tag.pop(old_tag, None)
+            if driver.tag_id is not None:
+                info = DriverInfo(driver.id, driver.name, driver.nickname, int(driver.tag_id))
+                self._by_tag[info.tag_id] = info
+                self._tag_by_driver[info.id] = info.tag_id
+        self._notify()
+
+    def remove_driver(self, driver_id):
+        with self._lock:
+            tag = self._tag_by_driver.pop(driver_id, None)
+            if tag is not None:
+                self._by_tag.pop(tag, None)
+        self._notify()
+
+    @property
+    def active_session_id(self):
+        return self._active_session_id
+
+    def set_active_session(self, session_id, lap_counts=None):
+        with self._lock:
+            self._active_session_id = session_id
+            self._lap_counts = dict(lap_counts or {})
+
+    def set_lap_counts(self, session_id, lap_counts):
+        """Reemplazar los contadores de `session_id` (p. ej. tras un rollback) si
+        sigue siendo la activa; si no, no hay nada que corregir."""
+        with self._lock:
+            if session_id is not None and session_id == self._active_session_id:
+                self._lap_counts = dict(lap_counts)
+
+    def next_lap_number(self, session_id, driver_id):
+        """Reservar el siguiente número de vuelta del piloto en `session_id`.
+
+        Devuelve None si `session_id` ya no es la sesión activa (se cerró
+        mientras se guardaba el lote): sus contadores ya no están en memoria y
+        el número debe salir de la base de datos.
+        """
+        with self._lock:
+            if session_id is None or session_id != self._active_session_id:
+                return None
+            n = self._lap_counts.get(driver_id, 0) + 1
+            self._lap_counts[driver_id] = n
+            return n
+
+    def _notify(self):
+        if self.on_drivers_changed is not None:
+            self.on_drivers_changed(self.tag_ids())
@@ -0,0 +1,223 @@
+import os
+import json
+import queue
+import time
+from threading import Lock, Thread
+import logging
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# bmp: un fichero sin comprimir por frame + `timestamps.csv` (replay como directorio)
+# mjpg: un AVI Motion-JPEG + `video.avi.timestamps.csv` (menos disco, con pérdida)
+RECORD_FORMATS = ('bmp', 'mjpg')
+
+
+class SessionRecorder:
+    """Grabación del stream de la cámara en segundo plano.
+
+    El hilo de captura llama a `submit(frame, timestamp)` con cada frame:
+    se copia en un buffer libre del pool y se encola para el hilo escritor.
+    El pool se reserva una sola vez, con el primer frame grabado, con tantos
+    buffers como quepan en `budget_bytes`, y se reutiliza en las grabaciones
+    siguientes mientras no cambie la resolución. Si no queda ningún buffer
+    libre (el disco no da abasto), el frame se descarta y se cuenta;
+    `submit()` nunca bloquea. Cada frame escrito añade `índice,timestamp` al
+    sidecar, con el timestamp de captura exacto, en el formato que lee
+    `read_timestamps()`.
+
+    `status()` informa de frames escritos/descartados, MB/s y FPS de
+    escritura sostenidos, para saber si el disco aguanta el ritmo de la cámara.
+    """
+
+    def __init__(self, directory, fmt='bmp', budget_bytes=256 * 1024 * 1024, fps=30.0, metrics=None):
+        if fmt not in RECORD_FORMATS:
+            raise ValueError(f"Formato de grabación desconocido: {fmt}")
+        self.directory = directory
+        self.fmt = fmt
+        self.budget_bytes = max(0, int(budget_bytes))
+        self.fps = float(fps) if fps and fps > 0 else 30.0
+        self.metrics = metrics
+        self._lock = Lock()
+        self._queue = None
+        self._free = None
+        self._pool = None
+        self._thread = None
+        self._active = False
+        self._reset_stats()
+        self.path = None
+        self.name = None
+        if metrics is not None:
+            metrics.describe('recording_frames', 'Frames escritos en la grabación')
+            metrics.describe('recording_dropped', 'Frames no grabados porque el disco no daba abasto')
+            metrics.gauge('recording_queue_depth',
+                          lambda: self._queue.qsize() if self._queue is not None else 0,
+                          'Frames pendientes de escribir en la grabación')
+
+    def _reset_stats(self):
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.bytes_written = 0
+        self.write_seconds = 0.0
+        self.started_at = None
+        self.stopped_at = None
+
+    @property
+    def active(self):
+        return self._active
+
+    def start(self, name=None):
+        """Empezar a grabar en `<directory>/<name>`; devuelve la ruta."""
+        with self._lock:
+            if self._active:
+                raise RuntimeError(f"Ya hay una grabación en curso: {self.path}")
+            name = name or time.strftime('rec_%Y%m%d_%H%M%S')
+            path = os.path.join(self.directory, name)
+            os.makedirs(path, exist_ok=True)
+            self.path = path
+            self.name = name
+            self._reset_stats()
+            self._queue = queue.Queue()
+            self.started_at = time.monotonic()
+            self._active = True
+            t = Thread(target=self._run, args=(self._queue, path), name='recorder')
+            t.daemon = True
+            t.start()
+            self._thread = t
+        logger.info(f"Grabación iniciada en {path} ({self.fmt})")
+        return path
+
+    def stop(self, timeout=10.0):
+        """Terminar la grabación tras escribir lo encolado; devuelve `status()`."""
+        with self._lock:
+            if not self._active:
+                return self.status()
+            self._active = False
+            self._queue.put(None)
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout=timeout)
+        self._thread = None
+        self.stopped_at = time.monotonic()
+        status = self.status()
+        try:
+            with open(os.path.join(self.path, 'recording.json'), 'w', encoding='utf-8') as f:
+                json.dump(status, f, indent=2)
+        except OSError as e:
+            logger.error(f"No se pudo guardar el resumen de la grabación: {e}")
+        logger.info(f"Grabación terminada: {self.frames_written} frames, {self.frames_dropped} descartados")
+        return status
+
+    def submit(self, frame, timestamp):
+        """Encolar una copia del frame para grabarla. Nunca bloquea."""
+        if not self._active:
+            return False
+        if self._pool is None or self._pool.shape[1:] != frame.shape or self._pool.dtype != frame.dtype:
+            # Primer frame (o cambio de resolución): reservar el pool con la resolución real
+            self._allocate(frame.shape, frame.dtype)
+        try:
+            slot = self._free.get_nowait()
+        except queue.Empty:
+            self.frames_dropped += 1
+            if self.metrics is not None:
+                self.metrics.inc('recording_dropped')
+            return False
+        np.copyto(self._pool[slot], frame)
+        self._queue.put((self._pool, slot, timestamp))
+        return True
+
+    def _allocate(self, shape, dtype):
+        frame_bytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        slots = max(1, self.budget_bytes // frame_bytes)
+        if slots < 8:
+            logger.warning(f"RECORD_QUEUE_MB solo admite {slots} frames de {shape[1]}x{shape[0]} en cola: "
+                           f"cualquier parón del disco descartará frames")
+        self._pool = np.empty((slots,) + tuple(shape), dtype=dtype)
+        self._free = queue.SimpleQueue()
+        for i in range(slots):
+            self._free.put(i)
+        logger.info(f"Grabación: cola de {slots} frames ({slots * frame_bytes / 1e6:.0f} MB)")
+
+    @property
+    def queue_frames(self):
+        """Frames que caben en el pool (0 hasta el primer frame grabado)."""
+        return len(self._pool) if self._pool is not None else 0
+
+    def status(self):
+        end = self.stopped_at if (self.stopped_at and not self._active) else time.monotonic()
+        elapsed = (end - self.started_at) if self.started_at else 0.0
+        mb = self.bytes_written / 1e6
+        return {
+            'active': self._active,
+            'name': self.name,
+            'path': self.path,
+            'format': self.fmt,
+            'frames_written': self.frames_written,
+            'frames_dropped': self.frames_dropped,
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'queue_frames': self.queue_frames,
+            'bytes_written': self.bytes_written,
+            'elapsed_s': round(elapsed, 3),
+            # Ritmo sostenido de la grabación y capacidad del disco (solo tiempo escribiendo)
+            'fps': round(self.frames_written / elapsed, 2) if elapsed > 0 else None,
+            'mb_per_s': round(mb / elapsed, 2) if elapsed > 0 else None,
+            'disk_mb_per_s': round(mb / self.write_seconds, 2) if self.write_seconds > 0 else None,
+            'max_fps': round(self.frames_written / self.write_seconds, 1) if self.write_seconds > 0 else None,
+        }
+
+    def _run(self, q, path):
+        sidecar_name = 'timestamps.csv' if self.fmt == 'bmp' else 'video.avi.timestamps.csv'
+        writer = None
+        video_path = os.path.join(path, 'video.avi')
+        index = 0
+        with open(os.path.join(path, sidecar_name), 'w', encoding='utf-8', newline='') as sidecar:
+            sidecar.write('frame,timestamp\n')
+            while True:
+                item = q.get()
+                if item is None:
+                    break
+                pool, slot, timestamp = item
+                frame = pool[slot]
+                t0 = time.perf_counter()
+                try:
+                    if self.fmt == 'bmp':
+                        name = os.path.join(path, f"{index:07d}.bmp")
+                        if not cv2.imwrite(name, frame):
+                            raise OSError(f"No se pudo escribir {name}")
+                        size = os.path.getsize(name)
+                    else:
+                        if writer is None:
+                            h, w = frame.shape[:2]
+                            writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'MJPG'),
+                                                     self.fps, (w, h), frame.ndim == 3)
+                        writer.write(frame)
+                        size = None
+                    sidecar.write(f"{index},{timestamp:.6f}\n")
+                except Exception as e:
+                    logger.exception(f"Error grabando frame {index}: {e}")
+                    continue
+                finally:
+                    if pool is self._pool:
+                        self._free.put(slot)
+                elapsed = time.perf_counter() - t0
+                if size is None:
+                    # El contenedor crece a trozos: contar lo que ha crecido el fichero
+                    try:
+                        size = max(0, os.path.getsize(video_path) - self.bytes_written)
+                    except OSError:
+                        size = 0
+                self.write_seconds += elapsed
+                self.bytes_written += size
+                self.frames_written += 1
+                index += 1
+                if self.metrics is not None:
+                    self.metrics.observe('record_write', elapsed)
+                    self.metrics.inc('recording_frames')
+        if writer is not None:
+            writer.release()
+            try:
+                self.bytes_written = os.path.getsize(video_path)
+            except OSError:
+                pass
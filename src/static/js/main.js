@@ -1,54 +1,231 @@
 const socket = io();
-let driversData = {}; // Cache local de tiempos
+// Clasificación calculada en el servidor: snapshot al conectar y deltas con las filas que cambian
+let leaderboardRows = {}; // driver_id -> fila
+let leaderboardSeq = -1;
+// driver_id -> mejoras de su última vuelta (`badges` de `lap_update`)
+let driverBadges = {};
+const BADGE_LABELS = {
+    session_best: ['Mejor sesión', 'bg-purple-600'],
+    personal_best: ['Mejor personal', 'bg-green-600'],
+    track_record: ['Récord', 'bg-yellow-500 text-gray-900']
+};
 
-// Escuchar actualizaciones de vuelta
-socket.on('lap_update', function(data) {
-    console.log("Vuelta recibida:", data);
-    
-    // Actualizar datos locales
-    if (!driversData[data.tag_id]) {
-        driversData[data.tag_id] = {
-            name: data.nickname,
-            laps: 0,
-            last: 0,
-            best: 9999.0
-        };
+// El servidor agrupa los eventos de cada tick en un único mensaje: [[evento, datos], ...]
+const raceEventHandlers = {
+    leaderboard_snapshot: applyLeaderboardSnapshot,
+    leaderboard_delta: applyLeaderboardDelta,
+    lap_update: applyLapUpdate,
+    overlay: drawOverlay,
+    session_status: function(status) {
+        // Pasar a la sala de la nueva sesión; el servidor responde con su clasificación
+        if (status.state === 'started') socket.emit('join_session', {session_id: status.session_id});
     }
-    
-    let d = driversData[data.tag_id];
-    d.laps = data.lap_number;
-    d.last = data.lap_time;
-    if (data.lap_time < d.best) d.best = data.lap_time;
-    
-    renderLeaderboard();
+};
+
+socket.on('race_events', function(events) {
+    events.forEach(([name, data]) => {
+        const handler = raceEventHandlers[name];
+        if (handler) handler(data);
+    });
 });
 
-function renderLeaderboard() {
+socket.on('connect', fetchLeaderboard); // también tras una reconexión
+
+// Overlay de detección dibujado en un canvas sobre el vídeo (PREVIEW_OVERLAY=client).
+// Se dibuja el último frame recibido; si dejan de llegar (modo 'server' o sin
+// detector) el canvas se limpia.
+let overlayClearTimer = null;
+
+function drawOverlay(meta) {
+    const canvas = document.getElementById('overlayCanvas');
+    const img = document.getElementById('videoFeed');
+    if (!canvas || !img) return;
+    const w = canvas.clientWidth, h = canvas.clientHeight;
+    if (canvas.width !== w || canvas.height !== h) {
+        canvas.width = w;
+        canvas.height = h;
+    }
+    const ctx = canvas.getContext('2d');
+    ctx.setTransform(1, 0, 0, 1, 0, 0);
+    ctx.clearRect(0, 0, w, h);
+    // Misma transformación que object-cover en la imagen
+    const [fw, fh] = meta.size;
+    const scale = Math.max(w / fw, h / fh);
+    ctx.setTransform(scale, 0, 0, scale, (w - fw * scale) / 2, (h - fh * scale) / 2);
+    ctx.lineWidth = 2 / scale;
+
+    const [[x1, y1], [x2, y2]] = meta.finish_line;
+    ctx.strokeStyle = '#00ff00';
+    ctx.beginPath();
+    ctx.moveTo(x1, y1);
+    ctx.lineTo(x2, y2);
+    ctx.stroke();
+    if (meta.roi) {
+        const [rx0, ry0, rx1, ry1] = meta.roi;
+        ctx.strokeStyle = '#808080';
+        ctx.lineWidth = 1 / scale;
+        ctx.strokeRect(rx0, ry0, rx1 - rx0, ry1 - ry0);
+        ctx.lineWidth = 2 / scale;
+    }
+
+    ctx.font = `${14 / scale}px sans-serif`;
+    meta.tags.forEach(tag => {
+        // Sin confirmar: solo el contorno discontinuo; confirmado: contorno y ID
+        ctx.strokeStyle = tag.confirmed ? '#00ff00' : '#facc15';
+        ctx.setLineDash(tag.confirmed ? [] : [4 / scale, 4 / scale]);
+        ctx.beginPath();
+        tag.corners.forEach(([x, y], i) => (i ? ctx.lineTo(x, y) : ctx.moveTo(x, y)));
+        ctx.closePath();
+        ctx.stroke();
+        ctx.setLineDash([]);
+        const [cx, cy] = tag.center;
+        if (tag.confirmed) {
+            ctx.fillStyle = '#00ff00';
+            ctx.fillText(`ID:${tag.id}`, cx + 6, cy - 10);
+        }
+        if (tag.crossed) {
+            ctx.fillStyle = '#00ffff';
+            ctx.beginPath();
+            ctx.arc(cx, cy, 15, 0, 2 * Math.PI);
+            ctx.fill();
+        }
+    });
+
+    if (meta.fps !== null) {
+        ctx.setTransform(1, 0, 0, 1, 0, 0);
+        ctx.font = '14px sans-serif';
+        ctx.fillStyle = '#ffffff';
+        ctx.fillText(`FPS:${meta.fps.toFixed(1)}`, 8, 20);
+    }
+
+    clearTimeout(overlayClearTimer);
+    overlayClearTimer = setTimeout(() => {
+        ctx.setTransform(1, 0, 0, 1, 0, 0);
+        ctx.clearRect(0, 0, canvas.width, canvas.height);
+    }, 1000);
+}
+
+function applyLeaderboardDelta(delta) {
+    if (delta.seq <= leaderboardSeq) return;
+    if (delta.seq !== leaderboardSeq + 1) {
+        // Se perdió algún delta: pedir la clasificación completa
+        fetchLeaderboard();
+        return;
+    }
+    leaderboardSeq = delta.seq;
+    // Pilotos quitados de la clasificación (p. ej. borrados)
     const tbody = document.getElementById('leaderboardBody');
-    if (!tbody) return;
-    tbody.innerHTML = '';
-    
-    // Convertir objeto a array y ordenar
-    let sortedDrivers = Object.values(driversData).sort((a, b) => {
-        // Lógica simple: más vueltas ganan, luego menor tiempo
-        return b.laps - a.laps; 
+    (delta.removed || []).forEach(driverId => {
+        delete leaderboardRows[driverId];
+        const tr = tbody && tbody.querySelector(`tr[data-driver-id="${driverId}"]`);
+        if (tr) tr.remove();
+    });
+    delta.rows.forEach(row => { leaderboardRows[row.driver_id] = row; });
+    renderLeaderboard(delta.rows);
+}
+
+async function fetchLeaderboard() {
+    try {
+        const res = await fetch('/api/leaderboard');
+        if (!res.ok) return;
+        applyLeaderboardSnapshot(await res.json());
+    } catch (err) {
+        console.error('Error cargando la clasificación:', err);
+    }
+}
+
+// Marca la fila del piloto con lo que mejoró su última vuelta (se mantiene hasta la siguiente)
+function applyLapUpdate(lap) {
+    if (lap.driver_id === undefined) return;
+    driverBadges[lap.driver_id] = lap.badges || [];
+    const tbody = document.getElementById('leaderboardBody');
+    const tr = tbody && tbody.querySelector(`tr[data-driver-id="${lap.driver_id}"]`);
+    const row = leaderboardRows[lap.driver_id];
+    if (tr && row) renderDriverName(tr.children[1], row);
+}
+
+function renderDriverName(cell, row) {
+    cell.textContent = row.nickname || row.name;
+    (driverBadges[row.driver_id] || []).forEach(kind => {
+        const [label, cls] = BADGE_LABELS[kind] || [kind, 'bg-gray-600'];
+        const badge = document.createElement('span');
+        badge.className = `ml-2 px-1.5 py-0.5 rounded text-xs font-semibold ${cls}`;
+        badge.textContent = label;
+        cell.appendChild(badge);
     });
+}
+
+function applyLeaderboardSnapshot(snapshot) {
+    if (snapshot.seq < leaderboardSeq) return;
+    leaderboardSeq = snapshot.seq;
+    leaderboardRows = {};
+    snapshot.rows.forEach(row => { leaderboardRows[row.driver_id] = row; });
+    const tbody = document.getElementById('leaderboardBody');
+    if (tbody) tbody.innerHTML = '';
+    renderLeaderboard(snapshot.rows);
+}
 
-    if (sortedDrivers.length === 0) {
-        tbody.innerHTML = `<tr><td colspan="6" class="text-center py-4 text-gray-500">No hay registros para mostrar</td></tr>`;
+function resetLeaderboard() {
+    leaderboardRows = {};
+    driverBadges = {};
+    const tbody = document.getElementById('leaderboardBody');
+    if (tbody) tbody.innerHTML = '';
+    renderLeaderboard([]);
+}
+
+function formatLap(value) {
+    return value === null || value === undefined ? '-' : value.toFixed(3);
+}
+
+function formatGap(row, leader) {
+    if (!leader || row.position === 1 || row.gap === null) return '-';
+    const lapsDown = leader.laps - row.laps;
+    return `+${row.gap.toFixed(3)}` + (lapsDown > 0 ? ` (+${lapsDown} v)` : '');
+}
+
+// Actualiza solo las filas recibidas y recoloca las que cambiaron de puesto
+function renderLeaderboard(changedRows) {
+    const tbody = document.getElementById('leaderboardBody');
+    if (!tbody) return;
+    const rows = Object.values(leaderboardRows).sort((a, b) => a.position - b.position);
+
+    const empty = tbody.querySelector('tr[data-empty]');
+    if (rows.length === 0) {
+        if (!empty) {
+            tbody.innerHTML = `<tr data-empty="1"><td colspan="6" class="text-center py-4 text-gray-500">No hay registros para mostrar</td></tr>`;
+        }
         return;
     }
+    if (empty) empty.remove();
+
+    let moved = false;
+    (changedRows || rows).forEach(row => {
+        let tr = tbody.querySelector(`tr[data-driver-id="${row.driver_id}"]`);
+        if (!tr) {
+            tr = document.createElement('tr');
+            tr.className = 'bg-gray-800 hover:bg-gray-700';
+            tr.dataset.driverId = row.driver_id;
+            ['px-4 py-2', 'px-4 py-2', 'px-4 py-2', 'px-4 py-2 lap-time-display', 'px-4 py-2 text-green-400', 'px-4 py-2 leaderboard-gap']
+                .forEach(cls => { const td = document.createElement('td'); td.className = cls; tr.appendChild(td); });
+            tbody.appendChild(tr);
+            moved = true;
+        }
+        if (tr.dataset.position !== String(row.position)) moved = true;
+        tr.dataset.position = row.position;
+        const cells = tr.children;
+        cells[0].textContent = row.position;
+        renderDriverName(cells[1], row);
+        cells[2].textContent = row.laps;
+        cells[3].textContent = formatLap(row.last);
+        cells[4].textContent = formatLap(row.best);
+    });
 
-    sortedDrivers.forEach((d, index) => {
-        let row = `<tr class="bg-gray-800 hover:bg-gray-700">
-            <td class="px-4 py-2">${index + 1}</td>
-            <td class="px-4 py-2">${d.name}</td>
-            <td class="px-4 py-2">${d.laps}</td>
-            <td class="px-4 py-2 lap-time-display">${d.last.toFixed(3)}</td>
-            <td class="px-4 py-2 text-green-400">${d.best.toFixed(3)}</td>
-            <td class="px-4 py-2">-</td>
-        </tr>`;
-        tbody.innerHTML += row;
+    // Los gaps dependen de las vueltas del líder: recalcular su texto (sin tocar el resto)
+    const leader = rows[0];
+    rows.forEach(row => {
+        const tr = tbody.querySelector(`tr[data-driver-id="${row.driver_id}"]`);
+        if (tr) tr.children[5].textContent = formatGap(row, leader);
+        if (moved && tr) tbody.appendChild(tr);
     });
 }
 
@@ -241,8 +418,7 @@ function stopSession() {
     
     // Resetear estado
     currentRaceState = RACE_STATE.IDLE;
-    driversData = {};
-    renderLeaderboard();
+    resetLeaderboard();
     updateRaceStatus('<p class="text-gray-300">Carrera detenida. Haz clic en "Iniciar carrera" para empezar de nuevo.</p>');
     
     // Aquí también se podría llamar a una API para detener la sesión en el backend
@@ -537,5 +713,5 @@ if (detectorToggleBtn) detectorToggleBtn.addEventListener('click', toggleDetecto
 // Consultar estado inicial del detector
 fetchDetectorStatus();
 
-// Renderizar la tabla de posiciones al cargar
-renderLeaderboard();
+// Renderizar la tabla de posiciones al cargar (se rellena al conectar el socket)
+renderLeaderboard([]);
@@ -0,0 +1,80 @@
+from sqlalchemy import event
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROFILES = ('default', 'sqlite-performance')
+
+
+def _is_sqlite(uri):
+    return str(uri or '').startswith('sqlite')
+
+
+def _is_memory(uri):
+    uri = str(uri or '')
+    return uri in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in uri
+
+
+def engine_options(config):
+    """Opciones de `create_engine` para el perfil `DB_PROFILE` de `config` (dict-like)."""
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    uri = config.get('SQLALCHEMY_DATABASE_URI')
+    if config.get('DB_PROFILE') != 'sqlite-performance' or not _is_sqlite(uri) or _is_memory(uri):
+        return options
+    busy_ms = int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    connect_args = dict(options.get('connect_args') or {})
+    # Las conexiones se comparten entre el hilo de vueltas y los de peticiones
+    connect_args.setdefault('check_same_thread', False)
+    connect_args.setdefault('timeout', busy_ms / 1000.0)
+    options['connect_args'] = connect_args
+    # Con WAL los lectores no bloquean al escritor: un pool pequeño de conexiones
+    # persistentes evita reabrir el fichero (y repetir los PRAGMA) en cada petición
+    options.setdefault('pool_size', int(config.get('SQLITE_POOL_SIZE', 8)))
+    options.setdefault('max_overflow', int(config.get('SQLITE_POOL_SIZE', 8)))
+    options.setdefault('pool_timeout', busy_ms / 1000.0)
+    return options
+
+
+def _sqlite_pragmas(config):
+    return (
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f"PRAGMA busy_timeout={int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}",
+        # Tamaño en KiB con signo negativo (convención de SQLite)
+        f"PRAGMA cache_size=-{int(config.get('SQLITE_CACHE_SIZE_KB', 65536))}",
+        f"PRAGMA mmap_size={int(config.get('SQLITE_MMAP_SIZE', 268435456))}",
+        'PRAGMA temp_store=MEMORY',
+    )
+
+
+def init_db(app, db):
+    """Inicializar `db` con el perfil de almacenamiento de `app.config['DB_PROFILE']`.
+
+    - `default`: opciones de SQLAlchemy tal cual.
+    - `sqlite-performance`: en cada conexión nueva se activan WAL,
+      `synchronous=NORMAL`, `busy_timeout`, `cache_size` y `mmap_size`, y el
+      pool se dimensiona para compartir conexiones entre hilos.
+    """
+    profile = app.config.get('DB_PROFILE', 'default')
+    if profile not in PROFILES:
+        logger.warning(f"DB_PROFILE desconocido '{profile}', se usa 'default'")
+        profile = app.config['DB_PROFILE'] = 'default'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    db.init_app(app)
+
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI')
+    if profile != 'sqlite-performance' or not _is_sqlite(uri):
+        return
+    pragmas = _sqlite_pragmas(app.config)
+
+    def _on_connect(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        try:
+            for pragma in pragmas:
+                cur.execute(pragma)
+        finally:
+            cur.close()
+
+    with app.app_context():
+        event.listen(db.engine, 'connect', _on_connect)
+    logger.info("Perfil de almacenamiento sqlite-performance activo (WAL, synchronous=NORMAL)")
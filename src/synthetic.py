@@ -0,0 +1,183 @@
+import math
+import numpy as np
+import cv2
+
+
+# Códigos de la familia tag16h5 (bit 15 = celda superior izquierda de la
+# rejilla 4x4 de datos, leída por filas). Son los mismos que dibujan los SVG
+# de `hardware/tags/`, pero cubren los 30 IDs de la familia.
+TAG16H5_CODES = [
+    0x231b, 0x2ea5, 0x346a, 0x45b9, 0x79a6, 0x7f6b, 0xb358, 0xe745, 0xfe59, 0x156d,
+    0x380b, 0xf0ab, 0x0d84, 0x4736, 0x8c72, 0xaf10, 0x093c, 0x93b4, 0xa503, 0x468f,
+    0xe137, 0x5795, 0xdf42, 0x1c1d, 0xe9dc, 0x73ad, 0xad5f, 0xd530, 0x07ca, 0xaf2e,
+]
+
+
+def render_tag(tag_id, size):
+    """Devolver el tag `tag_id` (incluido el borde blanco) como imagen uint8 size x size."""
+    code = TAG16H5_CODES[int(tag_id)]
+    cells = np.full((8, 8), 255, dtype=np.uint8)
+    cells[1:7, 1:7] = 0
+    for i in range(16):
+        r, c = divmod(i, 4)
+        if (code >> (15 - i)) & 1:
+            cells[2 + r, 2 + c] = 255
+    return cv2.resize(cells, (int(size), int(size)), interpolation=cv2.INTER_NEAREST)
+
+
+class SyntheticScene:
+    """Escena sintética: coches con tag dando vueltas a trazados elípticos.
+
+    Cada coche recorre una elipse cuyo punto extremo está sobre la línea de
+    meta, de modo que la cruza exactamente una vez por vuelta (el otro corte
+    con la recta queda fuera del segmento). Como la trayectoria es analítica,
+    los instantes de cruce se conocen de antemano.
+
+    Degradaciones opcionales para medir la robustez del detector:
+    - `rotate`: el tag gira con el rumbo del coche.
+    - `tag_scale`: (min, max) factor de escala aleatorio por coche.
+    - `exposure`: tiempo de exposición en segundos; produce motion blur a lo
+      largo de la velocidad (longitud = velocidad * exposición).
+    - `noise`: desviación típica del ruido gaussiano añadido a cada frame.
+    """
+
+    def __init__(self, shape=(480, 640), finish_line=((100, 240), (540, 240)),
+                 cars=3, tag_size=48, lap_time=3.0, lap_spread=0.5,
+                 ry=150.0, background=110, seed=0, rotate=False,
+                 tag_scale=(1.0, 1.0), exposure=0.0, noise=0.0):
+        self.shape = (int(shape[0]), int(shape[1]), 3)
+        self.finish_line = finish_line
+        self.tag_size = int(tag_size)
+        self.background = int(background)
+        self.rotate = bool(rotate)
+        self.exposure = max(0.0, float(exposure or 0.0))
+        self.noise = max(0.0, float(noise or 0.0))
+        rng = np.random.default_rng(seed)
+        if self.noise > 0:
+            cv2.setRNGSeed(int(seed))
+        self._noise_buf = None
+
+        p1 = np.array(finish_line[0], dtype=np.float64)
+        p2 = np.array(finish_line[1], dtype=np.float64)
+        mid = (p1 + p2) / 2.0
+        d = p2 - p1
+        half_len = float(np.hypot(d[0], d[1])) / 2.0
+        u = d / max(half_len * 2.0, 1e-6)
+        n = np.array([-u[1], u[0]])
+        # Separación entre carriles a lo largo de la meta (dentro del segmento)
+        spacing = min(self.tag_size * 1.2, half_len / max(cars, 1))
+        rx = 0.55 * half_len + spacing * cars / 2.0
+
+        self.cars = []
+        for k in range(int(cars)):
+            cross = mid + u * (k - (cars - 1) / 2.0) * spacing
+            self.cars.append({
+                'tag_id': k % len(TAG16H5_CODES),
+                'center': cross + u * rx,
+                'rx': rx,
+                'ry': float(ry),
+                'u': u,
+                'n': n,
+                'lap_time': float(lap_time) * (1.0 + lap_spread * (rng.random() - 0.5)),
+                'phase': float(rng.random() * 2.0 * math.pi),
+                'size': max(8, int(round(self.tag_size * rng.uniform(tag_scale[0], tag_scale[1])))),
+            })
+        self._bitmaps = {}
+
+    def car_state(self, car, t):
+        """Posición (x, y) y rumbo (radianes) del coche en el instante t."""
+        pos, vel = self.car_kinematics(car, t)
+        return pos, math.atan2(vel[1], vel[0])
+
+    def car_kinematics(self, car, t):
+        """Posición (x, y) y velocidad (px/s) del coche en el instante t."""
+        w = 2.0 * math.pi / car['lap_time']
+        theta = car['phase'] + w * t
+        pos = car['center'] + car['u'] * car['rx'] * math.cos(theta) + car['n'] * car['ry'] * math.sin(theta)
+        vel = (-car['u'] * car['rx'] * math.sin(theta) + car['n'] * car['ry'] * math.cos(theta)) * w
+        return pos, vel
+
+    def crossing_times(self, car, t_end):
+        """Instantes de cruce de la meta del coche en [0, t_end]."""
+        # El cruce ocurre cuando theta = pi (mod 2*pi)
+        period = car['lap_time']
+        first = ((math.pi - car['phase']) % (2.0 * math.pi)) / (2.0 * math.pi) * period
+        times = []
+        t = first
+        while t <= t_end:
+            times.append(t)
+            t += period
+        return times
+
+    def _bitmap(self, tag_id, size):
+        key = (tag_id, size)
+        bmp = self._bitmaps.get(key)
+        if bmp is None:
+            bmp = render_tag(tag_id, size)
+            self._bitmaps[key] = bmp
+        return bmp
+
+    def _paste(self, out, bmp, x0, y0, mask=None):
+        """Copiar `bmp` (gris) en `out` con la esquina en (x0, y0), recortando a los bordes."""
+        h, w = out.shape[:2]
+        bh, bw = bmp.shape[:2]
+        bx0, by0 = max(0, -x0), max(0, -y0)
+        fx0, fy0 = max(0, x0), max(0, y0)
+        fx1, fy1 = min(w, x0 + bw), min(h, y0 + bh)
+        if fx1 <= fx0 or fy1 <= fy0:
+            return None
+        src = bmp[by0:by0 + (fy1 - fy0), bx0:bx0 + (fx1 - fx0)]
+        dst = out[fy0:fy1, fx0:fx1]
+        if mask is None:
+            dst[:] = src[:, :, None]
+        else:
+            m = mask[by0:by0 + (fy1 - fy0), bx0:bx0 + (fx1 - fx0)] > 0
+            dst[m] = src[m][:, None]
+        return fx0, fy0, fx1, fy1
+
+    def _motion_blur(self, out, rect, vel):
+        """Emborronar `rect` de `out` con un kernel lineal en la dirección de `vel`."""
+        length = float(np.hypot(vel[0], vel[1])) * self.exposure
+        k = int(math.ceil(length))
+        if k < 2:
+            return
+        k |= 1
+        kernel = np.zeros((k, k), dtype=np.float32)
+        kernel[k // 2, :] = 1.0
+        angle = -math.degrees(math.atan2(vel[1], vel[0]))
+        rot = cv2.getRotationMatrix2D(((k - 1) / 2.0, (k - 1) / 2.0), angle, 1.0)
+        kernel = cv2.warpAffine(kernel, rot, (k, k))
+        kernel /= max(float(kernel.sum()), 1e-6)
+        h, w = out.shape[:2]
+        x0, y0, x1, y1 = rect
+        x0, y0 = max(0, x0 - k), max(0, y0 - k)
+        x1, y1 = min(w, x1 + k), min(h, y1 + k)
+        region = out[y0:y1, x0:x1]
+        cv2.filter2D(region, -1, kernel, dst=region, borderType=cv2.BORDER_REPLICATE)
+
+    def render(self, t, out):
+        """Dibujar en `out` (BGR) la escena en el instante t."""
+        out[:] = self.background
+        for car in self.cars:
+            (x, y), vel = self.car_kinematics(car, t)
+            s = car['size']
+            bmp = self._bitmap(car['tag_id'], s)
+            mask = None
+            if self.rotate:
+                # Girar el tag con el rumbo en un lienzo que quepa en cualquier ángulo
+                side = int(math.ceil(s * math.sqrt(2.0))) + 2
+                angle = -math.degrees(math.atan2(vel[1], vel[0]))
+                rot = cv2.getRotationMatrix2D((s / 2.0, s / 2.0), angle, 1.0)
+                rot[:, 2] += (side - s) / 2.0
+                mask = cv2.warpAffine(np.full((s, s), 255, np.uint8), rot, (side, side), flags=cv2.INTER_NEAREST)
+                bmp = cv2.warpAffine(bmp, rot, (side, side), flags=cv2.INTER_LINEAR)
+            bh = bmp.shape[0]
+            rect = self._paste(out, bmp, int(round(x - bh / 2.0)), int(round(y - bh / 2.0)), mask)
+            if rect is not None and self.exposure > 0:
+                self._motion_blur(out, rect, vel)
+        if self.noise > 0:
+            if self._noise_buf is None or self._noise_buf.shape != out.shape:
+                self._noise_buf = np.empty(out.shape, dtype=np.int16)
+            cv2.randn(self._noise_buf, 0, self.noise)
+            cv2.add(out, self._noise_buf, dst=out, dtype=cv2.CV_8U)
+        return out
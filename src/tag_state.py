@@ -0,0 +1,83 @@
+import numpy as np
+from collections import namedtuple
+
+# La familia tag16h5 tiene 30 IDs (0..29): todo el estado por tag cabe en
+# arrays de tamaño fijo indexados directamente por el ID.
+TAG_ID_SPACE = 30
+
+# Detecciones de un frame en forma de arrays: ids (n,), centers (n, 2),
+# margins (n,), hamming (n,) y areas (n,) del polígono de esquinas.
+DetectionBatch = namedtuple('DetectionBatch', ['ids', 'centers', 'margins', 'hamming', 'areas'])
+
+
+def polygon_areas(corners):
+    """Área (fórmula del lazo) de cada polígono de `corners` con forma (n, k, 2)."""
+    x = corners[..., 0]
+    y = corners[..., 1]
+    return np.abs(np.sum(x * np.roll(y, -1, axis=-1) - np.roll(x, -1, axis=-1) * y, axis=-1)) / 2.0
+
+
+def detection_batch(tags):
+    """Convertir la lista de detecciones de un frame a un `DetectionBatch`."""
+    n = len(tags)
+    ids = np.fromiter((t.tag_id for t in tags), dtype=np.intp, count=n)
+    margins = np.fromiter((t.decision_margin for t in tags), dtype=np.float64, count=n)
+    hamming = np.fromiter((t.hamming for t in tags), dtype=np.int32, count=n)
+    if n:
+        centers = np.array([t.center for t in tags], dtype=np.float64).reshape(n, 2)
+        areas = polygon_areas(np.array([t.corners for t in tags], dtype=np.float64).reshape(n, -1, 2))
+    else:
+        centers = np.empty((0, 2), dtype=np.float64)
+        areas = np.empty(0, dtype=np.float64)
+    return DetectionBatch(ids, centers, margins, hamming, areas)
+
+
+class TagState:
+    """Estado de seguimiento por tag en arrays preasignados indexados por ID.
+
+    - `detection_counts`: frames consecutivos en que el tag pasó los filtros.
+    - `confirmed_pos` / `confirmed_time`: última posición confirmada (NaN = ninguna).
+    - `seen_pos` / `seen_time`: última posición vista, confirmada o no.
+    - `lap_timers`: instante del último cruce registrado (0 = sin salida).
+    - `allowed`: máscara de tags permitidos.
+    """
+
+    def __init__(self, size=TAG_ID_SPACE):
+        self.size = int(size)
+        self.detection_counts = np.zeros(self.size, dtype=np.int32)
+        self.confirmed_pos = np.zeros((self.size, 2), dtype=np.float64)
+        self.confirmed_time = np.full(self.size, np.nan)
+        self.seen_pos = np.zeros((self.size, 2), dtype=np.float64)
+        self.seen_time = np.full(self.size, np.nan)
+        self.lap_timers = np.zeros(self.size, dtype=np.float64)
+        self.allowed = np.ones(self.size, dtype=bool)
+        # Máscara reutilizada para marcar los tags presentes en el frame
+        self._present = np.zeros(self.size, dtype=bool)
+
+    def in_range(self, ids):
+        """Máscara de los IDs que caben en el espacio de tags."""
+        return (ids >= 0) & (ids < self.size)
+
+    def set_allowed(self, tags):
+        """Permitir solo los IDs de `tags` (None = todos)."""
+        if tags is None:
+            self.allowed[:] = True
+            return
+        self.allowed[:] = False
+        ids = np.fromiter((int(t) for t in tags), dtype=np.intp)
+        self.allowed[ids[self.in_range(ids)]] = True
+
+    def reset_missing_counts(self, ids):
+        """Poner a 0 el contador de los tags que no aparecen en `ids`."""
+        self._present[:] = False
+        self._present[ids] = True
+        self.detection_counts[~self._present] = 0
+
+    def reset_laps(self):
+        self.lap_timers[:] = 0.0
+
+    def reset(self):
+        self.detection_counts[:] = 0
+        self.confirmed_time[:] = np.nan
+        self.seen_time[:] = np.nan
+        self.reset_laps()
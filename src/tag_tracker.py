@@ -0,0 +1,141 @@
+import numpy as np
+
+
+class TagTracker:
+    """Seguimiento por tag con modelo de velocidad constante.
+
+    Con las posiciones y timestamps de captura de cada detección (las mismas
+    que alimentan `last_seen`/`last_confirmed`), predice dónde estará cada tag
+    en el siguiente frame para que el detector solo analice ventanas pequeñas
+    alrededor de esas predicciones. Cada `full_scan_interval` frames, o cuando
+    un tag esperado no aparece en su ventana, se vuelve a analizar la región
+    completa para descubrir coches nuevos.
+    """
+
+    def __init__(self, enabled=False, full_scan_interval=10, window_margin=1.5,
+                 min_window=48, max_age=0.25, velocity_alpha=0.6):
+        self.enabled = bool(enabled)
+        self.full_scan_interval = max(1, int(full_scan_interval))
+        # Semiancho de la ventana = tamaño del tag * window_margin + desplazamiento esperado
+        self.window_margin = float(window_margin)
+        self.min_window = int(min_window)
+        # Segundos sin ver un tag antes de olvidar su track
+        self.max_age = float(max_age)
+        # Suavizado EMA de la velocidad (1.0 = solo la última medida)
+        self.velocity_alpha = float(velocity_alpha)
+        # tag_id -> [x, y, vx, vy, t, size]
+        self._tracks = {}
+        self._frames_since_full = 0
+        self._force_full = True
+        self.full_scans = 0
+        self.windowed_scans = 0
+
+    def reset(self):
+        self._tracks.clear()
+        self._force_full = True
+
+    def to_dict(self):
+        return {
+            'tracker_enabled': self.enabled,
+            'tracker_full_scan_interval': self.full_scan_interval,
+        }
+
+    def plan(self, timestamp, roi_rect):
+        """Planificar la detección del frame capturado en `timestamp`.
+
+        Devuelve (rects, expected): `rects` son las ventanas (x0, y0, x1, y1)
+        a analizar o None para un escaneo completo, y `expected` los tags que
+        deberían aparecer en ellas (se pasa después a `update()`).
+        """
+        if not self.enabled:
+            return None, frozenset()
+
+        if (self._force_full or not self._tracks
+                or self._frames_since_full + 1 >= self.full_scan_interval):
+            return self._full_scan()
+
+        rx0, ry0, rx1, ry1 = roi_rect
+        rects = []
+        expected = set()
+        for tag_id, (x, y, vx, vy, t, size) in list(self._tracks.items()):
+            age = timestamp - t
+            if age > self.max_age:
+                # Track perdido: buscar en toda la región
+                self._tracks.pop(tag_id, None)
+                return self._full_scan()
+            px = x + vx * age
+            py = y + vy * age
+            half = max(self.min_window / 2.0, size * self.window_margin) + 0.5 * np.hypot(vx, vy) * max(age, 0.0)
+            x0 = max(rx0, int(px - half))
+            y0 = max(ry0, int(py - half))
+            x1 = min(rx1, int(px + half) + 1)
+            y1 = min(ry1, int(py + half) + 1)
+            if x1 - x0 < 8 or y1 - y0 < 8:
+                # La predicción sale de la región: el coche se ha ido
+                self._tracks.pop(tag_id, None)
+                continue
+            rects.append([x0, y0, x1, y1])
+            expected.add(tag_id)
+
+        if not rects:
+            return self._full_scan()
+        self._frames_since_full += 1
+        self.windowed_scans += 1
+        return self._merge(rects), frozenset(expected)
+
+    def _full_scan(self):
+        self._force_full = False
+        self._frames_since_full = 0
+        self.full_scans += 1
+        return None, frozenset()
+
+    @staticmethod
+    def _merge(rects):
+        """Fusionar ventanas solapadas para no analizar dos veces la misma zona."""
+        merged = True
+        while merged and len(rects) > 1:
+            merged = False
+            out = []
+            while rects:
+                a = rects.pop()
+                i = 0
+                while i < len(rects):
+                    b = rects[i]
+                    if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                        a = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                        rects.pop(i)
+                        merged = True
+                    else:
+                        i += 1
+                out.append(a)
+            rects = out
+        return [tuple(r) for r in rects]
+
+    def update(self, timestamp, tags, expected=frozenset()):
+        """Actualizar los tracks con las detecciones del frame.
+
+        Si algún tag de `expected` (devuelto por `plan()`) no apareció en su
+        ventana, el siguiente frame será un escaneo completo.
+        """
+        if not self.enabled:
+            return
+        seen = set()
+        for tag in tags:
+            tag_id = int(tag.tag_id)
+            seen.add(tag_id)
+            cx, cy = float(tag.center[0]), float(tag.center[1])
+            corners = np.asarray(tag.corners, dtype=np.float64)
+            size = float(max(np.ptp(corners[:, 0]), np.ptp(corners[:, 1])))
+            tr = self._tracks.get(tag_id)
+            if tr is None:
+                self._tracks[tag_id] = [cx, cy, 0.0, 0.0, timestamp, size]
+                continue
+            dt = timestamp - tr[4]
+            if dt > 0:
+                a = self.velocity_alpha
+                tr[2] = a * (cx - tr[0]) / dt + (1.0 - a) * tr[2]
+                tr[3] = a * (cy - tr[1]) / dt + (1.0 - a) * tr[3]
+            tr[0], tr[1], tr[4], tr[5] = cx, cy, timestamp, size
+
+        if expected - seen:
+            self._force_full = True
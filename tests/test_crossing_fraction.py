@@ -0,0 +1,34 @@
+import pytest
+
+from src.detector import RaceSystem
+
+LINE = ((100, 240), (540, 240))
+
+
+@pytest.fixture(scope='module')
+def rs():
+    return RaceSystem(finish_line=LINE)
+
+
+def test_fraction_is_where_the_path_meets_the_line(rs):
+    assert rs._crossing_fraction((300, 200), (300, 300), *LINE) == pytest.approx(0.4)
+    # Sentido contrario: misma geometría, fracción complementaria
+    assert rs._crossing_fraction((300, 300), (300, 200), *LINE) == pytest.approx(0.6)
+    # Recorrido en diagonal
+    assert rs._crossing_fraction((200, 230), (240, 250), *LINE) == pytest.approx(0.5)
+
+
+def test_no_crossing_returns_none(rs):
+    assert rs._crossing_fraction((300, 200), (300, 230), *LINE) is None
+    # Pasa por fuera de los extremos de la meta
+    assert rs._crossing_fraction((600, 200), (600, 300), *LINE) is None
+
+
+def test_touching_endpoints_and_collinear_paths(rs):
+    # Termina justo sobre la meta
+    assert rs._crossing_fraction((300, 200), (300, 240), *LINE) == pytest.approx(1.0)
+    # Se desplaza a lo largo de la meta: primer punto de contacto
+    assert rs._crossing_fraction((50, 240), (150, 240), *LINE) == pytest.approx(0.5)
+    assert rs._crossing_fraction((200, 240), (300, 240), *LINE) == pytest.approx(0.0)
+    # Sin movimiento sobre la meta
+    assert rs._crossing_fraction((300, 240), (300, 240), *LINE) == pytest.approx(0.0)
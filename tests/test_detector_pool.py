@@ -0,0 +1,53 @@
+import time
+
+from src.detector_pool import DetectorPool
+
+PARAMS = {'families': 'tag16h5'}
+
+
+def _collect(pool, n, timeout=30.0):
+    out = []
+    deadline = time.monotonic() + timeout
+    while len(out) < n and time.monotonic() < deadline:
+        pool.wait(timeout=0.05)
+        out.extend(pool.collect())
+    return out
+
+
+def _submit_blank(pool, meta):
+    slot = pool.acquire()
+    pool.gray_view(slot, (32, 32))[:] = 0
+    pool.submit(slot, meta=(slot, meta))
+    return slot
+
+
+def test_dead_worker_is_restarted_and_its_job_requeued():
+    pool = DetectorPool(1, (32, 32), PARAMS)
+    try:
+        pool._procs[0].kill()
+        pool._procs[0].join()
+        _submit_blank(pool, 'a')
+        results = _collect(pool, 1)
+        assert [r.meta[1] for r in results] == ['a']
+        assert pool.restarts == 1
+        assert pool._procs[0].is_alive()
+    finally:
+        pool.close()
+
+
+def test_timed_out_slot_is_not_reused_until_the_late_result():
+    pool = DetectorPool(1, (32, 32), PARAMS, slots=1, result_timeout=0.0)
+    try:
+        slot = _submit_blank(pool, 'a')
+        # Entregado vacío por timeout antes de que el worker termine de arrancar
+        (result,) = pool.collect()
+        assert result.tags == []
+        pool.release(slot)
+        assert pool.acquire() is None
+
+        deadline = time.monotonic() + 30.0
+        while pool._abandoned and time.monotonic() < deadline:
+            pool.wait(timeout=0.05)
+        assert pool.acquire() == slot
+    finally:
+        pool.close()
@@ -0,0 +1,57 @@
+from threading import Thread
+
+import numpy as np
+
+from src.frame_ring import FrameRing
+
+
+def _write(ring, value, timestamp):
+    slot, frame = ring.begin_write()
+    frame[:] = value
+    ring.commit(slot, timestamp)
+
+
+def test_slow_consumer_skips_overwritten_frames_and_counts_them():
+    ring = FrameRing(3, (2, 2))
+    out = np.empty((2, 2), dtype=np.uint8)
+    for i in range(5):
+        _write(ring, i, 100.0 + i)
+
+    # Los frames 0 y 1 ya se sobrescribieron: se entrega el más antiguo que queda
+    assert ring.read(-1, out, timeout=0) == (2, 102.0)
+    assert out[0, 0] == 2
+    assert ring.read(2, out, timeout=0) == (3, 103.0)
+
+    _write(ring, 5, 105.0)
+    _write(ring, 6, 106.0)
+    _write(ring, 7, 107.0)
+    assert ring.read(3, out, timeout=0) == (5, 105.0)
+    assert ring.dropped == 1
+
+
+def test_lossless_producer_waits_for_the_consumer():
+    ring = FrameRing(2, (1, 1), lossless=True)
+    out = np.empty((1, 1), dtype=np.uint8)
+    producer = Thread(target=lambda: [_write(ring, i, float(i)) for i in range(6)])
+    producer.start()
+
+    seqs = []
+    last = -1
+    while len(seqs) < 6:
+        got = ring.read(last, out, timeout=5.0)
+        assert got is not None
+        last = got[0]
+        seqs.append((last, int(out[0, 0])))
+    producer.join(timeout=5.0)
+
+    assert seqs == [(i, i) for i in range(6)]
+    assert ring.dropped == 0
+
+
+def test_close_wakes_a_waiting_reader_and_keeps_published_frames():
+    ring = FrameRing(2, (1, 1))
+    out = np.empty((1, 1), dtype=np.uint8)
+    _write(ring, 9, 1.0)
+    ring.close()
+    assert ring.read(-1, out, timeout=1.0) == (0, 1.0)
+    assert ring.read(0, out, timeout=1.0) is None
@@ -0,0 +1,83 @@
+import os
+
+from src.lap_journal import LapJournal, _HEADER
+from src.lap_writer import LapWriter
+
+HEADER_SIZE = _HEADER.size
+
+
+def test_failed_batch_stays_pending_after_later_success(tmp_path):
+    path = str(tmp_path / 'laps.journal')
+    journal = LapJournal(path, fsync='batch')
+    calls = []
+
+    def handler(batch):
+        calls.append([e.seq for e in batch])
+        if len(calls) == 1:
+            raise RuntimeError('BD no disponible')
+        return len(batch)
+
+    writer = LapWriter(handler, max_batch=1, flush_interval=0.0, journal=journal, retries=0)
+    writer.submit(1, 10.0, session_id=7)
+    writer.flush()
+    writer.submit(2, 11.0, session_id=7)
+    writer.flush()
+    assert calls == [[1], [2]]
+    journal.close()
+
+    reopened = LapJournal(path, fsync='batch')
+    assert reopened.acked == 0
+    assert [(e.seq, e.tag_id) for e in reopened.pending()] == [(1, 1), (2, 2)]
+    # Al confirmar la vuelta que falló la marca avanza hasta la última guardada
+    reopened.ack([1, 2])
+    assert reopened.acked == 2
+    assert reopened.pending() == []
+    reopened.close()
+
+
+def test_compaction_keeps_only_unconfirmed_laps(tmp_path):
+    path = str(tmp_path / 'laps.journal')
+    journal = LapJournal(path, fsync='none', compact_bytes=1024)
+    seqs = [journal.append(tag_id % 30, 10.0 + tag_id, session_id=3) for tag_id in range(100)]
+    # La vuelta 5 falla; el resto se confirma
+    journal.ack([s for s in seqs if s != 5])
+    assert journal.acked == 4
+    size = os.path.getsize(path)
+    assert size < 1024
+
+    later = journal.append(1, 9.5, session_id=3)
+    journal.close()
+    assert os.path.getsize(path) > size
+
+    reopened = LapJournal(path, fsync='none', compact_bytes=1024)
+    assert [e.seq for e in reopened.pending()] == [5, later]
+    assert reopened.last_seq == later
+    assert reopened.append(2, 9.0) == later + 1
+    reopened.close()
+
+
+def test_truncated_or_corrupt_tail_is_discarded_on_open(tmp_path):
+    path = str(tmp_path / 'laps.journal')
+    journal = LapJournal(path, fsync='always')
+    for tag_id in (1, 2, 3):
+        journal.append(tag_id, 10.0, session_id=1)
+    journal.close()
+    full = os.path.getsize(path)
+    record = (full - HEADER_SIZE) // 3
+
+    # Caída a mitad del último append
+    with open(path, 'r+b') as f:
+        f.truncate(full - 5)
+    reopened = LapJournal(path, fsync='always')
+    assert [e.tag_id for e in reopened.pending()] == [1, 2]
+    assert os.path.getsize(path) == HEADER_SIZE + 2 * record
+    assert reopened.append(4, 11.0) == 3
+    reopened.close()
+
+    # Un registro con CRC incorrecto corta la lectura en ese punto
+    with open(path, 'r+b') as f:
+        f.seek(HEADER_SIZE + record + 2)
+        f.write(b'\xff')
+    reopened = LapJournal(path, fsync='always')
+    assert [e.tag_id for e in reopened.pending()] == [1]
+    reopened.close()
@@ -0,0 +1,58 @@
+from src.lap_writer import LapWriter
+from src.metrics import MetricsRegistry
+
+
+def _counter(metrics, name):
+    return sum(metrics._counter_snapshot().get(name, {}).values())
+
+
+def test_transient_failure_is_retried_before_later_laps():
+    metrics = MetricsRegistry()
+    calls = []
+
+    def handler(batch):
+        calls.append([e.tag_id for e in batch])
+        if len(calls) <= 2:
+            raise RuntimeError('database is locked')
+        return len(batch)
+
+    writer = LapWriter(handler, max_batch=1, flush_interval=0.0, metrics=metrics,
+                       retries=3, retry_backoff=0.0)
+    writer.submit(1, 10.0)
+    writer.submit(2, 11.0)
+    writer.flush()
+
+    assert calls == [[1], [1], [1], [2]]
+    assert _counter(metrics, 'laps_persisted') == 2
+    assert _counter(metrics, 'lap_persist_retries') == 2
+    assert _counter(metrics, 'lap_persist_errors') == 0
+
+
+def test_batch_is_dropped_only_after_exhausting_retries():
+    metrics = MetricsRegistry()
+    calls = []
+
+    def handler(batch):
+        calls.append(len(batch))
+        raise RuntimeError('database is locked')
+
+    writer = LapWriter(handler, max_batch=1, flush_interval=0.0, metrics=metrics,
+                       retries=2, retry_backoff=0.0)
+    writer.submit(1, 10.0)
+    writer.flush()
+
+    assert len(calls) == 3
+    assert _counter(metrics, 'lap_persist_errors') == 1
+    assert _counter(metrics, 'laps_persisted') == 0
+
+
+def test_monotonic_crossing_reaches_the_handler_unchanged(tmp_path):
+    from src.lap_journal import LapJournal
+
+    journal = LapJournal(str(tmp_path / 'laps.journal'), fsync='none')
+    batches = []
+    writer = LapWriter(batches.append, flush_interval=0.0, journal=journal)
+    writer.submit(1, 10.0, session_id=2, crossing=12345.678901)
+    writer.flush()
+    assert [e.crossing for e in batches[0]] == [12345.678901]
+    journal.close()
@@ -0,0 +1,73 @@
+from collections import namedtuple
+
+from src.leaderboard import Leaderboard
+
+Driver = namedtuple('Driver', ['id', 'name', 'nickname', 'tag_id'])
+A, B, C = (Driver(i, f'p{i}', f'n{i}', i) for i in (1, 2, 3))
+
+
+def _positions(board):
+    return [(r['driver_id'], r['position']) for r in board.snapshot()['rows']]
+
+
+def _changed(delta):
+    return sorted(r['driver_id'] for r in delta['rows'])
+
+
+def test_more_laps_ranks_ahead_and_ties_break_on_total_time():
+    board = Leaderboard()
+    board.reset(1)
+    board.record_laps([(A, 10.0), (B, 9.0), (C, 11.0)])
+    assert _positions(board) == [(2, 1), (1, 2), (3, 3)]
+
+    # C completa la segunda vuelta: pasa a liderar con más vueltas aunque sea más lento
+    board.record_laps([(C, 12.0)])
+    assert _positions(board) == [(3, 1), (2, 2), (1, 3)]
+
+
+def test_delta_contains_only_rows_between_old_and_new_position():
+    board = Leaderboard()
+    board.reset(1)
+    board.record_laps([(A, 10.0), (B, 11.0), (C, 12.0)])
+    board.record_laps([(A, 10.0), (B, 11.0)])
+    assert _positions(board) == [(1, 1), (2, 2), (3, 3)]
+
+    # C adelanta a B pero no a A: el líder no cambia y A no se reenvía
+    delta = board.record_laps([(C, 9.0)])
+    assert _positions(board) == [(1, 1), (3, 2), (2, 3)]
+    assert _changed(delta) == [2, 3]
+
+    # Nuevo líder: cambia la referencia del gap de todos
+    delta = board.record_laps([(B, 11.0)])
+    assert _positions(board)[0] == (2, 1)
+    assert _changed(delta) == [1, 2, 3]
+
+
+def test_gap_is_measured_against_the_leader_at_the_same_lap():
+    board = Leaderboard()
+    board.reset(1)
+    board.record_laps([(A, 10.0), (B, 12.0)])
+    board.record_laps([(A, 10.0)])
+    rows = {r['driver_id']: r for r in board.snapshot()['rows']}
+    assert rows[1]['gap'] is None
+    # B lleva una vuelta menos: se compara con el paso del líder por la vuelta 1
+    assert rows[2]['laps'] == 1
+    assert rows[2]['gap'] == 2.0
+
+
+def test_remove_driver_moves_the_rest_up_and_reports_the_removed_id():
+    board = Leaderboard()
+    board.reset(1)
+    board.record_laps([(A, 10.0), (B, 11.0), (C, 12.0)])
+    seq = board.snapshot()['seq']
+
+    delta = board.remove_driver(2)
+    assert delta['removed'] == [2]
+    assert delta['seq'] == seq + 1
+    assert [(r['driver_id'], r['position']) for r in delta['rows']] == [(3, 2)]
+    assert _positions(board) == [(1, 1), (3, 2)]
+
+    # Quitar al líder recalcula el gap de todos
+    delta = board.remove_driver(1)
+    assert [(r['driver_id'], r['position'], r['gap']) for r in delta['rows']] == [(3, 1, None)]
+    assert board.remove_driver(1) is None
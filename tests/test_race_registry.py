@@ -0,0 +1,16 @@
+from src.race_registry import RaceRegistry
+
+
+def test_lap_numbers_do_not_restart_for_a_session_closed_mid_batch():
+    registry = RaceRegistry()
+    registry.load([], active_session_id=1, lap_counts={10: 4})
+    assert registry.next_lap_number(1, 10) == 5
+
+    # Se abre otra sesión mientras el lote de la sesión 1 aún se guarda
+    registry.set_active_session(2)
+    assert registry.next_lap_number(1, 10) is None
+    assert registry.next_lap_number(2, 10) == 1
+
+    # Un rollback tardío de la sesión 1 no pisa los contadores de la 2
+    registry.set_lap_counts(1, {10: 4})
+    assert registry.next_lap_number(2, 10) == 2
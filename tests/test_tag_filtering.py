@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src.detector import RaceSystem
+
+LINE = ((100, 240), (540, 240))
+ROI = (0, 0, 640, 480)
+
+
+def _tag(tag_id, x, y, margin=50.0, hamming=0, size=20):
+    h = size / 2
+    return SimpleNamespace(tag_id=tag_id, decision_margin=margin, hamming=hamming, center=(x, y),
+                           corners=[(x - h, y - h), (x + h, y - h), (x + h, y + h), (x - h, y + h)])
+
+
+@pytest.fixture
+def rs():
+    rs = RaceSystem(finish_line=LINE)
+    rs.photo_finish = None
+    rs.min_detection_frames = 2
+    rs.min_lap_time = 0.5
+    return rs
+
+
+def _frame(rs, tags, t):
+    rs._process_detections(np.zeros((480, 640, 3), np.uint8), tags, t, ROI)
+
+
+def _filtered(rs):
+    series = rs.metrics._counter_snapshot().get('detections_filtered', {})
+    return {dict(k)['reason']: v for k, v in series.items() if v}
+
+
+def test_each_rejected_detection_is_counted_once_by_its_first_failing_filter(rs):
+    rs.set_allowed_tags([1, 2, 3, 4])
+    _frame(rs, [
+        _tag(1, 300, 100),
+        _tag(40, 300, 100),                          # fuera de tag16h5
+        _tag(2, 300, 100, margin=0.5, hamming=5),    # margen y hamming: cuenta el margen
+        _tag(3, 300, 100, hamming=2),
+        _tag(4, 300, 100, size=5),                   # área 25 < min_tag_area
+        _tag(5, 300, 100),                           # no permitido
+    ], 1.0)
+    assert _filtered(rs) == {'family': 1, 'decision_margin': 1, 'hamming': 1, 'area': 1, 'allowed': 1}
+    state = rs.tag_state
+    assert state.detection_counts[1] == 1
+    assert state.detection_counts[[2, 3, 4, 5]].tolist() == [0, 0, 0, 0]
+    # El tag no permitido solo actualiza su última vista
+    assert state.seen_time[5] == 1.0
+    assert np.isnan(state.confirmed_time[5])
+
+
+def test_low_quality_or_missing_detection_restarts_confirmation(rs):
+    _frame(rs, [_tag(1, 300, 100), _tag(2, 300, 100)], 1.0)
+    _frame(rs, [_tag(1, 300, 100, margin=0.1)], 1.1)
+    state = rs.tag_state
+    assert state.detection_counts[1] == 0
+    assert state.detection_counts[2] == 0
+
+
+def test_confirmed_tag_crossing_reports_the_interpolated_lap(rs):
+    laps = []
+    rs.on_lap_callback = lambda tag_id, duration: laps.append((tag_id, duration))
+    rs.enabled = True
+
+    def lap(t0):
+        # Dos frames para confirmar por encima de la meta y cruce a mitad de camino
+        _frame(rs, [_tag(7, 300, 200)], t0)
+        _frame(rs, [_tag(7, 300, 220)], t0 + 0.1)
+        _frame(rs, [_tag(7, 300, 260)], t0 + 0.2)
+        _frame(rs, [], t0 + 0.3)
+
+    lap(10.0)   # salida
+    lap(13.0)
+    assert laps == [(7, pytest.approx(3.0))]
+    assert rs.tag_state.lap_timers[7] == pytest.approx(13.15)
@@ -0,0 +1,10 @@
+"""Punto de entrada WSGI (gunicorn).
+
+    gunicorn --worker-class eventlet -w 1 -b 0.0.0.0:5000 wsgi:app
+
+Un solo worker: el detector, el diario de vueltas y el estado en memoria
+(clasificación, salas de Socket.IO) son de un único proceso.
+"""
+from src.app import app, socketio, startup
+
+startup()